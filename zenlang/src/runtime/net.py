@@ -1,90 +1,1152 @@
 """ZenLang net package - Networking operations"""
 import urllib.request
 import urllib.parse
+import urllib.error
+import http.client
+import asyncio
+import codecs
+import concurrent.futures
+import functools
+import io
+import os
+import gzip
+import errno
+import random
+import re
+import selectors
+import socket
+import ssl
+import threading
+import time
 import json
+import weakref
+import hashlib
+import email.utils
+from collections import OrderedDict
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+_MAX_REDIRECTS = 5
+_CONCURRENCY = 10
+_CHUNK_SIZE = 64 * 1024
+_ASYNC_WORKERS = 32
+_BATCH_WINDOW = 16
+_COMPRESS_MIN = 256
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Characters that change nesting while skipping a value, and the rest of a string
+_STRUCTURE = re.compile(r'[\[\]{}"]')
+_STRING_END = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+_REDIRECTS = (301, 302, 303, 307, 308)
+
+# Connections dropped by the server while idle in the pool
+_STALE = (http.client.RemoteDisconnected, ConnectionResetError,
+          BrokenPipeError, ConnectionAbortedError)
+
+# Methods that are safe to send again after a failure
+_IDEMPOTENT = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_user_agent = 'ZenLang/1.0'
+_settings = {'keepAlive': True, 'maxConnections': 10, 'idleTimeout': 30.0}
+_pools = {}
+_pools_lock = threading.Lock()
+_ssl_context = None
+_cache = None
+_resilience = {
+    'connectTimeout': 10.0,
+    'readTimeout': 60.0,
+    'retries': 0,
+    'backoff': 0.1,
+    'maxBackoff': 10.0,
+    'jitter': True,
+    'retryBudget': 0.2,
+    'retryBurst': 10,
+    'failureThreshold': 0,
+    'resetTimeout': 30.0,
+}
+_hosts = {}
+_hosts_lock = threading.Lock()
+_metrics = {'retries': 0, 'retriesDenied': 0, 'timeouts': 0, 'circuitsOpened': 0, 'rejected': 0}
+_metrics_lock = threading.Lock()
+_loop = None
+_loop_lock = threading.Lock()
+# The loop's worker pool; configureAsync swaps it for a new one
+_executor = None
+_async = {'workers': _ASYNC_WORKERS}
+_async_local = threading.local()
+_dns = {'ttl': 60.0, 'happyEyeballs': True, 'attemptDelay': 0.25}
+_dns_cache = {}
+_dns_lock = threading.Lock()
+_dns_stats = {'hits': 0, 'misses': 0, 'races': 0}
+_limits = {}
+_default_limits = {}
+_limits_lock = threading.Lock()
+
+# Response headers the cache keeps to judge freshness and revalidate
+_CACHE_HEADERS = ('Cache-Control', 'Expires', 'Date', 'Age', 'ETag', 'Last-Modified')
+# Request headers that make a response private to whoever sent them
+_PRIVATE_HEADERS = ('authorization', 'cookie')
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections to one scheme://host:port"""
+
+    def __init__(self, scheme, host, port, max_connections, idle_timeout):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.idle = []
+        self.active = 0
+        self.condition = threading.Condition()
+        self.created = 0
+        self.reused = 0
+        self.closed = 0
+        self.waits = 0
+        self.requests = 0
+
+    def connect(self, timeout=None):
+        """Open a new connection to the pool's host"""
+        connect_timeout, read_timeout = _timeouts(timeout)
+        if self.scheme == 'https':
+            conn = http.client.HTTPSConnection(self.host, self.port, timeout=connect_timeout,
+                                               context=_context())
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=connect_timeout)
+        conn._create_connection = _create_connection
+        conn.connect()
+        conn.sock.settimeout(read_timeout)
+        return conn
+
+    def acquire(self, timeout=None):
+        """Take an idle connection or open one, waiting while the pool is full.
+
+        The wait is bounded by the connect timeout, so responses that are
+        never read or closed cannot block later requests forever.
+        """
+        wait = _timeouts(timeout)[0]
+        deadline = None if wait is None else time.monotonic() + wait
+        with self.condition:
+            while True:
+                self.prune()
+                if self.idle:
+                    conn = self.idle.pop()[0]
+                    self.active += 1
+                    self.reused += 1
+                    if conn.sock is not None:
+                        conn.sock.settimeout(_timeouts(timeout)[1])
+                    return conn, True
+                if self.active < self.max_connections:
+                    self.active += 1
+                    self.created += 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(
+                        f"No free connection to {self.host}:{self.port} after {wait}s: all "
+                        f"{self.max_connections} are in use (close unread responses or raise maxConnections)")
+                self.waits += 1
+                self.condition.wait(remaining)
+        try:
+            return self.connect(timeout), False
+        except BaseException:
+            with self.condition:
+                self.active -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, conn, reusable):
+        """Return a connection after its response has been read"""
+        with self.condition:
+            self.active -= 1
+            if reusable and self.idle_timeout > 0 and len(self.idle) < self.max_connections:
+                self.idle.append((conn, time.monotonic()))
+            else:
+                conn.close()
+                self.closed += 1
+            self.condition.notify()
+
+    def prune(self):
+        """Close idle connections older than the idle timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        while self.idle and self.idle[0][1] < cutoff:
+            self.idle.pop(0)[0].close()
+            self.closed += 1
+
+    def request(self, method, target, body, headers, timeout=None):
+        """Send one request and return a pooled response"""
+        conn, reused = self.acquire(timeout)
+        # Set while an async request runs, so the event loop can abort it
+        call = getattr(_async_local, 'call', None)
+        try:
+            if call is not None:
+                call.attach(conn)
+            conn.request(method, target, body=body, headers=headers)
+            response = conn.getresponse()
+        except _STALE:
+            self.release(conn, False)
+            if not reused or (call is not None and call.aborted):
+                raise
+            # The server closed idle connections; retry once on a fresh one
+            self.close()
+            return self.request(method, target, body, headers, timeout)
+        except BaseException:
+            self.release(conn, False)
+            raise
+        with self.condition:
+            self.requests += 1
+        return PooledResponse(self, conn, response)
+
+    def close(self):
+        """Close every idle connection"""
+        with self.condition:
+            while self.idle:
+                self.idle.pop()[0].close()
+                self.closed += 1
+
+    def stats(self):
+        """Connection counters for this pool"""
+        with self.condition:
+            self.prune()
+            return {
+                'host': f"{self.scheme}://{self.host}:{self.port}",
+                'requests': self.requests,
+                'created': self.created,
+                'reused': self.reused,
+                'closed': self.closed,
+                'waits': self.waits,
+                'active': self.active,
+                'idle': len(self.idle),
+                'maxConnections': self.max_connections,
+            }
+
+
+class PooledResponse:
+    """HTTP response that hands its connection back once fully read.
+
+    A response dropped without being read or closed gives up its
+    connection (closed, not reused) when it is garbage collected.
+    """
+
+    def __init__(self, pool, conn, response, url=None):
+        self.pool = pool
+        self.conn = conn
+        self.response = response
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.url = url
+        self.finalizer = weakref.finalize(self, pool.release, conn, False)
+
+    def read(self, amt=None):
+        """Read the body (or the next amt bytes)"""
+        data = self.response.read(amt)
+        if amt is None or not data or self.response.isclosed():
+            self.close()
+        return data
+
+    def readinto(self, buffer):
+        """Read the next part of the body into a preallocated buffer"""
+        count = self.response.readinto(buffer)
+        if count == 0 or self.response.isclosed():
+            self.close()
+        return count
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def close(self):
+        """Release the connection, keeping it only if the body was consumed"""
+        if self.conn is None:
+            return
+        reusable = self.response.isclosed() and not self.response.will_close
+        conn, self.conn = self.conn, None
+        self.finalizer.detach()
+        self.response.close()
+        self.pool.release(conn, reusable)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResponseCache:
+    """LRU of GET response bodies with an optional on-disk store.
+
+    Entries are keyed by URL plus the values of the request headers the
+    response named in Vary; `varies` remembers those names per URL.
+    """
+
+    CAPACITY = 256
+
+    def __init__(self, capacity=CAPACITY, directory=None):
+        self.capacity = max(1, int(capacity))
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.varies = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stores = 0
+        self.evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        """Disk location of an entry, without extension"""
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def key(self, url, headers):
+        """Cache key of a GET for url sent with these request headers"""
+        with self.lock:
+            vary = self.varies.get(url)
+        if vary is None and self.directory:
+            try:
+                with open(self.path(url) + '.vary', 'r', encoding='utf-8') as f:
+                    vary = json.load(f)
+            except (OSError, ValueError):
+                vary = None
+        return _cache_key(url, headers, vary)
+
+    def get(self, key):
+        """The stored entry for a key, from memory or disk"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry
+        if not self.directory:
+            return None
+        base = self.path(key)
+        try:
+            with open(base + '.json', 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(base + '.body', 'rb') as f:
+                entry['body'] = f.read()
+        except (OSError, ValueError):
+            return None
+        if entry.get('key', entry.get('url')) != key:
+            return None
+        self.remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        """Store an entry in memory and, when configured, on disk"""
+        self.remember(key, entry)
+        with self.lock:
+            self.stores += 1
+        if self.directory:
+            base = self.path(key)
+            meta = {name: value for name, value in entry.items() if name != 'body'}
+            with open(base + '.body.tmp', 'wb') as f:
+                f.write(entry['body'])
+            with open(base + '.json.tmp', 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(base + '.body.tmp', base + '.body')
+            os.replace(base + '.json.tmp', base + '.json')
+            vary = self.path(entry['url']) + '.vary'
+            with open(vary + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(entry.get('vary') or [], f)
+            os.replace(vary + '.tmp', vary)
+
+    def remember(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self.varies[entry['url']] = entry.get('vary') or []
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def clear(self):
+        """Drop every entry, including the disk store"""
+        with self.lock:
+            self.entries.clear()
+            self.varies.clear()
+        if self.directory:
+            for name in os.listdir(self.directory):
+                if name.endswith(('.json', '.body', '.vary')):
+                    os.remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'capacity': self.capacity,
+                'directory': self.directory,
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidated': self.revalidated,
+                'stores': self.stores,
+                'evictions': self.evictions,
+            }
+
+
+def _directives(headers):
+    """Cache-Control directives of a response, by lowercase name"""
+    directives = {}
+    for part in (headers.get('Cache-Control') or '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"')
+    return directives
+
+def _expires(headers):
+    """When a response stops being fresh, or None if it must not be stored"""
+    directives = _directives(headers)
+    if 'no-store' in directives or (headers.get('Vary') or '').strip() == '*':
+        return None
+    now = time.time()
+    try:
+        if 'no-cache' in directives:
+            lifetime = 0
+        elif 'max-age' in directives:
+            lifetime = int(directives['max-age']) - int(headers.get('Age') or 0)
+        elif headers.get('Expires'):
+            date = email.utils.parsedate_to_datetime(headers['Date']).timestamp() if headers.get('Date') else now
+            lifetime = email.utils.parsedate_to_datetime(headers['Expires']).timestamp() - date
+        else:
+            lifetime = 0
+    except (TypeError, ValueError):
+        lifetime = 0
+    return now + max(lifetime, 0)
+
+def _vary(headers):
+    """Lowercase names of the request headers a response varies on"""
+    return sorted({name.strip().lower() for name in (headers.get('Vary') or '').split(',') if name.strip()})
+
+def _cache_key(url, headers, vary):
+    """The URL, plus the value of each varying request header"""
+    if not vary:
+        return url
+    sent = {name.lower(): str(value) for name, value in (headers or {}).items()}
+    return url + ''.join(f"\n{name}: {sent.get(name, '')}" for name in vary)
+
+def _cached_get(url, headers, timeout, retries=None, backoff=None):
+    """GET through the response cache, revalidating stale entries.
+
+    Requests carrying credentials only share responses marked public.
+    """
+    private = any(name.lower() in _PRIVATE_HEADERS for name in headers or {})
+    key = _cache.key(url, headers)
+    entry = _cache.get(key)
+    if entry is not None and private and 'public' not in _directives(entry['headers']):
+        entry = None
+    if entry is not None and entry['expires'] > time.time():
+        _cache.count('hits')
+        return entry['body']
+    sent = dict(headers or {})
+    if entry is not None:
+        if entry['headers'].get('ETag'):
+            sent['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            sent['If-Modified-Since'] = entry['headers']['Last-Modified']
+    with _open('GET', url, None, sent, timeout, retries, backoff) as response:
+        body = response.read()
+        received = {name: response.headers[name] for name in _CACHE_HEADERS + ('Vary',)
+                    if response.headers.get(name) is not None}
+        status = response.status
+    if status == 304 and entry is not None:
+        # Still valid: refresh the stored headers and keep the body
+        _cache.count('revalidated')
+        entry['headers'].update(received)
+        entry['headers'].pop('Vary', None)
+        entry['expires'] = _expires(entry['headers']) or time.time()
+        _cache.put(key, entry)
+        return entry['body']
+    _cache.count('misses')
+    expires = _expires(received) if status == 200 else None
+    if private and 'public' not in _directives(received):
+        expires = None
+    if expires is not None and (expires > time.time() or received.get('ETag') or received.get('Last-Modified')):
+        vary = _vary(received)
+        received.pop('Vary', None)
+        key = _cache_key(url, headers, vary)
+        _cache.put(key, {'url': url, 'key': key, 'vary': vary, 'headers': received, 'expires': expires,
+                         'body': body})
+    return body
+
+class CircuitOpenError(ConnectionError):
+    """Raised without contacting a host whose circuit breaker is open"""
+
+
+class HostHealth:
+    """Circuit breaker and retry budget for one host"""
+
+    def __init__(self, host):
+        self.host = host
+        self.lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.tokens = float(_resilience['retryBurst'])
+
+    def allow(self):
+        """Whether a request may go out now"""
+        with self.lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < _resilience['resetTimeout']:
+                    return False
+                self.state = 'half_open'
+                self.probing = False
+            if self.state == 'half_open':
+                # One trial request decides whether the circuit closes
+                if self.probing:
+                    return False
+                self.probing = True
+            return True
+
+    def record(self, ok):
+        """Count a request's outcome towards the breaker"""
+        with self.lock:
+            if ok:
+                self.failures = 0
+                self.state = 'closed'
+                return
+            self.failures += 1
+            threshold = _resilience['failureThreshold']
+            if self.state == 'half_open' or (threshold and self.failures >= threshold):
+                if self.state != 'open':
+                    _count('circuitsOpened')
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def deposit(self):
+        """Earn a fraction of a retry for every request sent"""
+        with self.lock:
+            self.tokens = min(self.tokens + _resilience['retryBudget'], _resilience['retryBurst'])
+
+    def withdraw(self):
+        """Spend one retry, if the budget has one left"""
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+        _count('retriesDenied')
+        return False
+
+    def stats(self):
+        with self.lock:
+            return {
+                'host': self.host,
+                'state': self.state,
+                'failures': self.failures,
+                'retryTokens': round(self.tokens, 2),
+            }
+
+
+class RateLimitError(RuntimeError):
+    """Raised when a request would wait longer than its limit's maxWait"""
+
+
+class RateLimiter:
+    """Token bucket shared by every thread sending to one host.
+
+    Each caller reserves the next token under the lock, so waiting
+    requests are released evenly at the configured rate.
+    """
+
+    def __init__(self, name, rate, burst=None, max_wait=None):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, self.rate))
+        self.max_wait = max_wait
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.delayed = 0
+        self.waited = 0.0
+        self.rejected = 0
+
+    def reserve(self):
+        """Take a token, returning how long to wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if self.max_wait is not None and wait > self.max_wait:
+                self.rejected += 1
+                raise RateLimitError(f"Rate limit for {self.name}: request would wait {wait:.2f}s")
+            self.tokens -= 1
+            self.requests += 1
+            if wait:
+                self.delayed += 1
+                self.waited += wait
+            return wait
+
+    def acquire(self):
+        """Block until the request may be sent"""
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def stats(self):
+        with self.lock:
+            tokens = min(self.burst, self.tokens + (time.monotonic() - self.updated) * self.rate)
+            return {
+                'host': self.name,
+                'rate': self.rate,
+                'burst': self.burst,
+                'tokens': round(tokens, 3),
+                'requests': self.requests,
+                'delayed': self.delayed,
+                'waited': round(self.waited, 3),
+                'rejected': self.rejected,
+            }
+
+
+def _throttle(url):
+    """Wait for the rate limit that covers a URL's host, if any"""
+    if not _limits:
+        return
+    parts = urllib.parse.urlsplit(url)
+    host = parts.hostname or ''
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    with _limits_lock:
+        limiter = _limits.get(f"{host}:{port}") or _limits.get(host)
+        if limiter is None and '*' in _limits:
+            # The default limit gives every host a bucket of its own
+            limiter = _default_limits.get(host)
+            if limiter is None:
+                default = _limits['*']
+                limiter = RateLimiter(host, default.rate, default.burst, default.max_wait)
+                _default_limits[host] = limiter
+    if limiter is not None:
+        limiter.acquire()
+
+def _count(metric):
+    with _metrics_lock:
+        _metrics[metric] += 1
+
+def _timeouts(timeout=None):
+    """(connect, read) timeouts; an explicit timeout applies to both"""
+    if timeout is not None:
+        return timeout, timeout
+    return _resilience['connectTimeout'], _resilience['readTimeout']
+
+def _health(url):
+    """The breaker and retry budget for a URL's host"""
+    parts = urllib.parse.urlsplit(url)
+    host = f"{parts.hostname}:{parts.port or (443 if parts.scheme == 'https' else 80)}"
+    with _hosts_lock:
+        health = _hosts.get(host)
+        if health is None:
+            health = HostHealth(host)
+            _hosts[host] = health
+        return health
+
+def _timed_out(error):
+    return isinstance(error, (TimeoutError, socket.timeout)) or (
+        isinstance(error, urllib.error.URLError) and isinstance(error.reason, (TimeoutError, socket.timeout)))
+
+def _server_failure(error):
+    """Errors that count against a host's circuit breaker"""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+def _retryable(error):
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in _RETRY_STATUS
+    return isinstance(error, (OSError, http.client.HTTPException)) and not isinstance(error, CircuitOpenError)
+
+def _backoff(attempt, base, error):
+    """Exponential backoff with full jitter, stretched to any Retry-After"""
+    delay = min(_resilience['maxBackoff'], base * (2 ** attempt))
+    if _resilience['jitter']:
+        delay = random.uniform(0, delay)
+    if isinstance(error, urllib.error.HTTPError):
+        retry_after = error.headers.get('Retry-After') if error.headers else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), _resilience['maxBackoff']))
+    return delay
+
+def _resolve(host, port):
+    """getaddrinfo for TCP, cached process-wide for the DNS ttl"""
+    key = (host, port)
+    now = time.monotonic()
+    with _dns_lock:
+        cached = _dns_cache.get(key)
+        if cached is not None and cached[0] > now:
+            _dns_stats['hits'] += 1
+            return cached[1]
+        _dns_stats['misses'] += 1
+    infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    if _dns['ttl'] > 0:
+        with _dns_lock:
+            _dns_cache[key] = (now + _dns['ttl'], infos)
+    return infos
+
+def _interleave(infos):
+    """Alternate address families, starting with the resolver's first choice"""
+    first = [info for info in infos if info[0] == infos[0][0]]
+    rest = [info for info in infos if info[0] != infos[0][0]]
+    ordered = []
+    for i in range(max(len(first), len(rest))):
+        ordered.extend(group[i] for group in (first, rest) if i < len(group))
+    return ordered
+
+def _race(infos, timeout):
+    """Happy eyeballs: start the next address whenever the last is slow to answer"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    selector = selectors.DefaultSelector()
+    pending = {}
+    errors = []
+    winner = None
+    queue = _interleave(infos)
+    next_start = time.monotonic()
+    try:
+        while winner is None:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                raise socket.timeout('timed out')
+            if queue and (not pending or now >= next_start):
+                family, kind, proto, _, address = queue.pop(0)
+                sock = socket.socket(family, kind, proto)
+                sock.setblocking(False)
+                code = sock.connect_ex(address)
+                if code in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+                    selector.register(sock, selectors.EVENT_WRITE)
+                    pending[sock] = address
+                    if len(pending) > 1:
+                        with _dns_lock:
+                            _dns_stats['races'] += 1
+                else:
+                    sock.close()
+                    errors.append(OSError(code, os.strerror(code)))
+                next_start = now + _dns['attemptDelay']
+                continue
+            if not pending:
+                raise errors[-1] if errors else OSError("No addresses to connect to")
+            waits = [deadline - now] if deadline is not None else []
+            if queue:
+                waits.append(max(0, next_start - now))
+            for key, _ in selector.select(min(waits) if waits else None):
+                sock = key.fileobj
+                selector.unregister(sock)
+                del pending[sock]
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if code == 0:
+                    winner = sock
+                    break
+                sock.close()
+                errors.append(OSError(code, os.strerror(code)))
+                # A refused address lets the next one start straight away
+                next_start = now
+    finally:
+        for sock in pending:
+            sock.close()
+        selector.close()
+    winner.setblocking(True)
+    winner.settimeout(timeout)
+    return winner
+
+def _create_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None, *args):
+    """socket.create_connection with the DNS cache and happy eyeballs"""
+    host, port = address
+    if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+        timeout = socket.getdefaulttimeout()
+    infos = _resolve(host, port)
+    if _dns['happyEyeballs'] and source_address is None and len(infos) > 1:
+        return _race(infos, timeout)
+    error = None
+    for family, kind, proto, _, sockaddr in infos:
+        sock = socket.socket(family, kind, proto)
+        try:
+            sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as e:
+            error = e
+            sock.close()
+    raise error or OSError(f"getaddrinfo returned no addresses for {host}")
+
+def _tcp_ping(host, port, timeout):
+    """Seconds taken to open (and close) a TCP connection, or None"""
+    start = time.monotonic()
+    try:
+        _create_connection((host, port), timeout).close()
+    except OSError:
+        return None
+    return time.monotonic() - start
+
+def _context():
+    """Shared TLS context so handshakes reuse one set of CA certificates"""
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+def _pool(scheme, host, port):
+    """The keep-alive pool for one host, created on first use"""
+    key = (scheme, host, port)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(scheme, host, port,
+                                  _settings['maxConnections'], _settings['idleTimeout'])
+            _pools[key] = pool
+        return pool
+
+def _proxied(parts):
+    """True when an environment proxy applies, which urllib handles"""
+    proxies = urllib.request.getproxies()
+    return parts.scheme in proxies and not urllib.request.proxy_bypass(parts.hostname or '')
+
+def _encode(data):
+    """Encode a request body the way the net functions always have"""
+    if isinstance(data, dict):
+        return json.dumps(data).encode('utf-8')
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    return data
+
+def _open(method, url, body=None, headers=None, timeout=None, retries=None, backoff=None):
+    """Send a request with retries and the host's circuit breaker applied"""
+    method = method.upper()
+    if retries is None:
+        retries = _resilience['retries'] if method in _IDEMPOTENT else 0
+    if backoff is None:
+        backoff = _resilience['backoff']
+    health = _health(url)
+    attempt = 0
+    while True:
+        _throttle(url)
+        if not health.allow():
+            _count('rejected')
+            raise CircuitOpenError(f"Circuit open for {health.host}")
+        if attempt == 0:
+            health.deposit()
+        try:
+            response = _exchange(method, url, body, headers, timeout)
+        except Exception as e:
+            call = getattr(_async_local, 'call', None)
+            if call is not None and call.aborted:
+                # Cut off by the caller, not a failure of the host
+                raise
+            if _timed_out(e):
+                _count('timeouts')
+            health.record(not _server_failure(e))
+            if attempt >= retries or not _retryable(e) or not health.withdraw():
+                e.attempts = attempt + 1
+                raise
+            _count('retries')
+            time.sleep(_backoff(attempt, backoff, e))
+            attempt += 1
+            continue
+        health.record(True)
+        return response
+
+def _exchange(method, url, body, headers, timeout):
+    """Send one request through the connection pool, following redirects"""
+    sent = {'User-Agent': _user_agent}
+    sent.update(headers or {})
+    for _ in range(_MAX_REDIRECTS + 1):
+        parts = urllib.parse.urlsplit(url)
+        if not _settings['keepAlive'] or parts.scheme not in ('http', 'https') or _proxied(parts):
+            req = urllib.request.Request(url, data=body, headers=sent, method=method)
+            return urllib.request.urlopen(req, timeout=_timeouts(timeout)[1])
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        response = _pool(parts.scheme, parts.hostname, port).request(method, target, body, sent, timeout)
+        response.url = url
+        location = response.getheader('Location')
+        if response.status in _REDIRECTS and location:
+            response.read()
+            url = urllib.parse.urljoin(url, location)
+            if response.status == 303 or (response.status in (301, 302) and method == 'POST'):
+                method, body = 'GET', None
+                sent.pop('Content-Type', None)
+            continue
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason,
+                                         response.headers, io.BytesIO(response.read()))
+        return response
+    raise urllib.error.URLError(f"Too many redirects: {url}")
+
+def _send(method, url, body=None, headers=None, timeout=None, retries=None, backoff=None):
+    """Send a request and return the full response body as bytes"""
+    if _cache is not None and method.upper() == 'GET' and not (headers and 'Range' in headers):
+        return _cached_get(url, headers, timeout, retries, backoff)
+    with _open(method, url, body, headers, timeout, retries, backoff) as response:
+        return response.read()
+
+def _copy(response, f, chunk_size, progress=None, done=0, total=None):
+    """Stream a response body into a file through one reusable buffer"""
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    while True:
+        count = response.readinto(buffer)
+        if not count:
+            return done
+        f.write(view[:count])
+        done += count
+        if progress:
+            progress(done, total)
+
+
+class _UploadBody:
+    """Multipart body read from disk in fixed-size chunks.
+
+    Iterating again starts over, so a retried or redirected request can
+    resend it.
+    """
+
+    def __init__(self, filepath, field_name, chunk_size, progress=None):
+        import mimetypes
+        
+        self.filepath = filepath
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.boundary = '----WebKitFormBoundary' + ''.join([str(i) for i in range(16)])
+        content_type = mimetypes.guess_type(filepath)[0] or 'application/octet-stream'
+        self.head = (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{os.path.basename(filepath)}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode('utf-8')
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self.size = os.path.getsize(filepath)
+        self.length = len(self.head) + self.size + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        sent = 0
+        with open(self.filepath, 'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+                sent += len(chunk)
+                if self.progress:
+                    self.progress(sent, self.size)
+        yield self.tail
+
+def configurePool(options):
+    """Configure keep-alive pooling: maxConnections, idleTimeout, keepAlive"""
+    for key in ('maxConnections', 'idleTimeout', 'keepAlive'):
+        if key in options:
+            _settings[key] = options[key]
+    with _pools_lock:
+        for pool in _pools.values():
+            with pool.condition:
+                pool.max_connections = _settings['maxConnections']
+                pool.idle_timeout = _settings['idleTimeout']
+                pool.condition.notify_all()
+    if not _settings['keepAlive']:
+        closePools()
+    return dict(_settings)
+
+def configureCache(options=None):
+    """Turn on the response cache for GETs: enabled, capacity, directory"""
+    global _cache
+    options = options or {}
+    if not options.get('enabled', True):
+        _cache = None
+        return False
+    _cache = ResponseCache(options.get('capacity', ResponseCache.CAPACITY), options.get('directory'))
+    return True
+
+def cacheStats():
+    """Response cache hit/miss counters"""
+    if _cache is None:
+        return {'enabled': False}
+    stats = _cache.stats()
+    stats['enabled'] = True
+    return stats
+
+def clearCache():
+    """Empty the response cache"""
+    if _cache is not None:
+        _cache.clear()
+    return True
+
+def configureResilience(options):
+    """Configure timeouts, retries and circuit breakers for every net call.
+
+    Options: connectTimeout and readTimeout (seconds), retries (extra
+    attempts for idempotent requests), backoff and maxBackoff (seconds),
+    jitter, retryBudget (retries earned per request) and retryBurst
+    (retries available at once), failureThreshold (consecutive failures
+    that open a host's circuit; 0 disables it) and resetTimeout (seconds
+    before a trial request is let through).
+    """
+    for key in _resilience:
+        if key in options:
+            _resilience[key] = options[key]
+    return dict(_resilience)
+
+def resilienceStats():
+    """Retry, timeout and circuit breaker metrics"""
+    with _metrics_lock:
+        stats = dict(_metrics)
+    with _hosts_lock:
+        hosts = list(_hosts.values())
+    stats['hosts'] = [health.stats() for health in hosts]
+    stats['openCircuits'] = sum(1 for host in stats['hosts'] if host['state'] != 'closed')
+    return stats
+
+def configureDNS(options):
+    """Configure the DNS cache and connects: ttl, happyEyeballs, attemptDelay"""
+    for key in _dns:
+        if key in options:
+            _dns[key] = options[key]
+    if _dns['ttl'] <= 0:
+        clearDNSCache()
+    return dict(_dns)
+
+def dnsStats():
+    """DNS cache hits, misses and happy-eyeballs races"""
+    with _dns_lock:
+        stats = dict(_dns_stats)
+        stats['entries'] = len(_dns_cache)
+    stats['ttl'] = _dns['ttl']
+    return stats
+
+def clearDNSCache():
+    """Forget every cached address"""
+    with _dns_lock:
+        _dns_cache.clear()
+    return True
+
+def setRateLimit(host, rate, options=None):
+    """Limit requests to a host ("name", "name:port" or "*" for each host).
+
+    rate is requests per second. Options: burst (requests allowed at
+    once, default max(1, rate)) and maxWait (seconds; a request that
+    would wait longer fails instead).
+    """
+    options = options or {}
+    limiter = RateLimiter(host, rate, options.get('burst'), options.get('maxWait'))
+    with _limits_lock:
+        _limits[host] = limiter
+        if host == '*':
+            _default_limits.clear()
+    return True
+
+def removeRateLimit(host):
+    """Stop limiting requests to a host"""
+    with _limits_lock:
+        removed = _limits.pop(host, None) is not None
+        if host == '*':
+            _default_limits.clear()
+    return removed
+
+def rateLimitStats():
+    """Per-host token bucket counters"""
+    with _limits_lock:
+        limiters = [limiter for name, limiter in _limits.items() if name != '*']
+        limiters.extend(_default_limits.values())
+    return [limiter.stats() for limiter in limiters]
+
+def poolStats():
+    """Per-host connection pool statistics"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+def closePools():
+    """Close every idle pooled connection"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+    return True
 
 def get(url):
     """HTTP GET request"""
     try:
-        with urllib.request.urlopen(url) as response:
-            return response.read().decode('utf-8')
+        return _send('GET', url).decode('utf-8')
     except Exception as e:
         raise RuntimeError(f"Network error: {e}")
 
 def post(url, data):
     """HTTP POST request"""
     try:
-        if isinstance(data, dict):
-            data = json.dumps(data).encode('utf-8')
-        elif isinstance(data, str):
-            data = data.encode('utf-8')
-        
-        req = urllib.request.Request(url, data=data, method='POST')
-        req.add_header('Content-Type', 'application/json')
-        
-        with urllib.request.urlopen(req) as response:
-            return response.read().decode('utf-8')
+        return _send('POST', url, _encode(data), {'Content-Type': 'application/json'}).decode('utf-8')
     except Exception as e:
         raise RuntimeError(f"Network error: {e}")
 
 def request(method, url, data=None, headers=None):
     """Generic HTTP request"""
     try:
-        if data and isinstance(data, dict):
-            data = json.dumps(data).encode('utf-8')
-        elif data and isinstance(data, str):
-            data = data.encode('utf-8')
-        
-        req = urllib.request.Request(url, data=data, method=method.upper())
-        
-        if headers:
-            for key, value in headers.items():
-                req.add_header(key, value)
-        
-        with urllib.request.urlopen(req) as response:
-            return response.read().decode('utf-8')
+        return _send(method, url, _encode(data) if data else data, headers).decode('utf-8')
     except Exception as e:
         raise RuntimeError(f"Network error: {e}")
 
 
 # ============ Advanced Networking ============
 
-def download(url, filepath):
-    """Download file from URL"""
+def download(url, filepath, options=None):
+    """Download file from URL, streaming it to disk.
+
+    Options: chunkSize (buffer bytes, default 64KB), progress (called
+    with bytes written and total size, or null when the size is not
+    known) and resume (continue a partial file with a Range request).
+    """
+    options = options or {}
+    chunk_size = int(options.get('chunkSize', _CHUNK_SIZE))
+    progress = options.get('progress')
+    offset = 0
+    headers = {}
+    if options.get('resume') and os.path.exists(filepath):
+        offset = os.path.getsize(filepath)
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
     try:
-        with urllib.request.urlopen(url) as response:
-            data = response.read()
-            with open(filepath, 'wb') as f:
-                f.write(data)
+        with _open('GET', url, headers=headers) as response:
+            length = response.headers.get('Content-Length')
+            if response.status != 206:
+                # The server sent the whole file, so start over
+                offset = 0
+            total = offset + int(length) if length is not None else None
+            with open(filepath, 'ab' if offset else 'wb') as f:
+                _copy(response, f, chunk_size, progress, offset, total)
         return True
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset:
+            # Nothing left past the end of the partial file
+            return True
+        raise RuntimeError(f"Download error: {e}")
     except Exception as e:
         raise RuntimeError(f"Download error: {e}")
 
 def getJSON(url):
     """GET request and parse JSON"""
     try:
-        with urllib.request.urlopen(url) as response:
-            data = response.read().decode('utf-8')
-            return json.loads(data)
+        return json.loads(_send('GET', url).decode('utf-8'))
     except Exception as e:
         raise RuntimeError(f"Network error: {e}")
 
 def postJSON(url, data):
     """POST JSON data"""
     try:
-        json_data = json.dumps(data).encode('utf-8')
-        req = urllib.request.Request(url, data=json_data, method='POST')
-        req.add_header('Content-Type', 'application/json')
-        
-        with urllib.request.urlopen(req) as response:
-            return json.loads(response.read().decode('utf-8'))
+        body = json.dumps(data).encode('utf-8')
+        return json.loads(_send('POST', url, body, {'Content-Type': 'application/json'}).decode('utf-8'))
     except Exception as e:
         raise RuntimeError(f"Network error: {e}")
 
 def getHeaders(url):
     """Get response headers"""
     try:
-        with urllib.request.urlopen(url) as response:
+        with _open('GET', url) as response:
+            response.read()
             return dict(response.headers)
     except Exception as e:
         raise RuntimeError(f"Network error: {e}")
@@ -92,18 +1154,15 @@ def getHeaders(url):
 def getStatus(url):
     """Get HTTP status code"""
     try:
-        with urllib.request.urlopen(url) as response:
+        with _open('GET', url) as response:
+            response.read()
             return response.status
     except Exception as e:
         return 0
 
 def isOnline():
     """Check if internet connection is available"""
-    try:
-        urllib.request.urlopen('https://www.google.com', timeout=2)
-        return True
-    except:
-        return False
+    return _tcp_ping('www.google.com', 443, 2) is not None
 
 
 # ============ Advanced Networking Features ============
@@ -111,68 +1170,39 @@ def isOnline():
 def put(url, data):
     """HTTP PUT request"""
     try:
-        if isinstance(data, dict):
-            data = json.dumps(data).encode('utf-8')
-        elif isinstance(data, str):
-            data = data.encode('utf-8')
-        
-        req = urllib.request.Request(url, data=data, method='PUT')
-        req.add_header('Content-Type', 'application/json')
-        
-        with urllib.request.urlopen(req) as response:
-            return response.read().decode('utf-8')
+        return _send('PUT', url, _encode(data), {'Content-Type': 'application/json'}).decode('utf-8')
     except Exception as e:
         raise RuntimeError(f"Network error: {e}")
 
 def delete(url):
     """HTTP DELETE request"""
     try:
-        req = urllib.request.Request(url, method='DELETE')
-        with urllib.request.urlopen(req) as response:
-            return response.read().decode('utf-8')
+        return _send('DELETE', url).decode('utf-8')
     except Exception as e:
         raise RuntimeError(f"Network error: {e}")
 
 def patch(url, data):
     """HTTP PATCH request"""
     try:
-        if isinstance(data, dict):
-            data = json.dumps(data).encode('utf-8')
-        elif isinstance(data, str):
-            data = data.encode('utf-8')
-        
-        req = urllib.request.Request(url, data=data, method='PATCH')
-        req.add_header('Content-Type', 'application/json')
-        
-        with urllib.request.urlopen(req) as response:
-            return response.read().decode('utf-8')
+        return _send('PATCH', url, _encode(data), {'Content-Type': 'application/json'}).decode('utf-8')
     except Exception as e:
         raise RuntimeError(f"Network error: {e}")
 
-def uploadFile(url, filepath, field_name='file'):
-    """Upload file via multipart/form-data"""
+def uploadFile(url, filepath, field_name='file', options=None):
+    """Upload file via multipart/form-data, streaming it from disk.
+
+    Options: chunkSize (buffer bytes, default 64KB) and progress (called
+    with bytes sent and the file size).
+    """
+    options = options or {}
     try:
-        import mimetypes
-        
-        with open(filepath, 'rb') as f:
-            file_data = f.read()
-        
-        boundary = '----WebKitFormBoundary' + ''.join([str(i) for i in range(16)])
-        content_type = mimetypes.guess_type(filepath)[0] or 'application/octet-stream'
-        
-        body = (
-            f'--{boundary}\r\n'
-            f'Content-Disposition: form-data; name="{field_name}"; filename="{os.path.basename(filepath)}"\r\n'
-            f'Content-Type: {content_type}\r\n\r\n'
-        ).encode('utf-8')
-        body += file_data
-        body += f'\r\n--{boundary}--\r\n'.encode('utf-8')
-        
-        req = urllib.request.Request(url, data=body, method='POST')
-        req.add_header('Content-Type', f'multipart/form-data; boundary={boundary}')
-        
-        with urllib.request.urlopen(req) as response:
-            return response.read().decode('utf-8')
+        body = _UploadBody(filepath, field_name, int(options.get('chunkSize', _CHUNK_SIZE)),
+                           options.get('progress'))
+        headers = {
+            'Content-Type': f'multipart/form-data; boundary={body.boundary}',
+            'Content-Length': str(body.length),
+        }
+        return _send('POST', url, body, headers).decode('utf-8')
     except Exception as e:
         raise RuntimeError(f"Upload error: {e}")
 
@@ -203,48 +1233,643 @@ def buildURL(base, params):
         return f"{base}?{query}"
     return base
 
-def ping(host, timeout=2):
-    """Ping host to check availability"""
+def ping(host, timeout=2, options=None):
+    """Ping host to check availability.
+
+    Sends a HEAD request by default. With options {tcp: true, port}
+    it only opens a TCP connection, and {latency: true} returns the
+    round trip in milliseconds (-1 when unreachable) instead of a bool.
+    """
+    options = options or {}
+    if options.get('tcp') or options.get('latency'):
+        parts = urllib.parse.urlsplit(host if '://' in host else f"//{host}")
+        port = options.get('port') or parts.port or (443 if parts.scheme == 'https' else 80)
+        elapsed = _tcp_ping(parts.hostname, port, timeout)
+        if options.get('latency'):
+            return -1 if elapsed is None else round(elapsed * 1000, 3)
+        return elapsed is not None
     try:
         url = f"http://{host}" if not host.startswith('http') else host
-        req = urllib.request.Request(url, method='HEAD')
-        with urllib.request.urlopen(req, timeout=timeout) as response:
+        with _open('HEAD', url, timeout=timeout) as response:
+            response.read()
             return response.status == 200
     except:
         return False
 
 def fetchWithRetry(url, retries=3, delay=1):
-    """Fetch URL with retry logic"""
-    import time
-    last_error = None
-    
-    for attempt in range(retries):
-        try:
-            with urllib.request.urlopen(url) as response:
-                return response.read().decode('utf-8')
-        except Exception as e:
-            last_error = e
-            if attempt < retries - 1:
-                time.sleep(delay)
-    
-    raise RuntimeError(f"Network error after {retries} attempts: {last_error}")
+    """Fetch URL, retrying transient failures with exponential backoff from delay"""
+    try:
+        return _send('GET', url, retries=max(retries, 1) - 1, backoff=delay).decode('utf-8')
+    except Exception as e:
+        raise RuntimeError(f"Network error after {getattr(e, 'attempts', 1)} attempts: {e}")
 
 def getIP():
     """Get public IP address"""
     try:
-        with urllib.request.urlopen('https://api.ipify.org?format=json') as response:
-            data = json.loads(response.read().decode('utf-8'))
-            return data.get('ip', '')
+        data = json.loads(_send('GET', 'https://api.ipify.org?format=json').decode('utf-8'))
+        return data.get('ip', '')
     except:
         return ''
 
 def getUserAgent():
     """Get default user agent"""
-    return 'ZenLang/1.0'
+    return _user_agent
 
 def setUserAgent(user_agent):
     """Set custom user agent for requests"""
-    opener = urllib.request.build_opener()
-    opener.addheaders = [('User-Agent', user_agent)]
-    urllib.request.install_opener(opener)
+    global _user_agent
+    _user_agent = user_agent
     return True
+
+
+# ============ Concurrent Requests ============
+
+def _fetch(spec, timeout):
+    """Run one request spec, capturing the outcome instead of raising"""
+    if isinstance(spec, str):
+        spec = {'url': spec}
+    url = spec.get('url')
+    result = {'url': url, 'ok': False, 'status': 0, 'body': None, 'error': None}
+    try:
+        data = spec.get('data')
+        headers = dict(spec.get('headers') or {})
+        if isinstance(data, (dict, list)):
+            data = json.dumps(data).encode('utf-8')
+            headers.setdefault('Content-Type', 'application/json')
+        elif data is not None:
+            data = _encode(data)
+        with _open(spec.get('method', 'GET'), url, data, headers, spec.get('timeout', timeout)) as response:
+            result['body'] = response.read().decode('utf-8')
+            result['status'] = response.status
+            result['ok'] = True
+    except urllib.error.HTTPError as e:
+        result['status'] = e.code
+        result['body'] = e.read().decode('utf-8', 'replace')
+        result['error'] = str(e)
+    except Exception as e:
+        result['error'] = str(e) or type(e).__name__
+    return result
+
+def requestAll(specs, options=None):
+    """Run requests concurrently; results come back in input order.
+
+    Each spec is a URL or {method, url, data, headers, timeout}. Options:
+    concurrency (requests in flight, default 10; requests to one host also
+    wait for its pool's maxConnections) and timeout (seconds per request).
+    Each result is {url, ok, status, body, error}; a failed
+    request sets error rather than raising.
+    """
+    options = options or {}
+    specs = list(specs)
+    if not specs:
+        return []
+    concurrency = max(1, int(options.get('concurrency', _CONCURRENCY)))
+    timeout = options.get('timeout')
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(specs))) as executor:
+        return list(executor.map(lambda spec: _fetch(spec, timeout), specs))
+
+def getMany(urls, options=None):
+    """GET every URL concurrently; see requestAll"""
+    return requestAll(list(urls), options)
+
+
+# ============ Async Requests ============
+
+class NetFuture:
+    """Handle for a request in flight on the background event loop"""
+
+    def __init__(self, url, future):
+        self.url = url
+        self.future = future
+
+    def isDone(self):
+        return self.future.done()
+
+    def cancel(self):
+        """Drop the result and abort the request if it is on the wire"""
+        return self.future.cancel()
+
+    def wait(self, timeout=None):
+        """Block until the response arrives and return it; raises if it failed"""
+        try:
+            return self.future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            raise RuntimeError(f"Network error: timed out waiting for {self.url}")
+        except concurrent.futures.CancelledError:
+            raise RuntimeError(f"Network error: request to {self.url} was cancelled")
+        except RuntimeError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Network error: {e}")
+
+
+class _AsyncCall:
+    """Lets the event loop abort the blocking request a worker thread runs.
+
+    Aborting shuts down the socket of the pooled connection in use, so a
+    worker stuck reading a slow response fails at once instead of holding
+    its thread until the socket timeout. Requests that bypass the pool
+    (keepAlive off, proxies) finish on their own.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conn = None
+        self.aborted = False
+
+    def attach(self, conn):
+        with self.lock:
+            if self.aborted:
+                raise concurrent.futures.CancelledError()
+            self.conn = conn
+
+    def abort(self):
+        with self.lock:
+            self.aborted = True
+            conn, self.conn = self.conn, None
+        if conn is not None and conn.sock is not None:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def run(self, method, url, body, headers, timeout):
+        _async_local.call = self
+        try:
+            return _send(method, url, body, headers, timeout)
+        finally:
+            _async_local.call = None
+            with self.lock:
+                self.conn = None
+
+
+def _event_loop():
+    """The background asyncio loop that drives net futures, started on first use"""
+    global _loop, _executor
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            # Requests reuse the blocking keep-alive pools, cache and retry
+            # layer, so the loop hands each one to a worker thread
+            _executor = ThreadPoolExecutor(max_workers=_async['workers'], thread_name_prefix='zen-net')
+            loop.set_default_executor(_executor)
+            threading.Thread(target=loop.run_forever, name='zen-net-loop', daemon=True).start()
+            _loop = loop
+        return _loop
+
+async def _request_async(method, url, body, headers, timeout, as_json):
+    loop = asyncio.get_running_loop()
+    call = _AsyncCall()
+    work = loop.run_in_executor(None, call.run, method, url, body, headers, timeout)
+    try:
+        if timeout is not None:
+            data = await asyncio.wait_for(work, timeout)
+        else:
+            data = await work
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        call.abort()
+        raise
+    text = data.decode('utf-8')
+    return json.loads(text) if as_json else text
+
+def configureAsync(options):
+    """Configure fetchAsync: workers (requests running at once, default 32)"""
+    global _executor
+    if 'workers' in options:
+        _async['workers'] = max(1, int(options['workers']))
+        with _loop_lock:
+            if _loop is not None:
+                loop, old = _loop, _executor
+                executor = _executor = ThreadPoolExecutor(max_workers=_async['workers'],
+                                                          thread_name_prefix='zen-net')
+                
+                def swap():
+                    # On the loop thread, so no later request picks the old pool;
+                    # requests already there finish before its threads exit
+                    loop.set_default_executor(executor)
+                    old.shutdown(wait=False)
+                loop.call_soon_threadsafe(swap)
+    return dict(_async)
+
+def fetchAsync(url, options=None):
+    """Start a request and return a future for await/awaitAll.
+
+    Options: method, data, headers, timeout (seconds) and json (parse
+    the response body). Requests run on a pool of worker threads (see
+    configureAsync); beyond that many, they queue until a worker is free.
+    A timeout or cancel() aborts a request that is still reading.
+    """
+    options = options or {}
+    headers = dict(options.get('headers') or {})
+    data = options.get('data')
+    if isinstance(data, (dict, list)):
+        data = json.dumps(data).encode('utf-8')
+        headers.setdefault('Content-Type', 'application/json')
+    elif data is not None:
+        data = _encode(data)
+    coroutine = _request_async(options.get('method', 'GET'), url, data, headers,
+                               options.get('timeout'), bool(options.get('json')))
+    return NetFuture(url, asyncio.run_coroutine_threadsafe(coroutine, _event_loop()))
+
+def _await(future, timeout=None):
+    """Wait for a future from fetchAsync and return its result"""
+    if isinstance(future, NetFuture):
+        return future.wait(timeout)
+    return future
+
+def awaitAll(futures, timeout=None):
+    """Wait for every future and return their results in order"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    results = []
+    for future in futures:
+        remaining = None if deadline is None else max(0, deadline - time.monotonic())
+        results.append(_await(future, remaining))
+    return results
+
+# await is a Python keyword, so the ZenLang name is bound by hand
+globals()['await'] = _await
+
+
+# ============ Streaming JSON ============
+
+class _JSONReader:
+    """Pull parser over a response, holding one chunk plus the current value"""
+
+    def __init__(self, response, chunk_size):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read the next chunk, dropping text that has been consumed"""
+        if self.eof:
+            return False
+        data = self.response.read(self.chunk_size)
+        if not data:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + self.decoder.decode(data, final=self.eof)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next significant character, or '' at the end of the body"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at JSON offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buffer, self.pos)
+                # A number cut off by the chunk boundary decodes early, so only
+                # trust a value once the delimiter after it has arrived
+                after = _WHITESPACE.match(self.buffer, end).end()
+                if self.eof or (after < len(self.buffer) and self.buffer[after] in ',]}:'):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def skip(self):
+        """Step over the next value without building it"""
+        if self.peek() not in '[{':
+            self.value()
+            return
+        depth = 0
+        while True:
+            match = _STRUCTURE.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                if not self.fill():
+                    raise ValueError("Unexpected end of JSON")
+                continue
+            char = match.group()
+            self.pos = match.end()
+            if char == '"':
+                while True:
+                    end = _STRING_END.match(self.buffer, self.pos)
+                    if end is not None:
+                        self.pos = end.end()
+                        break
+                    if not self.fill():
+                        raise ValueError("Unterminated string in JSON")
+            elif char in '[{':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def find(self, segments):
+        """Move to the value at a path of object keys and array indexes"""
+        for segment in segments:
+            char = self.peek()
+            if char == '{':
+                self.pos += 1
+                while True:
+                    if self.peek() == '}':
+                        return False
+                    key = self.value()
+                    self.expect(':')
+                    if key == segment:
+                        break
+                    self.skip()
+                    if self.peek() == ',':
+                        self.pos += 1
+            elif char == '[' and segment.isdigit():
+                self.pos += 1
+                for _ in range(int(segment)):
+                    if self.peek() == ']':
+                        return False
+                    self.skip()
+                    if self.peek() == ',':
+                        self.pos += 1
+                if self.peek() == ']':
+                    return False
+            else:
+                return False
+        return True
+
+    def items(self):
+        """Yield each element of the array at the current position"""
+        self.expect('[')
+        while True:
+            char = self.peek()
+            if char == ']':
+                return
+            if char == ',':
+                self.pos += 1
+                continue
+            if not char:
+                raise ValueError("Unexpected end of JSON")
+            yield self.value()
+
+
+def _elements(reader, path):
+    # A plain function rather than a method, so the generator holds no
+    # reference back to its stream and a dropped stream is freed at once
+    segments = [segment for segment in (path or '').split('.') if segment]
+    if not reader.find(segments):
+        raise ValueError(f"No array at path '{path}'")
+    yield from reader.items()
+
+
+class JSONStream:
+    """Array elements decoded one at a time from a response.
+
+    Iterate it from Python, or use hasNext()/next() from ZenLang loops.
+    The connection is released once the array has been read, on close(),
+    or when a stream that was not read to the end is garbage collected
+    (e.g. after streamJSON(url).take(3)).
+    """
+
+    def __init__(self, response, path, chunk_size):
+        self.response = response
+        self.path = path
+        self.reader = _JSONReader(response, chunk_size)
+        self.elements = _elements(self.reader, path)
+        self.pending = None
+        self.has_pending = False
+        self.position = 0
+        self.finalizer = weakref.finalize(self, response.close)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.has_pending:
+            value, self.pending, self.has_pending = self.pending, None, False
+        else:
+            try:
+                value = next(self.elements)
+            except StopIteration:
+                self.close()
+                raise
+            except Exception as e:
+                self.close()
+                raise RuntimeError(f"Network error: {e}")
+        self.position += 1
+        return value
+
+    def hasNext(self):
+        if not self.has_pending:
+            try:
+                self.pending = self.__next__()
+            except StopIteration:
+                return False
+            self.position -= 1
+            self.has_pending = True
+        return True
+
+    def next(self):
+        """Next element, or null once the array is exhausted"""
+        return self.__next__() if self.hasNext() else None
+
+    def take(self, n):
+        """Up to n more elements as an array"""
+        return list(islice(self, n))
+
+    def toArray(self):
+        return list(self)
+
+    def close(self):
+        """Stop reading and release the connection"""
+        self.elements = iter(())
+        self.finalizer()
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def streamJSON(url, path=None, options=None):
+    """Stream the elements of a JSON array in a response with bounded memory.
+
+    path names the array with object keys and array indexes separated by
+    dots (e.g. "data.items"); leave it empty for a top-level array.
+    Options: method, data, headers, timeout and chunkSize.
+    """
+    options = options or {}
+    headers = dict(options.get('headers') or {})
+    data = options.get('data')
+    if isinstance(data, (dict, list)):
+        data = json.dumps(data).encode('utf-8')
+        headers.setdefault('Content-Type', 'application/json')
+    elif data is not None:
+        data = _encode(data)
+    try:
+        response = _open(options.get('method', 'GET'), url, data, headers, options.get('timeout'))
+    except Exception as e:
+        raise RuntimeError(f"Network error: {e}")
+    return JSONStream(response, path, int(options.get('chunkSize', _CHUNK_SIZE)))
+
+
+# ============ Batch Requests ============
+
+class _SharedReader(io.BufferedReader):
+    """Buffered socket reader that outlives each pipelined response"""
+
+    def close(self):
+        pass
+
+
+class _Pipe:
+    """Hands every HTTPResponse on a pipelined connection the same reader"""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def makefile(self, mode, *args):
+        return self.reader
+
+
+def _pipeline(url, parts, messages, window, timeout):
+    """Send requests over one connection with up to window awaiting replies.
+
+    Returns the (status, reason, body) of each answered request in order,
+    and the error that ended the connection early, if any. A server that
+    closes the connection cleanly leaves the rest unanswered with no error.
+    TLS connections are not pipelined: an SSL socket must not be read and
+    written from two threads at once, so each request is sent from this
+    thread after the previous reply has been read.
+    """
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    conn = _pool(parts.scheme, parts.hostname, port).connect(timeout)
+    sock = conn.sock
+    pipe = _Pipe(_SharedReader(socket.SocketIO(sock, 'rb'), _CHUNK_SIZE))
+    slots = threading.Semaphore(window)
+    stop = threading.Event()
+    serial = isinstance(sock, ssl.SSLSocket)
+
+    def send():
+        # Writing on its own thread keeps a full send buffer from
+        # blocking the reads that would drain the server's replies
+        try:
+            for message in messages:
+                slots.acquire()
+                if stop.is_set():
+                    return
+                _throttle(url)
+                sock.sendall(message)
+        except OSError:
+            pass
+
+    writer = None
+    if not serial:
+        writer = threading.Thread(target=send, name='zen-net-batch', daemon=True)
+        writer.start()
+    answered = []
+    error = None
+    try:
+        for message in messages:
+            response = http.client.HTTPResponse(pipe, method='POST')
+            try:
+                if serial:
+                    _throttle(url)
+                    sock.sendall(message)
+                response.begin()
+                body = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                error = e
+                break
+            answered.append((response.status, response.reason, body))
+            slots.release()
+            if response.will_close:
+                break
+    finally:
+        stop.set()
+        slots.release()
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        conn.close()
+        if writer is not None:
+            writer.join()
+    return answered, error
+
+def postBatch(url, items, options=None):
+    """POST every item to url over one pipelined connection.
+
+    Items are request bodies (objects are sent as JSON). Options: window
+    (requests sent ahead of their responses, default 16; 1 sends them one
+    at a time; https URLs always send them one at a time), compress (gzip bodies of at least minCompressSize bytes,
+    default 256), headers, timeout and json (parse response bodies).
+    Results come back in input order as {ok, status, body, error}.
+    Redirects are not followed.
+    """
+    options = options or {}
+    items = list(items)
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise RuntimeError(f"Network error: postBatch needs an http(s) URL: {url}")
+    window = max(1, int(options.get('window', _BATCH_WINDOW)))
+    compress = options.get('compress', False)
+    min_size = int(options.get('minCompressSize', _COMPRESS_MIN))
+    as_json = bool(options.get('json'))
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    host = parts.hostname if port == (443 if parts.scheme == 'https' else 80) else f"{parts.hostname}:{port}"
+    target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+    base = {'Host': host, 'User-Agent': _user_agent, 'Content-Type': 'application/json'}
+    base.update(options.get('headers') or {})
+
+    messages = []
+    for item in items:
+        body = json.dumps(item).encode('utf-8') if isinstance(item, (dict, list)) else _encode(item) or b''
+        headers = dict(base)
+        if compress and len(body) >= min_size:
+            body = gzip.compress(body, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+        headers['Content-Length'] = str(len(body))
+        head = ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+        messages.append(f"POST {target} HTTP/1.1\r\n{head}\r\n".encode('latin-1') + body)
+
+    health = _health(url)
+    if not health.allow():
+        _count('rejected')
+        raise RuntimeError(f"Network error: Circuit open for {health.host}")
+    results = []
+    error = None
+    while len(results) < len(messages) and error is None:
+        try:
+            answered, error = _pipeline(url, parts, messages[len(results):], window, options.get('timeout'))
+        except Exception as e:
+            answered, error = [], e
+        if not answered and error is None:
+            error = ConnectionError("Connection closed before any response")
+        for status, reason, body in answered:
+            text = body.decode('utf-8', 'replace')
+            result = {'url': url, 'ok': status < 400, 'status': status, 'body': text, 'error': None}
+            if status >= 400:
+                result['error'] = f"HTTP Error {status}: {reason}"
+            elif as_json and text:
+                try:
+                    result['body'] = json.loads(text)
+                except ValueError as e:
+                    result['ok'], result['error'] = False, f"Invalid JSON: {e}"
+            results.append(result)
+    health.record(error is None or not _server_failure(error))
+    for _ in range(len(messages) - len(results)):
+        # Without a response there is no telling whether the server acted on it
+        results.append({'url': url, 'ok': False, 'status': 0, 'body': None,
+                        'error': str(error) or type(error).__name__})
+    return results
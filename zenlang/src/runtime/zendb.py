@@ -1,147 +1,3371 @@
 """ZenLang zendb package - Database and data management library"""
+import builtins
 import json
 import os
 import time
 import hashlib
+import math
+import mmap
+import re
+import tempfile
+import threading
+import warnings
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+import array
+import operator
+import heapq
+import base64
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_left, bisect_right
+from itertools import chain, compress, islice, repeat
 
 # In-memory database
 _databases = {}
 _current_db = None
+_connect_lock = threading.Lock()
+
+# Per-thread connections to the current database (see _connection)
+_local = threading.local()
+
+# ============ Where Clauses ============
+
+# Marks a field that is absent from a record
+_MISSING = object()
+
+# Operator names accepted in where clauses, with their symbolic aliases
+_OPERATORS = ('eq', 'ne', 'gt', 'gte', 'lt', 'lte', 'between', 'in', 'startsWith')
+# Operators an ordered index answers with a range of its sorted records
+_RANGE_OPERATORS = ('gt', 'gte', 'lt', 'lte', 'between', 'startsWith')
+_VALUE_LISTS = (list, tuple, set, frozenset)
+_OPERATOR_ALIASES = {
+    '==': 'eq', '=': 'eq', '!=': 'ne',
+    '>': 'gt', '>=': 'gte', '<': 'lt', '<=': 'lte',
+}
+
+def _operator_name(op):
+    """Canonical operator name, raising for unknown operators"""
+    op = _OPERATOR_ALIASES.get(op, op)
+    if op not in _OPERATORS:
+        raise ValueError(f"Unknown where operator '{op}'")
+    return op
+
+def _is_operator_spec(value):
+    """True for where values like {gt=18, lt=65}"""
+    return isinstance(value, dict) and value and all(
+        key in _OPERATORS or key in _OPERATOR_ALIASES for key in value
+    )
+
+def _normalize_where(where):
+    """Flatten a where clause into (field, op, value) conditions"""
+    conditions = []
+    for field, value in (where or {}).items():
+        if _is_operator_spec(value):
+            for op, operand in value.items():
+                op = _operator_name(op)
+                if op == 'between' and (not isinstance(operand, (list, tuple)) or len(operand) != 2):
+                    raise ValueError("'between' expects [low, high]")
+                if op == 'in' and isinstance(operand, list):
+                    try:
+                        # Constant-time membership for long id lists
+                        operand = frozenset(operand)
+                    except TypeError:
+                        pass
+                conditions.append((field, op, operand))
+        else:
+            conditions.append((field, 'eq', value))
+    return conditions
+
+def _test(op, actual, expected):
+    """Evaluate one condition against a field value"""
+    try:
+        if op == 'eq':
+            return actual == expected
+        if op == 'ne':
+            return actual != expected
+        if op == 'gt':
+            return actual > expected
+        if op == 'gte':
+            return actual >= expected
+        if op == 'lt':
+            return actual < expected
+        if op == 'lte':
+            return actual <= expected
+        if op == 'between':
+            return expected[0] <= actual <= expected[1]
+        if op == 'in':
+            return actual in expected
+        if op == 'startsWith':
+            return isinstance(actual, str) and actual.startswith(str(expected))
+    except TypeError:
+        # Values of different types never satisfy a comparison
+        return False
+    return False
+
+def _matches(record, conditions):
+    """Check a record against normalized conditions"""
+    for field, op, value in conditions:
+        if field not in record or not _test(op, record[field], value):
+            return False
+    return True
+
+def _sort_key(value):
+    """Total ordering across mixed field types: numbers, strings, others, null, missing"""
+    if value is _MISSING:
+        return (4,)
+    if value is None:
+        return (3,)
+    if isinstance(value, (int, float)):
+        return (0, value)
+    if isinstance(value, str):
+        return (1, value)
+    return (2, str(value))
+
+def _hash_key(value):
+    """Dictionary key for a field value, tolerating lists and objects"""
+    try:
+        # The module's own hash() (for ZenLang) shadows the builtin
+        builtins.hash(value)
+        return value
+    except TypeError:
+        return ('__unhashable__', json.dumps(value, sort_keys=True, default=str))
+
+# ============ Indexes ============
+
+class HashIndex:
+    """Equality index mapping field values to records"""
+    kind = 'hash'
+    
+    def __init__(self, field):
+        self.field = field
+        self.buckets = {}
+    
+    def add(self, record):
+        key = _hash_key(record.get(self.field, _MISSING))
+        self.buckets.setdefault(key, []).append(record)
+    
+    def remove(self, record):
+        key = _hash_key(record.get(self.field, _MISSING))
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            return
+        for i, candidate in enumerate(bucket):
+            if candidate is record:
+                del bucket[i]
+                break
+        if not bucket:
+            del self.buckets[key]
+    
+    def replace(self, old, new):
+        """Swap a record for a new version with the same key"""
+        bucket = self.buckets.get(_hash_key(old.get(self.field, _MISSING)), [])
+        for i, candidate in enumerate(bucket):
+            if candidate is old:
+                bucket[i] = new
+                break
+    
+    @property
+    def distinct(self):
+        return len(self.buckets)
+    
+    def add_many(self, records):
+        for record in records:
+            self.add(record)
+    
+    def lookup(self, value):
+        return self.buckets.get(_hash_key(value), [])
+    
+    def lookup_many(self, values):
+        seen = set()
+        result = []
+        for value in values:
+            key = _hash_key(value)
+            if key in seen:
+                continue
+            seen.add(key)
+            result.extend(self.buckets.get(key, []))
+        return result
+    
+    def estimate(self, op, value):
+        """Exact number of candidates for a condition, or None if unsupported"""
+        if op == 'eq':
+            return len(self.lookup(value))
+        if op == 'in' and isinstance(value, _VALUE_LISTS):
+            return sum(len(self.buckets.get(key, [])) for key in {_hash_key(v) for v in value})
+        return None
+    
+    def fetch(self, op, value):
+        return self.lookup(value) if op == 'eq' else self.lookup_many(value)
+
+
+class OrderedIndex:
+    """Sorted-array index supporting range scans and ordered iteration"""
+    kind = 'ordered'
+    
+    def __init__(self, field):
+        self.field = field
+        self.keys = []
+        self.records = []
+        self.distinct = 0
+    
+    def build(self, records):
+        entries = sorted(
+            ((_sort_key(r.get(self.field, _MISSING)), i, r) for i, r in enumerate(records)),
+            key=lambda entry: entry[:2]
+        )
+        self.keys = [entry[0] for entry in entries]
+        self.records = [entry[2] for entry in entries]
+        self.distinct = len(set(self.keys))
+    
+    def add(self, record):
+        key = _sort_key(record.get(self.field, _MISSING))
+        i = bisect_right(self.keys, key)
+        if i == 0 or self.keys[i - 1] != key:
+            self.distinct += 1
+        self.keys.insert(i, key)
+        self.records.insert(i, record)
+    
+    def add_many(self, records):
+        if len(records) * 4 > len(self.keys):
+            # Re-sorting beats shifting the array once per record for big batches
+            self.build(self.records + list(records))
+        else:
+            for record in records:
+                self.add(record)
+    
+    def remove(self, record):
+        key = _sort_key(record.get(self.field, _MISSING))
+        start, end = bisect_left(self.keys, key), bisect_right(self.keys, key)
+        for i in range(start, end):
+            if self.records[i] is record:
+                del self.keys[i]
+                del self.records[i]
+                if end - start == 1:
+                    self.distinct -= 1
+                break
+    
+    def replace(self, old, new):
+        """Swap a record for a new version with the same key"""
+        key = _sort_key(old.get(self.field, _MISSING))
+        for i in range(bisect_left(self.keys, key), bisect_right(self.keys, key)):
+            if self.records[i] is old:
+                self.records[i] = new
+                break
+    
+    def lookup(self, value):
+        key = _sort_key(value)
+        return self.records[bisect_left(self.keys, key):bisect_right(self.keys, key)]
+    
+    def lookup_many(self, values):
+        keys = sorted({_sort_key(value) for value in values})
+        result = []
+        for key in keys:
+            result.extend(self.records[bisect_left(self.keys, key):bisect_right(self.keys, key)])
+        return result
+    
+    def bounds(self, op, value):
+        """Slice of positions that can satisfy a range condition"""
+        if op == 'between':
+            low, high = _sort_key(value[0]), _sort_key(value[1])
+            return bisect_left(self.keys, low), bisect_right(self.keys, high)
+        key = _sort_key(value)
+        # Comparisons only hold between values of the same type rank
+        rank_start = bisect_left(self.keys, key[:1])
+        rank_end = bisect_left(self.keys, (key[0] + 1,))
+        if op == 'gt':
+            return bisect_right(self.keys, key), rank_end
+        if op == 'gte':
+            return bisect_left(self.keys, key), rank_end
+        if op == 'lt':
+            return rank_start, bisect_left(self.keys, key)
+        if op == 'lte':
+            return rank_start, bisect_right(self.keys, key)
+        if op == 'startsWith':
+            prefix = (1, str(value))
+            return bisect_left(self.keys, prefix), bisect_left(self.keys, (1, str(value) + '\U0010ffff'))
+        return 0, len(self.keys)
+    
+    def range(self, op, value):
+        start, end = self.bounds(op, value)
+        return self.records[start:end]
+    
+    def estimate(self, op, value):
+        """Exact number of candidates for a condition, or None if unsupported"""
+        if op == 'eq':
+            start, end = self.bounds('between', [value, value])
+            return end - start
+        if op == 'in' and isinstance(value, _VALUE_LISTS):
+            return sum(self.estimate('eq', v) for v in {_sort_key(v): v for v in value}.values())
+        if op in _RANGE_OPERATORS:
+            start, end = self.bounds(op, value)
+            return max(end - start, 0)
+        return None
+    
+    def fetch(self, op, value):
+        if op == 'eq':
+            return self.lookup(value)
+        if op == 'in':
+            return self.lookup_many(value)
+        return self.range(op, value)
+    
+    def scan(self, descending=False):
+        return reversed(self.records) if descending else iter(self.records)
+
+# Words are runs of letters and digits, compared case-insensitively
+_WORD = re.compile(r'\w+')
+
+def _tokenize(text):
+    if text is None or text is _MISSING:
+        return []
+    if isinstance(text, _VALUE_LISTS):
+        return [token for part in text for token in _tokenize(part)]
+    return _WORD.findall(str(text).casefold())
+
+
+class TextIndex:
+    """Inverted index over the words of a text field, ranked with BM25.
+    
+    Each record gets a slot; postings map every word to the slots that
+    contain it and how often. Copy-on-write updates only move a slot to
+    the new record version, and the sorted vocabulary answers prefix
+    queries.
+    """
+    kind = 'text'
+    # BM25 term-frequency saturation and length normalization
+    K1 = 1.2
+    B = 0.75
+    
+    def __init__(self, field):
+        self.field = field
+        self.postings = {}
+        self.vocabulary = []
+        self.records = {}
+        self.lengths = {}
+        self.slots = {}
+        self.next_slot = 0
+        self.total_length = 0
+        self.distinct = 0
+    
+    def add(self, record):
+        tokens = _tokenize(record.get(self.field, _MISSING))
+        slot = self.next_slot
+        self.next_slot += 1
+        self.slots[id(record)] = slot
+        self.records[slot] = record
+        self.lengths[slot] = len(tokens)
+        self.total_length += len(tokens)
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                self.vocabulary.insert(bisect_left(self.vocabulary, token), token)
+            posting[slot] = posting.get(slot, 0) + 1
+    
+    def add_many(self, records):
+        for record in records:
+            self.add(record)
+    
+    def remove(self, record):
+        slot = self.slots.pop(id(record), None)
+        if slot is None:
+            return
+        del self.records[slot]
+        self.total_length -= self.lengths.pop(slot)
+        for token in set(_tokenize(record.get(self.field, _MISSING))):
+            posting = self.postings[token]
+            posting.pop(slot, None)
+            if not posting:
+                del self.postings[token]
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+    
+    def replace(self, old, new):
+        """Swap a record for a new version with the same text"""
+        slot = self.slots.pop(id(old), None)
+        if slot is not None:
+            self.slots[id(new)] = slot
+            self.records[slot] = new
+    
+    def estimate(self, op, value):
+        # Where clauses compare whole values; only search() uses this index
+        return None
+    
+    def expand(self, token, prefix=False):
+        """Indexed words matching a query word"""
+        if not prefix:
+            return [token] if token in self.postings else []
+        start = bisect_left(self.vocabulary, token)
+        end = bisect_left(self.vocabulary, token + '\U0010ffff')
+        return self.vocabulary[start:end]
+    
+    def search(self, terms, prefix=False, require_all=False, limit=None):
+        """(score, record) pairs for records containing the terms, best first"""
+        total = len(self.records)
+        if not total:
+            return []
+        average = self.total_length / total or 1
+        scores = {}
+        matched = []
+        for token in dict.fromkeys(_tokenize(terms)):
+            slots = set()
+            for word in self.expand(token, prefix):
+                posting = self.postings[word]
+                idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+                for slot, frequency in posting.items():
+                    norm = self.K1 * (1 - self.B + self.B * self.lengths[slot] / average)
+                    scores[slot] = scores.get(slot, 0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+                    slots.add(slot)
+            matched.append(slots)
+        if require_all and matched:
+            keep = set.intersection(*matched)
+            scores = {slot: score for slot, score in scores.items() if slot in keep}
+        key = lambda item: (-item[1], item[0])
+        ranked = heapq.nsmallest(limit, scores.items(), key=key) if limit else sorted(scores.items(), key=key)
+        return [(score, self.records[slot]) for slot, score in ranked]
+
+_INDEX_TYPES = {'hash': HashIndex, 'ordered': OrderedIndex, 'text': TextIndex}
+
+def _search(index, terms, options, keep=None):
+    """Ranked matches from a text index as records carrying a _score field.
+    
+    Only records `keep` accepts are returned, when it is given.
+    """
+    conditions = _normalize_where(options.get('where'))
+    limit = options.get('limit')
+    ranked = index.search(terms, bool(options.get('prefix')), bool(options.get('all')),
+                          None if conditions or keep else limit)
+    rows = (dict(record.items(), _score=round(score, 6)) for score, record in ranked
+            if keep is None or keep(record))
+    return list(islice((row for row in rows if _matches(row, conditions)), limit))
+
+def _search_rows(rows, field, terms, options):
+    """Search rows that have no text index by indexing them on the fly"""
+    index = TextIndex(field)
+    index.add_many(rows)
+    return _search(index, terms, options)
+
+# ============ Query Planner ============
+
+# Plan costs are measured in "rows tested against the where clause"
+_SET_COST = 0.25
+_SORT_COST = 0.05
+
+# Fraction of rows a condition is assumed to keep when no index can count it
+_DEFAULT_SELECTIVITY = {
+    'eq': 0.1, 'ne': 0.9, 'in': 0.2, 'startsWith': 0.1, 'between': 0.25,
+    'gt': 0.33, 'gte': 0.33, 'lt': 0.33, 'lte': 0.33,
+}
+
+def _lookup_cost(total):
+    return math.log2(total + 1)
+
+def _sort_cost(rows):
+    return rows * math.log2(rows + 1) * _SORT_COST
+
+def _visited(rows, matches, needed):
+    """Rows a scan visits before it has produced `needed` matches"""
+    if needed is None or matches <= 0:
+        return rows
+    return min(rows, needed * rows / matches)
+
+def _intersect(paths):
+    """Records present in every access path, in the order of the smallest one"""
+    paths = sorted(paths, key=lambda path: path['rows'])
+    rows = paths[0]['fetch']()
+    for path in paths[1:]:
+        ids = {id(r) for r in path['fetch']()}
+        rows = [r for r in rows if id(r) in ids]
+    return rows
+
+# ============ Schemas ============
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+# Schema type names accepted by row tables; null is allowed for every type
+_SCHEMA_TYPES = {
+    'int': _is_int, 'integer': _is_int,
+    'float': _is_number, 'number': _is_number,
+    'string': lambda v: isinstance(v, str), 'str': lambda v: isinstance(v, str),
+    'text': lambda v: isinstance(v, str),
+    'bool': lambda v: isinstance(v, bool), 'boolean': lambda v: isinstance(v, bool),
+    'array': lambda v: isinstance(v, list), 'list': lambda v: isinstance(v, list),
+    'object': lambda v: isinstance(v, dict), 'dict': lambda v: isinstance(v, dict),
+    'any': lambda v: True,
+}
+
+# Fields every record carries, first in each row layout
+_SYSTEM_FIELDS = ('id', '_created_at', '_updated_at')
+
+
+class Row(tuple):
+    """Fixed-layout record of a schema table.
+
+    Values sit at the offsets given by the table's field map, with _MISSING
+    in unset slots. Field access works like a read-only dict; iterating
+    yields the raw slots.
+    """
+    __slots__ = ()
+    fields = ()
+    offsets = {}
+
+    def get(self, field, default=None):
+        i = self.offsets.get(field)
+        if i is None:
+            return default
+        value = tuple.__getitem__(self, i)
+        return default if value is _MISSING else value
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, field):
+        return self.get(field, _MISSING) is not _MISSING
+
+    def keys(self):
+        return [field for field, value in zip(self.fields, self) if value is not _MISSING]
+
+    def values(self):
+        return [value for value in self if value is not _MISSING]
+
+    def items(self):
+        return [(field, value) for field, value in zip(self.fields, self) if value is not _MISSING]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    @classmethod
+    def projector(cls, fields=None):
+        """Function turning a row into a dict of the wanted fields"""
+        wanted = set(cls.fields if fields is None else fields)
+        selectors = bytes(field in wanted for field in cls.fields)
+        names = [field for field in cls.fields if field in wanted]
+        return lambda row: {
+            name: value for name, value in zip(names, compress(row, selectors)) if value is not _MISSING
+        }
+
+    @classmethod
+    def matcher(cls, conditions):
+        """Predicate for normalized conditions that reads slots by offset"""
+        checks = []
+        for field, op, value in conditions:
+            i = cls.offsets.get(field)
+            if i is None:
+                # Fields outside the layout are never present
+                return lambda row: False
+            checks.append((i, op, value))
+        slot = tuple.__getitem__
+
+        def match(row):
+            for i, op, value in checks:
+                actual = slot(row, i)
+                if actual is _MISSING or not _test(op, actual, value):
+                    return False
+            return True
+        return match
+
+
+class Schema:
+    """Declared field types of a row table and the layout of its rows.
+    
+    Fields with a type name zendb doesn't know are declared but untyped.
+    """
+    def __init__(self, table_name, spec):
+        self.table_name = table_name
+        self.types = {}
+        for field, type_name in spec.items():
+            type_name = str(type_name).lower()
+            self.types[field] = type_name if type_name in _SCHEMA_TYPES else 'any'
+        fields = _SYSTEM_FIELDS + tuple(field for field in self.types if field not in _SYSTEM_FIELDS)
+        self.row_type = type('Row', (Row,), {
+            '__slots__': (),
+            'fields': fields,
+            'offsets': {field: i for i, field in enumerate(fields)},
+        })
+
+    def check(self, record):
+        """Raise unless every field of record is declared and well-typed"""
+        for field, value in record.items():
+            type_name = self.types.get(field)
+            if type_name is None:
+                if field not in _SYSTEM_FIELDS:
+                    raise ValueError(f"Field '{field}' is not in the schema of table '{self.table_name}'")
+            elif value is not None and not _SCHEMA_TYPES[type_name](value):
+                raise ValueError(f"Field '{field}' expects {type_name}, got {value!r}")
+        return record
+
+    def pack(self, record):
+        return self.row_type(map(record.get, self.row_type.fields, repeat(_MISSING)))
+
+
+def _project(rows, fields=None):
+    """Plain records for query results, optionally limited to some fields (lazy).
+    
+    Dict rows are copied: the stored ones are shared with indexes and snapshots.
+    """
+    projectors = {}
+    for row in rows:
+        if isinstance(row, Row):
+            project = projectors.get(type(row))
+            if project is None:
+                project = projectors[type(row)] = row.projector(fields)
+            yield project(row)
+        elif fields is None:
+            yield dict(row)
+        else:
+            yield {field: row[field] for field in fields if field in row}
+
+# ============ Columnar Storage ============
+
+# Schema type names mapped to array typecodes; anything else is stored
+# as a dictionary-encoded string column
+_COLUMN_TYPECODES = {
+    'int': 'q', 'integer': 'q',
+    'float': 'd', 'number': 'd',
+    'bool': 'b', 'boolean': 'b',
+}
+
+# Types whose values are dictionary-encoded as JSON text
+_JSON_COLUMN_TYPES = ('array', 'list', 'object', 'dict', 'any')
+
+class Column:
+    """Typed column with a null bitmap; strings and JSON values are dictionary-encoded"""
+    def __init__(self, type_name='string', field=None):
+        self.type_name = type_name
+        self.field = field
+        self.typecode = _COLUMN_TYPECODES.get(type_name)
+        self.json = type_name in _JSON_COLUMN_TYPES
+        self.accepts = _SCHEMA_TYPES.get(type_name, _SCHEMA_TYPES['string'])
+        # Strings store dictionary codes instead of the values themselves
+        self.values = array.array(self.typecode or 'l')
+        self.nulls = bytearray()
+        self.null_count = 0
+        self.dictionary = []
+        self.codes = {}
+    
+    def __len__(self):
+        return len(self.values)
+    
+    def _key(self, value):
+        """Dictionary entry for a value of a string or JSON column"""
+        return json.dumps(value, sort_keys=True, default=str) if self.json else value
+    
+    def encode(self, value):
+        """Convert a value to its stored representation"""
+        if not self.accepts(value):
+            name = f"Field '{self.field}'" if self.field else 'Column'
+            raise ValueError(f"{name} expects {self.type_name}, got {value!r}")
+        if self.typecode is None:
+            value = self._key(value)
+            code = self.codes.get(value)
+            if code is None:
+                code = len(self.dictionary)
+                self.codes[value] = code
+                self.dictionary.append(value)
+            return code
+        if self.typecode == 'd':
+            return float(value)
+        return int(value)
+    
+    def decode(self, stored):
+        """Convert a stored representation back to a value"""
+        if self.typecode is None:
+            value = self.dictionary[stored]
+            return json.loads(value) if self.json else value
+        if self.typecode == 'b':
+            return bool(stored)
+        return stored
+    
+    def append(self, value):
+        i = len(self.values)
+        if i % 8 == 0:
+            self.nulls.append(0)
+        if value is None:
+            # Nulls hold 0 so sums and extremes treat them like missing fields
+            self.values.append(0)
+            self.nulls[i >> 3] |= 1 << (i & 7)
+            self.null_count += 1
+        else:
+            self.values.append(self.encode(value))
+    
+    def is_null(self, i):
+        return bool(self.nulls[i >> 3] & (1 << (i & 7)))
+    
+    def get(self, i):
+        if self.null_count and self.is_null(i):
+            return None
+        return self.decode(self.values[i])
+    
+    def set(self, i, value):
+        self.set_encoded(i, None if value is None else self.encode(value))
+    
+    def set_encoded(self, i, stored):
+        """Set position i to a value encode() returned, or to null for None"""
+        was_null = self.is_null(i)
+        if stored is None:
+            self.values[i] = 0
+            if not was_null:
+                self.nulls[i >> 3] |= 1 << (i & 7)
+                self.null_count += 1
+        else:
+            self.values[i] = stored
+            if was_null:
+                self.nulls[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+                self.null_count -= 1
+    
+    def keep(self, mask):
+        """Drop every position whose mask byte is 0"""
+        kept = [self.get(i) for i in compress(range(len(self.values)), mask)] if self.null_count else None
+        if kept is None:
+            self.values = array.array(self.values.typecode, compress(self.values, mask))
+            self.nulls = bytearray((len(self.values) + 7) // 8)
+            return
+        self.values = array.array(self.values.typecode)
+        self.nulls = bytearray()
+        self.null_count = 0
+        for value in kept:
+            self.append(value)
+    
+    def match_mask(self, value):
+        """Mask of positions equal to value (nulls never match)"""
+        if value is None:
+            return bytes(self.is_null(i) for i in range(len(self.values)))
+        if self.typecode is None:
+            code = self.codes.get(self._key(value)) if self.accepts(value) else None
+            if code is None:
+                return bytes(len(self.values))
+            mask = bytes(map(operator.eq, self.values, repeat(code)))
+        else:
+            try:
+                target = self.encode(value)
+            except ValueError:
+                return bytes(len(self.values))
+            mask = bytes(map(operator.eq, self.values, repeat(target)))
+        if self.null_count:
+            mask = bytes(m and not self.is_null(i) for i, m in enumerate(mask))
+        return mask
+    
+    def to_list(self):
+        return [self.get(i) for i in range(len(self.values))]
+    
+    def copy(self):
+        column = Column(self.type_name, self.field)
+        column.values = array.array(self.values.typecode, self.values)
+        column.nulls = bytearray(self.nulls)
+        column.null_count = self.null_count
+        column.dictionary = list(self.dictionary)
+        column.codes = dict(self.codes)
+        return column
+
+
+class ColumnStore:
+    """Column-oriented table storage for analytical queries"""
+    def __init__(self, schema):
+        self.columns = {
+            'id': Column('int', 'id'),
+            '_created_at': Column('float', '_created_at'),
+            '_updated_at': Column('float', '_updated_at'),
+        }
+        for field, type_name in schema.items():
+            self.columns[field] = Column(str(type_name).lower(), field)
+    
+    def __len__(self):
+        return len(self.columns['id'])
+    
+    def add_column(self, field, type_name, default=None):
+        column = Column(type_name, field)
+        for _ in range(len(self)):
+            column.append(default)
+        self.columns[field] = column
+    
+    def check(self, record):
+        """Raise unless every field of record is a column and fits its type"""
+        self.encode(record)
+        return record
+    
+    def encode(self, record):
+        """Stored form of each of record's values (None for nulls)"""
+        encoded = {}
+        for field, value in record.items():
+            column = self.columns.get(field)
+            if column is None:
+                raise ValueError(f"Field '{field}' is not in the columnar schema")
+            encoded[field] = None if value is None else column.encode(value)
+        return encoded
+    
+    def append(self, record):
+        # Encode everything first so a bad value cannot leave ragged columns
+        self.check(record)
+        for field, column in self.columns.items():
+            column.append(record.get(field))
+    
+    def extend(self, records):
+        for record in records:
+            self.check(record)
+        for field, column in self.columns.items():
+            for record in records:
+                column.append(record.get(field))
+    
+    def update_many(self, key, records, now, previous=None):
+        """Apply each record's fields to the rows whose `key` column matches it.
+        
+        Returns the positions that were updated; their rows as they were
+        before the update are appended to `previous` when it is given.
+        """
+        column = self.columns.get(key)
+        if column is None:
+            return []
+        # Encode every record first, so a bad one fails before any row has changed
+        changes = {_hash_key(record.get(key)): self.encode(record) for record in records}
+        positions = []
+        for i in range(len(self)):
+            change = changes.get(_hash_key(column.get(i)))
+            if change is None:
+                continue
+            if previous is not None:
+                previous.append(self.row(i))
+            for field, stored in change.items():
+                self.columns[field].set_encoded(i, stored)
+            self.columns['_updated_at'].set(i, now)
+            positions.append(i)
+        return positions
+    
+    def key_set(self, key):
+        column = self.columns.get(key)
+        return {_hash_key(column.get(i)) for i in range(len(self))} if column else set()
+    
+    def row(self, i):
+        row = {}
+        for field, column in self.columns.items():
+            value = column.get(i)
+            if value is not None:
+                row[field] = value
+        return row
+    
+    def mask(self, where):
+        """Selection mask for a where clause, or None for all rows"""
+        conditions = _normalize_where(where)
+        if not conditions:
+            return None
+        mask = None
+        for field, op, value in conditions:
+            column = self.columns.get(field)
+            if column is None:
+                return bytes(len(self))
+            if op == 'eq':
+                field_mask = column.match_mask(value)
+            else:
+                field_mask = bytes(
+                    not column.is_null(i) and _test(op, column.decode(stored), value)
+                    for i, stored in enumerate(column.values)
+                )
+            mask = field_mask if mask is None else bytes(map(operator.and_, mask, field_mask))
+        return mask
+    
+    def positions(self, where):
+        mask = self.mask(where)
+        if mask is None:
+            return range(len(self))
+        return list(compress(range(len(self)), mask))
+    
+    def count(self, where=None):
+        mask = self.mask(where)
+        return len(self) if mask is None else sum(mask)
+    
+    def values(self, field, where=None):
+        """Values of one column for the selected rows, nulls read as 0"""
+        return self.masked_values(field, self.mask(where))
+    
+    def masked_values(self, field, mask):
+        column = self.columns.get(field)
+        if column is None:
+            return [0] * (len(self) if mask is None else sum(mask))
+        if column.typecode is None:
+            positions = range(len(column)) if mask is None else compress(range(len(column)), mask)
+            return [0 if column.get(i) is None else column.get(i) for i in positions]
+        return column.values if mask is None else compress(column.values, mask)
+    
+    def average(self, field, where=None):
+        mask = self.mask(where)
+        matched = len(self) if mask is None else sum(mask)
+        if not matched:
+            return 0
+        column = self.columns.get(field)
+        if column is None:
+            return 0
+        values = column.values if mask is None else compress(column.values, mask)
+        if column.typecode is None:
+            values = self.values(field, where)
+        return sum(values) / matched
+    
+    def aggregate(self, func, field, where=None):
+        column = self.columns.get(field)
+        result = func(self.values(field, where))
+        if column is not None and column.typecode == 'b' and func in (max, min):
+            return bool(result)
+        return result
+    
+    def delete(self, where):
+        mask = self.mask(where)
+        if mask is None:
+            keep = bytes(len(self))
+        else:
+            keep = bytes(not m for m in mask)
+        removed = len(self) - sum(keep)
+        if removed:
+            for column in self.columns.values():
+                column.keep(keep)
+        return removed
+    
+    def to_json(self):
+        return {
+            field: {'type': column.type_name, 'values': column.to_list()}
+            for field, column in self.columns.items()
+        }
+    
+    def copy(self):
+        store = ColumnStore({})
+        store.columns = {field: column.copy() for field, column in self.columns.items()}
+        return store
+    
+    def emptied(self):
+        """Store with the same columns and no rows"""
+        return ColumnStore.from_json({
+            field: {'type': column.type_name, 'values': []} for field, column in self.columns.items()
+        })
+    
+    @classmethod
+    def from_json(cls, columns):
+        store = cls({})
+        store.columns = {}
+        for field, spec in columns.items():
+            column = Column(spec['type'], field)
+            for value in spec['values']:
+                column.append(value)
+            store.columns[field] = column
+        return store
+
+
+def _infer_type(value):
+    """Schema type name for a sample value"""
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, list):
+        return 'array'
+    if isinstance(value, dict):
+        return 'object'
+    if value is None:
+        return 'any'
+    return 'string'
+
+def _serialize_tables(tables, inline=False):
+    """Convert tables to JSON-friendly data.
+    
+    Sharded tables keep their rows in shard files unless `inline` is set.
+    """
+    result = {}
+    for name, table in tables.items():
+        if table.get('layout') == 'sharded':
+            table = {key: value for key, value in table.items() if key not in ('cluster', 'frozen')}
+            if inline:
+                # A captured table carries frozen shard copies; a live one is captured now
+                frozen = tables[name].get('frozen') or tables[name]['cluster'].capture()
+                table['partitions'] = [
+                    {'tables': _serialize_tables(shard_tables), 'indexes': indexes}
+                    for shard_tables, indexes in frozen
+                ]
+        elif table.get('layout') == 'columnar':
+            table = {
+                'schema': table['schema'],
+                'layout': 'columnar',
+                'columns': table['store'].to_json(),
+                'parallel': table.get('parallel', False),
+                'auto_increment': table['auto_increment']
+            }
+        else:
+            rows = _live(table)
+            table = {key: value for key, value in table.items() if key != 'head'}
+            table['data'] = [dict(row) for row in rows] if table.get('schema') else rows
+        result[name] = table
+    return result
+
+def _deserialize_tables(tables):
+    """Rebuild tables loaded from JSON"""
+    for table in tables.values():
+        if table.get('layout') == 'columnar':
+            table['store'] = ColumnStore.from_json(table.pop('columns'))
+    return tables
+
+# ============ Materialized Views ============
+
+_VIEW_FUNCTIONS = ('count', 'sum', 'avg', 'min', 'max')
+
+def _aggregate_specs(aggregates):
+    """Parse {out: 'count'} / {out: {sum: field}} into (out, func, field) triples"""
+    specs = []
+    for out, spec in aggregates.items():
+        if spec == 'count':
+            specs.append((out, 'count', None))
+            continue
+        if not isinstance(spec, dict) or len(spec) != 1:
+            raise ValueError(f"Aggregate '{out}' expects 'count' or {{func: field}}")
+        (func, field), = spec.items()
+        if func not in _VIEW_FUNCTIONS:
+            raise ValueError(f"Unknown aggregate function '{func}'")
+        specs.append((out, func, field))
+    return specs
+
+
+class AggregateView:
+    """Group-by aggregation over a table, kept current as rows change.
+    
+    Each group keeps a row count, running sums and sorted min/max
+    values, so a write only touches the groups of the rows it changed
+    and a read costs the number of groups, not the size of the table.
+    """
+    def __init__(self, name, table_name, group_by, aggregates=None, where=None):
+        self.name = name
+        self.table_name = table_name
+        self.group_by = [group_by] if isinstance(group_by, str) else list(group_by or [])
+        self.aggregates = dict(aggregates or {'count': 'count'})
+        self.specs = _aggregate_specs(self.aggregates)
+        self.where = where
+        self.conditions = _normalize_where(where)
+        self.groups = {}
+    
+    def definition(self):
+        return {'table': self.table_name, 'groupBy': self.group_by,
+                'aggregates': self.aggregates, 'where': self.where}
+    
+    def build(self, rows):
+        self.groups = {}
+        self.apply((), rows)
+    
+    def apply(self, removed, added):
+        """Move the changed rows out of and into their groups"""
+        for row in removed:
+            if _matches(row, self.conditions):
+                self._remove(row)
+        for row in added:
+            if _matches(row, self.conditions):
+                self._add(row)
+    
+    def _group_key(self, values):
+        return tuple(_hash_key(value) for value in values)
+    
+    def _add(self, row):
+        values = [row.get(field) for field in self.group_by]
+        key = self._group_key(values)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {'values': values, 'count': 0, 'state': {
+                out: [0, 0] if func in ('sum', 'avg') else [] for out, func, _ in self.specs if func != 'count'
+            }}
+        group['count'] += 1
+        for out, func, field in self.specs:
+            value = row.get(field) if field else None
+            if func in ('sum', 'avg'):
+                if _is_number(value):
+                    state = group['state'][out]
+                    state[0] += value
+                    state[1] += 1
+            elif func != 'count' and (_is_number(value) or isinstance(value, str)):
+                ordered = group['state'][out]
+                key_value = _sort_key(value)
+                ordered.insert(bisect_right(ordered, key_value), key_value)
+    
+    def _remove(self, row):
+        key = self._group_key(row.get(field) for field in self.group_by)
+        group = self.groups.get(key)
+        if group is None:
+            return
+        group['count'] -= 1
+        if group['count'] <= 0:
+            del self.groups[key]
+            return
+        for out, func, field in self.specs:
+            value = row.get(field) if field else None
+            if func in ('sum', 'avg'):
+                if _is_number(value):
+                    state = group['state'][out]
+                    state[1] -= 1
+                    # Drop float rounding drift once the last value is gone
+                    state[0] = state[0] - value if state[1] else 0
+            elif func != 'count' and (_is_number(value) or isinstance(value, str)):
+                ordered = group['state'][out]
+                i = bisect_left(ordered, _sort_key(value))
+                if i < len(ordered) and ordered[i] == _sort_key(value):
+                    del ordered[i]
+    
+    def _row(self, group):
+        row = dict(zip(self.group_by, group['values']))
+        for out, func, _ in self.specs:
+            state = group['state'].get(out)
+            if func == 'count':
+                row[out] = group['count']
+            elif func == 'sum':
+                row[out] = state[0]
+            elif func == 'avg':
+                row[out] = state[0] / state[1] if state[1] else None
+            elif state:
+                row[out] = (state[0] if func == 'min' else state[-1])[1]
+            else:
+                row[out] = None
+        return row
+    
+    def plan(self, where=None, order_by=None, limit=None, offset=0):
+        """(plan, source) like ZenDB.plan, looking groups up by key when the where pins every group field"""
+        conditions = _normalize_where(where)
+        pinned = {field: value for field, op, value in conditions if op == 'eq' and field in self.group_by}
+        total = len(self.groups)
+        if self.group_by and len(pinned) == len(self.group_by):
+            key = self._group_key(pinned[field] for field in self.group_by)
+            strategy, visited = 'view_lookup', 1
+            fetch = lambda: [group for group in [self.groups.get(key)] if group is not None]
+        else:
+            strategy, visited = 'view_scan', total
+            fetch = lambda: list(self.groups.values())
+        plan = {
+            'table': self.name,
+            'view': self.table_name,
+            'strategy': strategy,
+            'indexes': [],
+            'tableRows': total,
+            'matchingRows': visited,
+            'estimatedRows': min(visited, limit) if limit else visited,
+            'scannedRows': visited,
+            'cost': visited,
+            'sort': bool(order_by),
+            'considered': []
+        }
+        return plan, lambda: (row for row in map(self._row, fetch()) if _matches(row, conditions))
 
 # ============ Database Management ============
 
-class ZenDB:
-    """In-memory database with persistence"""
-    def __init__(self, name):
-        self.name = name
-        self.tables = {}
-        self.indexes = {}
-        self.file_path = f"{name}.zendb"
+def _live(table):
+    """A row table's current rows, without those evicted from the front"""
+    head = table.get('head', 0)
+    return table['data'][head:] if head else table['data']
+
+
+class _TableView:
+    """A table's rows as of one moment.
+    
+    Row lists only ever grow in place while a view of them is alive;
+    updates and deletes then install a new list, so the first `length`
+    rows of a captured list never change. Evicting the oldest rows only
+    moves the table's `head` past them.
+    """
+    def __init__(self, table, version):
+        self.table = table
+        self.version = version
+        self.data = table.get('data')
+        self.start = table.get('head', 0)
+        self.length = len(self.data) if self.data is not None else 0
+    
+    @property
+    def size(self):
+        return self.length - self.start
+    
+    def rows(self):
+        # A generator, so the view stays alive (and registered) while its rows are read
+        if self.data is not None:
+            yield from islice(self.data, self.start, self.length)
+
+
+def _page(rows, order_by=None, order_dir='asc', limit=None, offset=0, sort=True):
+    """Apply ordering, offset and limit to an iterable of rows.
+    
+    Unsorted rows are pulled lazily and stop at the limit; a sort with a
+    limit only keeps the first offset + limit rows in a heap.
+    """
+    start = offset or 0
+    stop = start + limit if limit else None
+    if order_by and sort:
+        descending = str(order_dir).lower() == 'desc'
+        key = lambda r: _sort_key(r.get(order_by, _MISSING))
+        if stop is not None:
+            rows = (heapq.nlargest if descending else heapq.nsmallest)(stop, rows, key=key)
+        else:
+            rows = sorted(rows, key=key, reverse=descending)
+    return islice(rows, start, stop)
+
+
+class Journal:
+    """Redo log of the changes made since the last backup.
+
+    Recording starts with the first full backup that asks for an
+    incremental chain, and entries are held in memory until the next
+    incremental backup saves them. Entries carry row images
+    ('put' with records, 'delete' with ids) or schema changes, each with a
+    log sequence number and a timestamp, so incremental backups can save
+    them and restores can replay them up to a point in time.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.entries = []
+        # Sequence number of the last entry recorded / handed to a backup
+        self.lsn = 0
+        self.base = 0
+
+    def record(self, op, table_name, *args):
+        if self.enabled:
+            self.lsn += 1
+            self.entries.append((self.lsn, time.time(), op, table_name, args))
+
+    def start(self):
+        """Begin a new backup chain"""
+        self.enabled = True
+        self.entries = []
+        self.base = self.lsn
+        return self.lsn
+
+    def drain(self):
+        """Entries since the previous backup, with the lsn range they cover"""
+        entries, self.entries = self.entries, []
+        start, self.base = self.base, self.lsn
+        return start, self.lsn, entries
+
+    def stop(self):
+        self.enabled = False
+        self.entries = []
+
+
+class ExpiryQueue:
+    """Min-heap of the deadlines of a table's rows, for tables with a TTL.
+    
+    A row expires `ttl` seconds after it was last written. Updates push an
+    entry for the new row version; entries for versions that were since
+    replaced or deleted are skipped when they reach the top.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.heap = []
+        self.live = {}
+        self.seq = 0
+    
+    def deadline(self, record):
+        return (record.get('_updated_at') or record.get('_created_at') or 0) + self.ttl
+    
+    def build(self, rows):
+        self.live = {id(record): record for record in rows}
+        self.heap = [(self.deadline(record), i, record) for i, record in enumerate(self.live.values())]
+        self.seq = len(self.heap)
+        heapq.heapify(self.heap)
+    
+    def apply(self, removed, added):
+        for record in removed:
+            self.live.pop(id(record), None)
+        for record in added:
+            self.live[id(record)] = record
+            self.seq += 1
+            heapq.heappush(self.heap, (self.deadline(record), self.seq, record))
+        if len(self.heap) > 2 * len(self.live) + 64:
+            # Mostly stale entries: start over from the live rows
+            self.build(list(self.live.values()))
+    
+    def due(self, now):
+        """Pop the rows whose deadline has passed"""
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            record = heapq.heappop(self.heap)[2]
+            if self.live.get(id(record)) is record:
+                expired.append(record)
+        return expired
+
+
+class QueryCache:
+    """Bounded LRU cache of select() results.
+    
+    Entries remember the version of the table they were read at; a lookup
+    at any other version is a miss and drops the entry, so writes never
+    need to touch the cache.
+    """
+    # Bigger results are not worth pinning in memory
+    MAX_ROWS = 50000
+    
+    def __init__(self, capacity=128):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    @staticmethod
+    def key(table_name, where, limit, order_by, order_dir, offset, fields):
+        conditions = sorted(
+            ((field, op, _hash_key(value)) for field, op, value in _normalize_where(where)),
+            key=lambda condition: condition[:2]
+        )
+        return (table_name, tuple(conditions), limit, order_by, str(order_dir).lower(), offset or 0,
+                tuple(fields) if fields else None)
+    
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] == version:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self.entries[key]
+                self.invalidations += 1
+            self.misses += 1
+            return None
+    
+    def put(self, key, version, rows):
+        if not self.capacity or len(rows) > self.MAX_ROWS:
+            return
+        with self.lock:
+            self.entries[key] = (version, rows)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def resize(self, capacity):
+        with self.lock:
+            self.capacity = max(int(capacity), 0)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+    
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / lookups if lookups else 0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'size': len(self.entries),
+                'capacity': self.capacity
+            }
+
+
+# Databases with TTL tables, swept by one background thread
+_SWEEP_INTERVAL = 1.0
+_expiring = weakref.WeakSet()
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+def _sweep():
+    while True:
+        time.sleep(_SWEEP_INTERVAL)
+        for db in list(_expiring):
+            try:
+                db.expire()
+            except Exception as e:
+                warnings.warn(f"TTL sweep of database '{db.name}' failed: {e}", RuntimeWarning)
+
+def _watch_expiry(db):
+    global _sweeper
+    with _sweeper_lock:
+        _expiring.add(db)
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep, daemon=True)
+            _sweeper.start()
+
+
+class ZenDB:
+    """In-memory database with persistence"""
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.tables = {}
+        self.indexes = {}
+        self.schemas = {}
+        # Shards report changes to their parent's journal and views, but
+        # leave journaling schema changes to the parent
+        self.journal = parent.journal if parent else Journal()
+        self.owns_journal = parent is None
+        self.materialized = parent.materialized if parent else {}
+        self.watchers = parent.watchers if parent else {}
+        self.expiry = {}
+        # Latest parallel-scan export of each table
+        self.exports = {}
+        self.cache = QueryCache()
+        self.file_path = f"{name}.zendb"
+        # Writers serialize on the lock. Readers never take it: they check
+        # per-table version counters, which are odd while a write is running
+        self.lock = threading.RLock()
+        self.seq = 0
+        self.versions = {}
+        self.writer = None
+        # Live views, so writers can tell whether a rows list is still being
+        # read, and where each row sits in its table's list
+        self.readers = weakref.WeakSet()
+        self.readers_lock = threading.Lock()
+        self.positions = {}
+    
+    def _table(self, table_name):
+        if table_name not in self.tables:
+            raise ValueError(f"Table '{table_name}' does not exist")
+        return self.tables[table_name]
+    
+    # ---- Concurrency ----
+    
+    @contextmanager
+    def writing(self, *table_names):
+        """Hold the writer lock while marking tables as being changed"""
+        with self.lock:
+            # Nested writes by the same thread keep the outer (odd) versions
+            bumped = [name for name in table_names if self.versions.get(name, 0) % 2 == 0]
+            outer = self.seq % 2 == 0
+            previous_writer = self.writer
+            self.writer = threading.get_ident()
+            if outer:
+                self.seq += 1
+            for name in bumped:
+                self.versions[name] = self.versions.get(name, 0) + 1
+            try:
+                yield
+            finally:
+                for name in bumped:
+                    self.versions[name] += 1
+                if outer:
+                    self.seq += 1
+                self.writer = previous_writer
+    
+    def _stable(self, version):
+        """True when a reader may use state captured at this version"""
+        return version % 2 == 0 or self.writer == threading.get_ident()
+    
+    def view(self, table_name):
+        """Consistent view of one table, taken without the writer lock"""
+        while True:
+            version = self.versions.get(table_name, 0)
+            if self._stable(version):
+                view = self._register(_TableView(self._table(table_name), version))
+                if self.versions.get(table_name, 0) == version:
+                    return view
+            time.sleep(0)
+    
+    def snapshot(self):
+        """Views of every table as of a single commit point"""
+        while True:
+            seq = self.seq
+            if self._stable(seq):
+                views = {
+                    name: self._register(_TableView(table, self.versions.get(name, 0)))
+                    for name, table in list(self.tables.items())
+                }
+                if self.seq == seq:
+                    return views
+            time.sleep(0)
+    
+    def _register(self, view):
+        # Registered before the caller re-checks the version, so a writer that
+        # started in between either sees the view or makes the caller retry
+        with self.readers_lock:
+            self.readers.add(view)
+        return view
+    
+    def _shared(self, data):
+        """True while a live view still reads this rows list"""
+        with self.readers_lock:
+            return any(view.data is data for view in self.readers)
+    
+    def read(self, table_name, fn, attempts=3):
+        """Run fn optimistically, retrying if a writer changed the table meanwhile"""
+        for _ in range(attempts):
+            version = self.versions.get(table_name, 0)
+            if not self._stable(version):
+                time.sleep(0)
+                continue
+            try:
+                result = fn()
+            except (IndexError, KeyError, ValueError):
+                if self.versions.get(table_name, 0) == version:
+                    raise
+                continue
+            if self.versions.get(table_name, 0) == version:
+                return result
+        with self.lock:
+            return fn()
+    
+    # ---- Tables ----
+    
+    def create_table(self, table_name, schema=None, options=None):
+        """Create a new table"""
+        with self.writing(table_name):
+            if table_name in self.tables or table_name in self.materialized:
+                raise ValueError(f"Table '{table_name}' already exists")
+            
+            options = options or {}
+            self.tables[table_name] = self._new_table(table_name, schema, options)
+            self._track_expiry(table_name)
+            self._log_schema('create', table_name, dict(schema) if schema else None, dict(options))
+            return True
+    
+    def _new_table(self, table_name, schema, options):
+        layout = options.get('layout', 'row')
+        limits = {}
+        for option in ('ttl', 'capped'):
+            if options.get(option) is not None:
+                if not _is_number(options[option]) or options[option] <= 0:
+                    raise ValueError(f"'{option}' must be a positive number")
+                if layout != 'row' or options.get('shards'):
+                    raise ValueError(f"'{option}' is only supported on unsharded row tables")
+                limits[option] = options[option]
+        if 'capped' in limits:
+            limits['capped'] = int(limits['capped'])
+        
+        if options.get('shards'):
+            if layout != 'row':
+                raise ValueError("Only row tables can be sharded")
+            cluster = ShardedTable.create(self, table_name, schema, options)
+            return {
+                'schema': schema or {},
+                'layout': 'sharded',
+                'shards': len(cluster.shards),
+                'shardKey': cluster.key,
+                'parallel': cluster.parallel,
+                'cluster': cluster,
+                'auto_increment': 1
+            }
+        if layout == 'columnar':
+            if not schema:
+                raise ValueError("Columnar tables require a schema")
+            return {
+                'schema': schema,
+                'layout': 'columnar',
+                'store': ColumnStore(schema),
+                'parallel': bool(options.get('parallel')),
+                'auto_increment': 1
+            }
+        if layout != 'row':
+            raise ValueError(f"Unknown table layout '{layout}'")
+        
+        table = {
+            'schema': schema or {},
+            'data': [],
+            'parallel': bool(options.get('parallel')),
+            'auto_increment': 1,
+            **limits
+        }
+        if schema:
+            # Declared fields are enforced and stored as compact rows. Saved
+            # tables without the flag predate enforcement and load as before
+            self.schemas[table_name] = Schema(table_name, schema)
+            table['strict'] = True
+        return table
+    
+    def insert(self, table_name, record):
+        """Insert a record into table"""
+        with self.writing(table_name):
+            return self._insert(table_name, record)
+    
+    def select(self, table_name, where=None, limit=None, order_by=None, order_dir='asc', offset=0, view=None,
+               fields=None):
+        """Select records from table, optionally projecting some fields.
+        
+        Results are cached until the table (a view's base table) changes.
+        """
+        source = self.materialized[table_name].table_name if table_name in self.materialized else table_name
+        if table_name in self.expiry:
+            # Rows of TTL tables drop out of results as time passes, not only on writes
+            return list(self.scan(table_name, where, limit, order_by, order_dir, offset, view, fields))
+        version = view.version if view else self.versions.get(source, 0)
+        key = QueryCache.key(table_name, where, limit, order_by, order_dir, offset, fields)
+        rows = self.cache.get(key, version)
+        if rows is not None:
+            return [dict(row) for row in rows]
+        rows = list(self.scan(table_name, where, limit, order_by, order_dir, offset, view, fields))
+        # Only cache what was read from one stable version of the table
+        if version % 2 == 0 and self.versions.get(source, 0) == version:
+            self.cache.put(key, version, rows)
+            return [dict(row) for row in rows]
+        return rows
+    
+    def scan(self, table_name, where=None, limit=None, order_by=None, order_dir='asc', offset=0, view=None,
+             fields=None):
+        """Lazily produce the records select() would return"""
+        plan, source = self.plan(table_name, where, order_by, order_dir, limit, offset, view)
+        return _project(_page(source(), order_by, order_dir, limit, offset, plan['sort']), fields)
+    
+    def update(self, table_name, where, updates):
+        """Update records in table"""
+        with self.writing(table_name):
+            return self._update(table_name, where, updates)
+    
+    def delete(self, table_name, where):
+        """Delete records from table"""
+        with self.writing(table_name):
+            return self._delete(table_name, where)
+    
+    def insert_many(self, table_name, records):
+        """Insert a batch of records with one lock, one timestamp and one index pass"""
+        with self.writing(table_name):
+            return self._insert_many(table_name, records)
+    
+    def update_many(self, table_name, records, key='id'):
+        """Update rows matching each record's `key` value with that record's fields"""
+        with self.writing(table_name):
+            return self._update_many(table_name, records, key)
+    
+    def upsert_many(self, table_name, records, key='id'):
+        """Update records whose key exists and insert the rest"""
+        with self.writing(table_name):
+            return self._upsert_many(table_name, records, key)
+    
+    def count(self, table_name, where=None, view=None):
+        """Count records in table"""
+        if table_name in self.materialized:
+            return sum(1 for _ in self.plan(table_name, where)[1]())
+        table = self._table(table_name)
+        if table.get('layout') == 'columnar':
+            if where and self._parallel_ok(table_name, len(table['store'])):
+                return self._parallel_scan(table_name, where, 'count')[0]
+            return self.read(table_name, lambda: table['store'].count(where))
+        if table.get('layout') == 'sharded':
+            return table['cluster'].count(where)
+        if not where and table_name not in self.expiry:
+            return (view or self.view(table_name)).size
+        return sum(1 for _ in self.plan(table_name, where, view=view)[1]())
+    
+    def _insert(self, table_name, record):
+        table = self._table(table_name)
+        if table.get('layout') == 'sharded':
+            return self._insert_many(table_name, [record])[0]
+        schema = self.schemas.get(table_name)
+        if schema:
+            schema.check(record)
+        elif table.get('layout') == 'columnar':
+            # Check before an id is used up
+            table['store'].check(record)
+        
+        # Add auto-increment ID if not present
+        if 'id' not in record:
+            record['id'] = table['auto_increment']
+            table['auto_increment'] += 1
+        
+        # Add timestamp
+        record['_created_at'] = time.time()
+        # Store a copy so later edits to the caller's dict can't change indexed values
+        record = dict(record)
+        
+        if table.get('layout') == 'columnar':
+            store = table['store']
+            store.append(record)
+            if self._watched(table_name):
+                # Report rows as stored, with values coerced to the column types
+                self._notify(table_name, (), [store.row(len(store) - 1)])
+        else:
+            row = schema.pack(record) if schema else record
+            table['data'].append(row)
+            self._attach(table_name, [row])
+            self._notify(table_name, (), [row])
+            self._trim(table_name)
+        return record['id']
+    
+    def _insert_many(self, table_name, records):
+        table = self._table(table_name)
+        schema = self.schemas.get(table_name)
+        for record in records:
+            if schema:
+                schema.check(record)
+            elif table.get('layout') == 'columnar':
+                table['store'].check(record)
+        now = time.time()
+        next_id = table['auto_increment']
+        ids = []
+        for record in records:
+            if 'id' not in record:
+                record['id'] = next_id
+                next_id += 1
+            record['_created_at'] = now
+            ids.append(record['id'])
+        records = [dict(record) for record in records]
+        
+        if table.get('layout') == 'columnar':
+            store = table['store']
+            start = len(store)
+            store.extend(records)
+            if self._watched(table_name):
+                self._notify(table_name, (), [store.row(i) for i in range(start, len(store))])
+        elif table.get('layout') == 'sharded':
+            # Ids come from this table so they stay unique across shards
+            table['cluster'].insert_many(records)
+        else:
+            rows = [schema.pack(record) for record in records] if schema else records
+            table['data'].extend(rows)
+            for index in self.indexes.get(table_name, {}).values():
+                index.add_many(rows)
+            self._notify(table_name, (), rows)
+            self._trim(table_name)
+        table['auto_increment'] = next_id
+        return ids
+    
+    def _update(self, table_name, where, updates):
+        table = self._table(table_name)
+        
+        if table.get('layout') == 'columnar':
+            store = table['store']
+            positions = store.positions(where)
+            previous = [store.row(i) for i in positions] if self._watched(table_name) else None
+            # Encode once, so a bad value fails before any row has changed
+            encoded = store.encode(updates)
+            now = time.time()
+            for i in positions:
+                for key, stored in encoded.items():
+                    store.columns[key].set_encoded(i, stored)
+                store.columns['_updated_at'].set(i, now)
+            if previous is not None:
+                self._notify(table_name, previous, [store.row(i) for i in positions])
+            return len(positions)
+        if table.get('layout') == 'sharded':
+            return table['cluster'].update(where, updates)
+        
+        if table_name in self.schemas:
+            self.schemas[table_name].check(updates)
+        matched = list(self.plan(table_name, where)[1]())
+        return self._install(table_name, [(record, updates) for record in matched], updates)
+    
+    def _update_many(self, table_name, records, key):
+        table = self._table(table_name)
+        if table.get('layout') == 'columnar':
+            store = table['store']
+            previous = [] if self._watched(table_name) else None
+            positions = store.update_many(key, records, time.time(), previous)
+            if previous is not None:
+                self._notify(table_name, previous, [store.row(i) for i in positions])
+            return len(positions)
+        if table.get('layout') == 'sharded':
+            return table['cluster'].update_many(records, key)
+        if table_name in self.schemas:
+            for record in records:
+                self.schemas[table_name].check(record)
+        
+        changes = {}
+        for record in records:
+            changes.setdefault(_hash_key(record.get(key)), {}).update(record)
+        
+        index = self.indexes.get(table_name, {}).get(key)
+        if index is not None:
+            candidates = index.lookup_many([change[key] for change in changes.values() if key in change])
+        else:
+            candidates = _live(table)
+        
+        pairs = []
+        for record in candidates:
+            change = changes.get(_hash_key(record.get(key, _MISSING)))
+            if change is not None:
+                pairs.append((record, change))
+        
+        changed = set()
+        for change in changes.values():
+            changed.update(change)
+        return self._install(table_name, pairs, changed)
+    
+    def _key_set(self, table_name, key):
+        """Hash keys of every value the field takes in the table"""
+        table = self._table(table_name)
+        if table.get('layout') == 'columnar':
+            return table['store'].key_set(key)
+        if table.get('layout') == 'sharded':
+            return table['cluster'].key_set(key)
+        index = self.indexes.get(table_name, {}).get(key)
+        if isinstance(index, HashIndex):
+            return set(index.buckets)
+        return {_hash_key(r.get(key, _MISSING)) for r in _live(table)}
+    
+    def _upsert_many(self, table_name, records, key):
+        existing = self._key_set(table_name, key)
+        
+        updates, inserts = [], {}
+        for record in records:
+            value = _hash_key(record.get(key, _MISSING))
+            if value in existing:
+                updates.append(record)
+            elif value is _MISSING:
+                inserts[id(record)] = record
+            else:
+                # Later records for a new key merge into the first one
+                inserts.setdefault(value, {}).update(record)
+        
+        updated = self._update_many(table_name, updates, key) if updates else 0
+        inserted = self._insert_many(table_name, list(inserts.values())) if inserts else []
+        return {'inserted': len(inserted), 'updated': updated}
+    
+    def _install(self, table_name, pairs, changed):
+        """Replace each (record, changes) pair with an updated copy of the record"""
+        if not pairs:
+            return 0
+        table = self.tables[table_name]
+        
+        # Copy-on-write: readers holding the old records keep seeing them
+        schema = self.schemas.get(table_name)
+        now = time.time()
+        versions = {}
+        for record, changes in pairs:
+            updated = dict(record)
+            updated.update(changes)
+            updated['_updated_at'] = now
+            versions[id(record)] = schema.pack(updated) if schema else updated
+        
+        matched = [record for record, _ in pairs]
+        self._detach(table_name, matched, changed)
+        self._replace(table_name, matched, versions, changed)
+        self._attach(table_name, [versions[id(r)] for r in matched], changed)
+        data = table['data']
+        if self._shared(data):
+            table['data'], table['head'] = [versions.get(id(r), r) for r in _live(table)], 0
+        else:
+            # Nobody is reading the list, so swap the rows in place
+            positions = self._positions(table_name, data, matched)
+            for record in matched:
+                i = positions.pop(id(record))
+                data[i] = versions[id(record)]
+                positions[id(data[i])] = i
+        if self._watched(table_name):
+            self._notify(table_name, matched, [versions[id(r)] for r in matched])
+        
+        return len(matched)
+    
+    def _positions(self, table_name, data, records):
+        """Row id -> position in the table's list, covering at least records"""
+        positions = self.positions.get(table_name)
+        if positions is not None:
+            # Bring it up to date with rows appended since
+            for i in range(len(positions), len(data)):
+                positions[id(data[i])] = i
+            for record in records:
+                i = positions.get(id(record))
+                if i is None or i >= len(data) or data[i] is not record:
+                    # A new list was installed since, or an id was reused
+                    positions = None
+                    break
+        if positions is None:
+            positions = self.positions[table_name] = {id(r): i for i, r in enumerate(data)}
+        return positions
+    
+    def _delete(self, table_name, where):
+        table = self._table(table_name)
+        if table.get('layout') == 'columnar':
+            store = table['store']
+            if self._watched(table_name):
+                self._notify(table_name, [store.row(i) for i in store.positions(where)], ())
+            return store.delete(where)
+        if table.get('layout') == 'sharded':
+            return table['cluster'].delete(where)
+        
+        matched = list(self.plan(table_name, where)[1]())
+        
+        if matched:
+            self._detach(table_name, matched)
+            # Rebuild once instead of deleting positions one at a time
+            doomed = {id(r) for r in matched}
+            table['data'], table['head'] = [r for r in _live(table) if id(r) not in doomed], 0
+            self._notify(table_name, matched, ())
+        
+        return len(matched)
+    
+    def replace_tables(self, tables, index_definitions=None, view_definitions=None):
+        """Swap in a whole new set of tables (load and restore).
+        
+        Views are rebuilt from the new rows; without new definitions the
+        current ones are kept.
+        """
+        if view_definitions is None:
+            view_definitions = self.view_definitions()
+        schemas = {}
+        for name, table in tables.items():
+            if table.get('layout') == 'sharded' and 'cluster' not in table:
+                table['cluster'] = ShardedTable.open(self, name, table)
+            elif table.get('layout', 'row') == 'row' and table.get('schema') and table.get('strict'):
+                schema = schemas[name] = Schema(name, table['schema'])
+                table['data'] = [schema.pack(schema.check(record)) for record in table['data']]
+        with self.writing(*(set(self.tables) | set(tables))):
+            self.tables = tables
+            self.schemas = schemas
+            self.load_index_definitions(index_definitions)
+            self.expiry = {}
+            for name in tables:
+                self._track_expiry(name)
+            if self.owns_journal:
+                self.load_view_definitions(view_definitions)
+                # Changes logged so far no longer apply on top of the last backup
+                self.journal.stop()
+        return True
+    
+    def migrate(self, table_name, add_fields=None, remove_fields=None):
+        """Add fields (with defaults) to and remove fields from every record"""
+        with self.writing(table_name):
+            table = self._table(table_name)
+            self._log_schema('migrate', table_name, dict(add_fields or {}), list(remove_fields or []))
+            
+            if table.get('layout') == 'sharded':
+                table['cluster'].migrate(add_fields, remove_fields)
+                table['schema'] = dict(table['cluster'].shards[0].tables[table_name]['schema'])
+                self._rebuild_views(table_name)
+                return True
+            
+            if table.get('layout') == 'columnar':
+                store = table['store']
+                for field, default in (add_fields or {}).items():
+                    if field not in store.columns:
+                        type_name = _infer_type(default)
+                        store.add_column(field, type_name, default)
+                        table['schema'][field] = type_name
+                for field in (remove_fields or []):
+                    store.columns.pop(field, None)
+                    table['schema'].pop(field, None)
+                self._rebuild_views(table_name)
+                return True
+            
+            migrated = []
+            for record in _live(table):
+                record = dict(record)
+                
+                # Add fields
+                for field, default in (add_fields or {}).items():
+                    if field not in record:
+                        record[field] = default
+                
+                # Remove fields
+                for field in (remove_fields or []):
+                    if field in record:
+                        del record[field]
+                
+                migrated.append(record)
+            
+            if table_name in self.schemas:
+                # The row layout follows the schema, so repack every record
+                for field, default in (add_fields or {}).items():
+                    if field not in table['schema']:
+                        table['schema'][field] = _infer_type(default) if isinstance(default, (int, float, str)) else 'any'
+                for field in (remove_fields or []):
+                    table['schema'].pop(field, None)
+                schema = self.schemas[table_name] = Schema(table_name, table['schema'])
+                migrated = [schema.pack(record) for record in migrated]
+            
+            table['data'], table['head'] = migrated, 0
+            self.rebuild_indexes(table_name)
+            self._rebuild_views(table_name)
+        return True
+    
+    # ---- Indexes ----
+    
+    def create_index(self, table_name, field, kind='hash'):
+        """Create (or rebuild) an index on a field"""
+        with self.writing(table_name):
+            table = self._table(table_name)
+            if table.get('layout') == 'columnar':
+                raise ValueError("Indexes are only supported on row tables")
+            if table.get('layout') == 'sharded':
+                # Each shard indexes its own partition and saves the definition with it
+                table['cluster'].create_index(field, kind)
+                self._log_schema('index', table_name, field, kind)
+                return True
+            if kind not in _INDEX_TYPES:
+                raise ValueError(f"Unknown index type '{kind}'")
+            
+            self._log_schema('index', table_name, field, kind)
+            index = _INDEX_TYPES[kind](field)
+            if isinstance(index, OrderedIndex):
+                index.build(_live(table))
+            else:
+                for record in _live(table):
+                    index.add(record)
+            self.indexes.setdefault(table_name, {})[field] = index
+            return True
+    
+    def drop_index(self, table_name, field):
+        """Remove the index on a field"""
+        with self.writing(table_name):
+            table = self._table(table_name)
+            self._log_schema('drop_index', table_name, field)
+            if table.get('layout') == 'sharded':
+                return table['cluster'].drop_index(field)
+            return self.indexes.get(table_name, {}).pop(field, None) is not None
+    
+    def rebuild_indexes(self, table_name=None):
+        """Rebuild indexes after rows were changed outside insert/update/delete"""
+        names = [table_name] if table_name else list(self.indexes)
+        for name in names:
+            if name not in self.tables:
+                self.indexes.pop(name, None)
+                continue
+            for field, index in list(self.indexes.get(name, {}).items()):
+                self.create_index(name, field, index.kind)
+    
+    def index_definitions(self):
+        return {
+            name: {field: index.kind for field, index in indexes.items()}
+            for name, indexes in self.indexes.items() if indexes
+        }
+    
+    def load_index_definitions(self, definitions):
+        self.indexes = {}
+        for name, fields in (definitions or {}).items():
+            if name in self.tables:
+                for field, kind in fields.items():
+                    self.create_index(name, field, kind)
+    
+    def _attach(self, table_name, records, fields=None):
+        """Add records to the table's indexes"""
+        for field, index in self.indexes.get(table_name, {}).items():
+            if fields is None or field in fields:
+                for record in records:
+                    index.add(record)
+    
+    def _detach(self, table_name, records, fields=None):
+        """Remove records from the table's indexes"""
+        for field, index in self.indexes.get(table_name, {}).items():
+            if fields is None or field in fields:
+                for record in records:
+                    index.remove(record)
+    
+    def _replace(self, table_name, records, versions, changed):
+        """Point indexes on unchanged fields at the new record versions"""
+        for field, index in self.indexes.get(table_name, {}).items():
+            if field not in changed:
+                for record in records:
+                    index.replace(record, versions[id(record)])
+
+    # ---- Materialized views ----
+    
+    def _watched(self, table_name):
+        """True when row changes to the table must be reported via _notify"""
+        return self.journal.enabled or table_name in self.watchers or table_name in self.expiry
+    
+    def _notify(self, table_name, removed, added):
+        """Report changed rows (old versions, new versions) to the journal and views"""
+        if self.journal.enabled:
+            if added:
+                self.journal.record('put', table_name, list(added))
+            elif removed:
+                self.journal.record('delete', table_name, [r.get('id') for r in removed])
+        for view in self.watchers.get(table_name, ()):
+            view.apply(removed, added)
+        if table_name in self.expiry:
+            self.expiry[table_name].apply(removed, added)
+    
+    def create_view(self, name, table_name, group_by, aggregates=None, where=None):
+        """Create a group-by view over a table that writes keep up to date"""
+        with self.writing(table_name):
+            self._table(table_name)
+            if name in self.tables or name in self.materialized:
+                raise ValueError(f"Table '{name}' already exists")
+            view = AggregateView(name, table_name, group_by, aggregates, where)
+            view.build(self._records(table_name))
+            self.materialized[name] = view
+            self.watchers.setdefault(table_name, []).append(view)
+            self._log_schema('create_view', name, table_name, view.group_by, view.aggregates, where)
+            return True
+    
+    def drop_view(self, name):
+        view = self.materialized.get(name)
+        if view is None:
+            raise ValueError(f"View '{name}' does not exist")
+        with self.writing(view.table_name):
+            del self.materialized[name]
+            self.watchers[view.table_name].remove(view)
+            if not self.watchers[view.table_name]:
+                del self.watchers[view.table_name]
+            self._log_schema('drop_view', name)
+        return True
+    
+    def view_definitions(self):
+        if not self.owns_journal:
+            # Shards share their parent's views; the parent saves them
+            return {}
+        return {name: view.definition() for name, view in self.materialized.items()}
+    
+    def load_view_definitions(self, definitions):
+        """Replace every view, building each from its table's current rows"""
+        self.materialized.clear()
+        self.watchers.clear()
+        for name, definition in (definitions or {}).items():
+            if definition['table'] in self.tables:
+                self.create_view(name, definition['table'], definition['groupBy'],
+                                 definition['aggregates'], definition.get('where'))
+    
+    def _rebuild_views(self, table_name):
+        # Shards see only part of the table; their parent rebuilds its views
+        if self.owns_journal:
+            for view in self.watchers.get(table_name, ()):
+                view.build(self._records(table_name))
+        if table_name in self.expiry:
+            self.expiry[table_name].build(_live(self.tables[table_name]))
+    
+    def _view_plan(self, view, where, order_by, limit, offset):
+        plan, source = view.plan(where, order_by, limit, offset)
+        return plan, lambda: iter(self.read(view.table_name, lambda: list(source())))
+    
+    # ---- Expiry and capped tables ----
+    
+    def _track_expiry(self, table_name):
+        ttl = self.tables[table_name].get('ttl')
+        if ttl:
+            queue = self.expiry[table_name] = ExpiryQueue(ttl)
+            queue.build(_live(self.tables[table_name]))
+            _watch_expiry(self)
+    
+    def _trim(self, table_name):
+        """Evict expired rows, then the oldest rows over a capped table's limit"""
+        table = self.tables[table_name]
+        if table_name in self.expiry:
+            expired = self.expiry[table_name].due(time.time())
+            if expired:
+                self._evict(table_name, expired)
+        capped = table.get('capped')
+        head = table.get('head', 0)
+        if capped and len(table['data']) - head > capped:
+            self._evict(table_name, table['data'][head:len(table['data']) - capped])
+    
+    def _evict(self, table_name, records):
+        """Delete known rows without a where clause.
+        
+        Rows at the front of the table (the oldest, as in capped tables and
+        TTL tables without updates) are dropped by moving the head, and the
+        list is only compacted once most of it is dead; other rows are
+        removed in one rebuild.
+        """
+        table = self.tables[table_name]
+        data, head = table['data'], table.get('head', 0)
+        doomed = {id(r) for r in records}
+        end = head
+        while end < len(data) and id(data[end]) in doomed:
+            end += 1
+        self._detach(table_name, records)
+        if end - head == len(doomed):
+            if end * 2 > len(data):
+                table['data'], table['head'] = data[end:], 0
+            else:
+                table['head'] = end
+        else:
+            table['data'], table['head'] = [r for r in islice(data, head, None) if id(r) not in doomed], 0
+        self._notify(table_name, records, ())
+    
+    def _unexpired(self, table_name):
+        """Test for rows of a TTL table whose deadline hasn't passed yet.
+        
+        Expired rows stay stored until the next sweep, so reads skip them.
+        """
+        deadline, now = self.expiry[table_name].deadline, time.time()
+        return lambda record: deadline(record) > now
+    
+    def expire(self, table_name=None):
+        """Delete rows whose TTL has passed now rather than at the next sweep"""
+        names = [table_name] if table_name else list(self.expiry)
+        removed = 0
+        for name in names:
+            self._table(name)
+            if name not in self.expiry:
+                continue
+            with self.writing(name):
+                before = len(self.tables[name]['data']) - self.tables[name].get('head', 0)
+                self._trim(name)
+                removed += before - (len(self.tables[name]['data']) - self.tables[name].get('head', 0))
+        return removed
+    
+    # ---- Parallel scans ----
+    
+    def _parallel_ok(self, table_name, size):
+        """True for tables that opted into parallel scans and are big enough to gain"""
+        table = self.tables[table_name]
+        return bool(table.get('parallel')) and table.get('layout') != 'sharded' and size >= _PARALLEL_MIN_ROWS
+    
+    def _export(self, table_name, view=None):
+        """Export of a row table as of the view, or of a columnar table now; reused until the table changes"""
+        table = self.tables[table_name]
+        export = self.exports.get(table_name)
+        if table.get('layout') == 'columnar':
+            with self.lock:
+                version = self.versions.get(table_name, 0)
+                if export is None or export.version != version:
+                    export = self.exports[table_name] = _Export(version, store=table['store'])
+            return export
+        view = view or self.view(table_name)
+        if export is None or export.version != view.version:
+            # Chunks whose rows are unchanged are carried over, not rewritten
+            export = self.exports[table_name] = _Export(view.version, rows=view.rows(), previous=export)
+        return export
+    
+    def _parallel_scan(self, table_name, where=None, func=None, field=None, view=None):
+        """Test the table's rows chunk by chunk in the process pool.
+        
+        Returns (export, matching positions), or (count, value) for an
+        aggregate func ('count', 'sum', 'avg', 'max' or 'min'); chunks are
+        merged in table order.
+        """
+        export = self._export(table_name, view)
+        pool = _pool()
+        futures = [
+            pool.submit(_scan_chunk, path, export.layout, start, end, where, func, field)
+            for path, start, end in export.tasks()
+        ]
+        results = [future.result() for future in futures]
+        if func is None:
+            return export, [i for chunk in results for i in chunk]
+        count, value = 0, None
+        for chunk_count, chunk_value in results:
+            count += chunk_count
+            if chunk_value is None:
+                continue
+            if value is None:
+                value = chunk_value
+            elif func in ('sum', 'avg'):
+                value += chunk_value
+            elif func == 'max':
+                value = chunk_value if chunk_value > value else value
+            elif func == 'min':
+                value = chunk_value if chunk_value < value else value
+        return count, value
+    
+    def _parallel_rows(self, table_name, view, where):
+        _, positions = self._parallel_scan(table_name, where, view=view)
+        return [view.data[view.start + i] for i in positions]
+    
+    def _parallel_columns(self, table_name, where):
+        export, positions = self._parallel_scan(table_name, where)
+        store = self.tables[table_name]['store']
+        
+        def rows():
+            # Positions only hold for the store version that was exported
+            current = positions if self.versions.get(table_name, 0) == export.version else store.positions(where)
+            return [store.row(i) for i in current]
+        return self.read(table_name, rows)
+    
+    # ---- Query planning ----
+    
+    def plan(self, table_name, where=None, order_by=None, order_dir='asc', limit=None, offset=0, view=None):
+        """Pick the cheapest access path for a query.
+        
+        Returns (plan, source): plan describes the choice, source() yields
+        the matching rows in plan order. Reads come from `view` (the current
+        state of the table by default).
+        """
+        if table_name in self.materialized:
+            return self._view_plan(self.materialized[table_name], where, order_by, limit, offset)
+        table = self._table(table_name)
+        if table.get('layout') == 'sharded':
+            return table['cluster'].plan(where, order_by, order_dir, limit, offset)
+        conditions = _normalize_where(where)
+        descending = str(order_dir).lower() == 'desc'
+        needed = (offset or 0) + limit if limit else None
+        
+        if table.get('layout') == 'columnar':
+            store = table['store']
+            total = len(store)
+            estimated = total
+            for field, op, value in conditions:
+                estimated *= _DEFAULT_SELECTIVITY.get(op, 0.33)
+            choice = {'strategy': 'column_scan', 'indexes': [], 'cost': total, 'visited': total}
+            fetch = lambda: iter(self.read(table_name, lambda: [store.row(i) for i in store.positions(where)]))
+            if conditions and (order_by or not needed) and self._parallel_ok(table_name, total):
+                choice = dict(choice, strategy='parallel_scan')
+                fetch = lambda: iter(self._parallel_columns(table_name, where))
+            return self._describe(table_name, choice, [choice], total, estimated, order_by, limit, offset), fetch
+        
+        view = view or self.view(table_name)
+        total = view.size
+        indexes = self.indexes.get(table_name, {})
+        
+        # Statistics: exact candidate counts from indexes, distinct counts or guesses otherwise
+        paths = []
+        estimated = float(total)
+        for field, op, value in conditions:
+            index = indexes.get(field)
+            rows = index.estimate(op, value) if index is not None else None
+            if rows is not None:
+                paths.append({
+                    'field': field, 'op': op, 'rows': rows,
+                    'fetch': lambda index=index, op=op, value=value: self._indexed(
+                        table_name, view, lambda: list(index.fetch(op, value)))
+                })
+                selectivity = rows / total if total else 0
+            elif index is not None and op == 'eq' and index.distinct:
+                selectivity = 1 / index.distinct
+            else:
+                selectivity = _DEFAULT_SELECTIVITY.get(op, 0.33)
+            estimated *= selectivity
+        
+        sort_cost = _sort_cost(estimated) if order_by else 0
+        unsorted_needed = None if order_by else needed
+        
+        visited = _visited(total, estimated, unsorted_needed)
+        choices = [{
+            'strategy': 'full_scan', 'indexes': [], 'visited': visited,
+            'cost': visited + sort_cost, 'fetch': view.rows
+        }]
+        
+        for path in paths:
+            visited = _visited(path['rows'], estimated, unsorted_needed)
+            choices.append({
+                'strategy': 'index_lookup' if path['op'] in ('eq', 'in') else 'range_scan',
+                'indexes': [path['field']], 'visited': visited,
+                'cost': _lookup_cost(total) + visited + sort_cost, 'fetch': path['fetch']
+            })
+        
+        if len(paths) > 1:
+            overlap = float(total)
+            for path in paths:
+                overlap *= path['rows'] / total
+            choices.append({
+                'strategy': 'index_intersection', 'indexes': [path['field'] for path in paths],
+                'visited': overlap,
+                'cost': len(paths) * _lookup_cost(total) + sum(path['rows'] for path in paths) * _SET_COST + overlap + sort_cost,
+                'fetch': lambda: _intersect(paths)
+            })
+        
+        index = indexes.get(order_by) if order_by else None
+        if isinstance(index, OrderedIndex):
+            start, end = self._order_window(index, conditions)
+            window = max(end - start, 0)
+            visited = _visited(window, estimated, needed)
+            choices.append({
+                'strategy': 'index_order', 'indexes': [order_by], 'visited': visited,
+                'cost': _lookup_cost(total) + visited, 'ordered': True,
+                'fetch': lambda: self._indexed(
+                    table_name, view,
+                    lambda: self._ordered_scan(index, start, end, descending),
+                    lambda: sorted(view.rows(), key=lambda r: _sort_key(r.get(order_by, _MISSING)), reverse=descending))
+            })
+        
+        best = min(choices, key=lambda choice: choice['cost'])
+        if best['strategy'] == 'full_scan' and conditions and (order_by or not needed) \
+                and self._parallel_ok(table_name, total):
+            best = dict(best, strategy='parallel_scan', fetch=lambda: self._parallel_rows(table_name, view, where))
+        plan = self._describe(table_name, best, choices, total, estimated, order_by, limit, offset)
+        fetch = best['fetch']
+        if table_name in self.expiry:
+            fetch_all, keep = fetch, self._unexpired(table_name)
+            fetch = lambda: filter(keep, fetch_all())
+        schema = self.schemas.get(table_name)
+        if schema:
+            # Rows read from a view taken before a migration keep their old layout
+            row_type, match = schema.row_type, schema.row_type.matcher(conditions)
+            return plan, lambda: (r for r in fetch() if (match(r) if type(r) is row_type else _matches(r, conditions)))
+        return plan, lambda: (r for r in fetch() if _matches(r, conditions))
+    
+    def _describe(self, table_name, best, choices, total, estimated, order_by, limit, offset):
+        """Plan summary returned by explain()"""
+        returned = max(estimated - (offset or 0), 0)
+        if limit:
+            returned = min(returned, limit)
+        return {
+            'table': table_name,
+            'strategy': best['strategy'],
+            'indexes': best['indexes'],
+            'tableRows': total,
+            'matchingRows': round(estimated),
+            'estimatedRows': round(returned),
+            'scannedRows': round(best['visited']),
+            'cost': round(best['cost'], 2),
+            'sort': bool(order_by) and not best.get('ordered', False),
+            'considered': [
+                {'strategy': c['strategy'], 'indexes': c['indexes'], 'cost': round(c['cost'], 2)}
+                for c in choices
+            ]
+        }
+    
+    def _order_window(self, index, conditions):
+        """Index positions allowed by conditions on the index field"""
+        start, end = 0, len(index.records)
+        for field, op, value in conditions:
+            if field == index.field and op in _RANGE_OPERATORS + ('eq',):
+                low, high = index.bounds(op, value) if op != 'eq' else index.bounds('between', [value, value])
+                start, end = max(start, low), min(end, high)
+        return start, end
+    
+    def _ordered_scan(self, index, start, end, descending):
+        records = index.records[start:end]
+        if descending:
+            records.reverse()
+        return records
+    
+    def _indexed(self, table_name, view, fetch, fallback=None):
+        """Index results, or a scan of the view if a writer touched the table since it was taken"""
+        rows = fetch()
+        if self.versions.get(table_name, 0) == view.version:
+            return rows
+        return fallback() if fallback else view.rows()
+    
+    # ---- Full-text search ----
+    
+    def search(self, table_name, field, terms, options=None):
+        """Records whose text field contains the terms, best BM25 score first.
+        
+        options: prefix (terms match the start of words), all (every term
+        must match), where (extra conditions) and limit. Fields without a
+        'text' index are indexed on the fly.
+        """
+        options = options or {}
+        if table_name in self.materialized:
+            return _search_rows(self.scan(table_name), field, terms, options)
+        table = self._table(table_name)
+        if table.get('layout') == 'sharded':
+            return table['cluster'].search(field, terms, options)
+        index = self.indexes.get(table_name, {}).get(field)
+        if not isinstance(index, TextIndex):
+            return _search_rows(self.scan(table_name), field, terms, options)
+        keep = self._unexpired(table_name) if table_name in self.expiry else None
+        return self.read(table_name, lambda: _search(index, terms, options, keep))
+    
+    # ---- Persistence ----
+    
+    def save(self):
+        """Save database to file"""
+        with self.lock:
+            data = {
+                'name': self.name,
+                'tables': _serialize_tables(self.tables),
+                'indexes': self.index_definitions(),
+                'views': self.view_definitions()
+            }
+            with open(self.file_path, 'w') as f:
+                json.dump(data, f, indent=2)
+            for table in self.tables.values():
+                if table.get('layout') == 'sharded':
+                    table['cluster'].save()
+        return True
+    
+    def load(self):
+        """Load database from file"""
+        if os.path.exists(self.file_path):
+            with open(self.file_path, 'r') as f:
+                data = json.load(f)
+            self.replace_tables(_deserialize_tables(data.get('tables', {})), data.get('indexes'), data.get('views', {}))
+            return True
+        return False
+    
+    # ---- Backups ----
+    
+    def _log_schema(self, op, table_name, *args):
+        """Journal a schema change; shards leave these to their parent database"""
+        if self.owns_journal:
+            self.journal.record(op, table_name, *args)
+    
+    def capture_tables(self):
+        """Frozen copy of every table and the index definitions.
+        
+        Row lists are copied by reference only: records are never changed
+        in place, so the copy stays valid while writers carry on.
+        """
+        with self.lock:
+            tables = {}
+            for name, table in self.tables.items():
+                if table.get('layout') == 'columnar':
+                    table = dict(table, store=table['store'].copy())
+                elif table.get('layout') == 'sharded':
+                    table = dict(table, frozen=table['cluster'].capture())
+                else:
+                    table = dict(table, data=list(_live(table)), head=0)
+                tables[name] = table
+            return tables, self.index_definitions()
+    
+    def capture(self, incremental=False):
+        """Snapshot for a full backup.
+        
+        Starts a new incremental backup chain when asked to, or when one is
+        already running; otherwise the journal stays off and the snapshot
+        carries no lsn, so no incremental backup can be applied on top of it.
+        """
+        with self.lock:
+            tables, indexes = self.capture_tables()
+            views = self.view_definitions()
+            lsn = self.journal.start() if incremental or self.journal.enabled else None
+        return {'name': self.name, 'tables': tables, 'indexes': indexes, 'views': views, 'lsn': lsn}
+    
+    def changes(self):
+        """Journal entries since the previous backup, for an incremental backup"""
+        with self.lock:
+            if not self.journal.enabled:
+                raise ValueError("Take a full backup with incremental=true before an incremental one")
+            return self.journal.drain()
+    
+    def _records(self, table_name):
+        table = self._table(table_name)
+        if table.get('layout') == 'columnar':
+            store = table['store']
+            return [store.row(i) for i in range(len(store))]
+        if table.get('layout') == 'sharded':
+            return table['cluster'].records()
+        return [dict(record) for record in _live(table)]
+    
+    def _load_rows(self, table_name, records):
+        """Replace a table's contents, keeping its schema and indexes"""
+        with self.writing(table_name):
+            table = self._table(table_name)
+            ids = [record['id'] for record in records if _is_int(record.get('id'))]
+            table['auto_increment'] = max([table['auto_increment']] + [i + 1 for i in ids])
+            if table.get('layout') == 'columnar':
+                store = table['store'].emptied()
+                store.extend(records)
+                table['store'] = store
+            elif table.get('layout') == 'sharded':
+                table['cluster'].load_rows(records)
+            else:
+                schema = self.schemas.get(table_name)
+                table['data'] = [schema.pack(record) for record in records] if schema else records
+                table['head'] = 0
+                self.rebuild_indexes(table_name)
+            self._rebuild_views(table_name)
+    
+    def replay(self, entries, until=None):
+        """Re-apply journal entries, stopping after the `until` timestamp"""
+        pending = {}
+        
+        def rows(name):
+            if name not in pending:
+                pending[name] = {_hash_key(r.get('id')): r for r in self._records(name)}
+            return pending[name]
+        
+        def flush(name):
+            if name in pending:
+                self._load_rows(name, list(pending.pop(name).values()))
+        
+        with self.lock:
+            for entry in entries:
+                if until is not None and entry['time'] > until:
+                    break
+                op, name, args = entry['op'], entry['table'], entry['args']
+                if op == 'put':
+                    records = rows(name)
+                    for record in args[0]:
+                        records[_hash_key(record.get('id'))] = record
+                elif op == 'delete':
+                    records = rows(name)
+                    for record_id in args[0]:
+                        records.pop(_hash_key(record_id), None)
+                else:
+                    flush(name)
+                    if op == 'create_view':
+                        flush(args[0])
+                        self.create_view(name, *args)
+                    elif op == 'drop_view':
+                        self.drop_view(name)
+                    elif op == 'create':
+                        self.create_table(name, *args)
+                    elif op == 'migrate':
+                        self.migrate(name, *args)
+                    elif op == 'index':
+                        self.create_index(name, *args)
+                    elif op == 'drop_index':
+                        self.drop_index(name, *args)
+            for name in list(pending):
+                flush(name)
+        return True
+
+# ============ Sharding ============
+
+# Process pool for parallel shard queries, started on first use
+_shard_pool = None
+_shard_pool_lock = threading.Lock()
+
+# Shard databases loaded by pool workers, keyed by file path
+_worker_shards = {}
+
+def _pool():
+    global _shard_pool
+    with _shard_pool_lock:
+        if _shard_pool is None:
+            _shard_pool = ProcessPoolExecutor()
+        return _shard_pool
+
+def _query_shard_file(path, table_name, where, limit, order_by, order_dir):
+    """Pool worker: run a query against a saved shard, reloading it when the file changes"""
+    mtime = os.stat(path).st_mtime_ns
+    cached = _worker_shards.get(path)
+    if cached is None or cached[0] != mtime:
+        db = ZenDB(path)
+        db.file_path = path
+        db.load()
+        cached = _worker_shards[path] = (mtime, db)
+    return cached[1].select(table_name, where, limit, order_by, order_dir)
+
+def _shard_hash(value):
+    """Hash of a shard key that is stable across processes and runs"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value == int(value):
+        # 1, 1.0 and True compare equal, so they must land on the same shard
+        value = int(value)
+    elif isinstance(value, bool):
+        value = int(value)
+    return zlib.crc32(json.dumps(value, sort_keys=True, default=str).encode())
+
+
+class ShardedTable:
+    """Row table hash-partitioned on one field across shard databases.
+
+    Each shard is a ZenDB holding one partition in its own file, so a save
+    only rewrites the shards that changed. Queries go to the shards the
+    where clause can reach and their results are merged in order; with
+    `parallel` set, saved shards are queried in a process pool.
+    """
+    def __init__(self, db_name, table_name, count, key, parallel=False, parent=None):
+        self.table_name = table_name
+        self.key = key
+        self.parallel = parallel
+        self.shards = [ZenDB(f"{db_name}.{table_name}.shard{i}", parent) for i in range(count)]
+        # Table version of each shard when it was last written to disk
+        self.saved = [None] * count
+
+    @classmethod
+    def create(cls, db, table_name, schema, options):
+        count = int(options.get('shards', 0))
+        if count < 1:
+            raise ValueError("'shards' must be a positive number")
+        cluster = cls(db.name, table_name, count, options.get('shardKey', 'id'), bool(options.get('parallel')), db)
+        for shard in cluster.shards:
+            shard.create_table(table_name, schema)
+        return cluster
+
+    @classmethod
+    def open(cls, db, table_name, table):
+        """Attach to a table's shards: inline partitions from a backup, else the shard files"""
+        cluster = cls(db.name, table_name, table['shards'], table['shardKey'], table.get('parallel', False), db)
+        partitions = table.pop('partitions', None)
+        for i, shard in enumerate(cluster.shards):
+            if partitions:
+                shard.replace_tables(_deserialize_tables(partitions[i]['tables']), partitions[i].get('indexes'))
+            elif shard.load():
+                cluster.saved[i] = shard.versions.get(table_name, 0)
+            else:
+                shard.create_table(table_name, table.get('schema'))
+        return cluster
+
+    def shard_of(self, value):
+        return _shard_hash(value) % len(self.shards)
+
+    def route(self, where):
+        """Shards that can hold rows matching a where clause"""
+        for field, op, value in _normalize_where(where):
+            if field == self.key:
+                if op == 'eq':
+                    return [self.shard_of(value)]
+                if op == 'in' and isinstance(value, _VALUE_LISTS):
+                    return sorted({self.shard_of(v) for v in value})
+        return range(len(self.shards))
+
+    def _partition(self, records):
+        groups = {}
+        for record in records:
+            groups.setdefault(self.shard_of(record.get(self.key)), []).append(record)
+        return groups
+
+    # ---- Writes ----
+
+    def insert_many(self, records):
+        schema = self.shards[0].schemas.get(self.table_name)
+        if schema:
+            # Validate the whole batch before any shard takes part of it
+            for record in records:
+                schema.check(record)
+        for i, group in self._partition(records).items():
+            self.shards[i].insert_many(self.table_name, group)
+
+    def update(self, where, updates):
+        if self.key in updates:
+            raise ValueError(f"Cannot update shard key '{self.key}'")
+        return sum(self.shards[i].update(self.table_name, where, updates) for i in self.route(where))
+
+    def update_many(self, records, key):
+        if key != self.key:
+            if any(self.key in record for record in records):
+                raise ValueError(f"Cannot update shard key '{self.key}'")
+            return sum(shard.update_many(self.table_name, records, key) for shard in self.shards)
+        return sum(
+            self.shards[i].update_many(self.table_name, group, key)
+            for i, group in self._partition(records).items()
+        )
+
+    def key_set(self, key):
+        keys = set()
+        for shard in self.shards:
+            with shard.lock:
+                keys |= shard._key_set(self.table_name, key)
+        return keys
+
+    def delete(self, where):
+        return sum(self.shards[i].delete(self.table_name, where) for i in self.route(where))
+
+    def create_index(self, field, kind):
+        for shard in self.shards:
+            shard.create_index(self.table_name, field, kind)
+        return True
+
+    def drop_index(self, field):
+        return any([shard.drop_index(self.table_name, field) for shard in self.shards])
+
+    def migrate(self, add_fields, remove_fields):
+        for shard in self.shards:
+            shard.migrate(self.table_name, add_fields, remove_fields)
+        return True
+
+    # ---- Reads ----
+
+    def count(self, where=None):
+        return sum(self.shards[i].count(self.table_name, where) for i in self.route(where))
+
+    def _clean(self, i):
+        return self.saved[i] == self.shards[i].versions.get(self.table_name, 0)
+
+    def _results(self, ids, where, limit, order_by, order_dir):
+        """Per-shard result streams, each already ordered and limited"""
+        name = self.table_name
+        futures = {}
+        if self.parallel and len(ids) > 1:
+            for i in ids:
+                if self._clean(i):
+                    futures[i] = _pool().submit(_query_shard_file, os.path.abspath(self.shards[i].file_path),
+                                                name, where, limit, order_by, order_dir)
+        streams = []
+        for i in ids:
+            if i in futures:
+                streams.append(futures[i].result())
+            else:
+                streams.append(self.shards[i].scan(name, where, limit, order_by, order_dir))
+        return streams
+
+    def plan(self, where=None, order_by=None, order_dir='asc', limit=None, offset=0):
+        ids = list(self.route(where))
+        needed = (offset or 0) + limit if limit else None
+        plans = [self.shards[i].plan(self.table_name, where, order_by, order_dir, needed)[0] for i in ids]
+        plan = {
+            'table': self.table_name,
+            'strategy': 'shard_scan',
+            'indexes': sorted({field for p in plans for field in p['indexes']}),
+            'tableRows': sum(shard.view(self.table_name).size for shard in self.shards),
+            'matchingRows': sum(p['matchingRows'] for p in plans),
+            'estimatedRows': sum(p['estimatedRows'] for p in plans),
+            'scannedRows': sum(p['scannedRows'] for p in plans),
+            'cost': round(sum(p['cost'] for p in plans), 2),
+            'sort': False,
+            'considered': [],
+            'shards': ids,
+            'shardCount': len(self.shards),
+            'shardPlans': plans,
+        }
+        if needed is not None:
+            plan['estimatedRows'] = min(plan['estimatedRows'], limit)
+
+        def source():
+            streams = self._results(ids, where, needed, order_by, order_dir)
+            if order_by:
+                key = lambda r: _sort_key(r.get(order_by, _MISSING))
+                return heapq.merge(*streams, key=key, reverse=str(order_dir).lower() == 'desc')
+            return chain.from_iterable(streams)
+        return plan, source
+
+    def search(self, field, terms, options):
+        """Merge each shard's ranking; scores use per-shard term statistics"""
+        results = [shard.search(self.table_name, field, terms, options) for shard in self.shards]
+        merged = heapq.merge(*results, key=lambda row: -row['_score'])
+        return list(islice(merged, options.get('limit')))
+
+    # ---- Persistence ----
+
+    def save(self):
+        """Write the shards changed since their last save"""
+        for i, shard in enumerate(self.shards):
+            with shard.lock:
+                version = shard.versions.get(self.table_name, 0)
+                if self.saved[i] != version:
+                    shard.save()
+                    self.saved[i] = version
+        return True
+
+    def capture(self):
+        """Frozen copies of every shard, for self-contained backups"""
+        return [shard.capture_tables() for shard in self.shards]
     
-    def create_table(self, table_name, schema=None):
-        """Create a new table"""
-        if table_name in self.tables:
-            raise ValueError(f"Table '{table_name}' already exists")
+    def records(self):
+        return [record for shard in self.shards for record in shard._records(self.table_name)]
+    
+    def load_rows(self, records):
+        groups = self._partition(records)
+        for i, shard in enumerate(self.shards):
+            shard._load_rows(self.table_name, groups.get(i, []))
+
+# ============ Parallel Scans ============
+
+# Tables created with the `parallel` option are scanned by the process pool
+# once they reach _PARALLEL_MIN_ROWS. Chunks have a fixed size (a multiple
+# of 8, so they start on null bitmap bytes) and are merged in table order,
+# so results and float sums come out the same whatever the number of workers.
+_PARALLEL_MIN_ROWS = 50000
+_PARALLEL_CHUNK = 25000
+
+# Columnar exports mapped by this pool worker and the row chunks it has
+# parsed, both keyed by file path
+_worker_exports = {}
+_worker_chunks = {}
+_WORKER_CACHED_CHUNKS = 64
+
+def _temp_file(owner):
+    """New scan file, removed once its owner is dropped or the process exits"""
+    fd, path = tempfile.mkstemp(prefix='zendb-', suffix='.scan')
+    weakref.finalize(owner, os.remove, path)
+    return os.fdopen(fd, 'wb'), path
+
+class _RowChunk:
+    """Consecutive rows of a row table written to their own file as a JSON array.
+    
+    Keeps the exported row objects: records are replaced rather than
+    changed in place, so a later export whose rows are the same objects
+    can reuse the file as it is.
+    """
+    def __init__(self, rows):
+        self.rows = tuple(rows)
+        f, self.path = _temp_file(self)
+        with f:
+            f.write(json.dumps([dict(row.items()) for row in self.rows], separators=(',', ':'),
+                               default=str).encode('utf-8'))
+    
+    def matches(self, rows, start):
+        end = start + len(self.rows)
+        return end <= len(rows) and all(map(operator.is_, self.rows, islice(rows, start, end)))
+
+def _row_chunks(rows, previous=()):
+    """Chunks covering rows, reusing previous chunks whose rows are unchanged.
+    
+    Only the rows around writes are serialized again; chunks under half
+    the usual size are merged into the rewritten rows instead of reused.
+    """
+    reusable = {id(chunk.rows[0]): chunk for chunk in previous if len(chunk.rows) >= _PARALLEL_CHUNK // 2}
+    chunks, pending = [], []
+    i = 0
+    while i < len(rows):
+        chunk = reusable.get(id(rows[i]))
+        if chunk is not None and chunk.matches(rows, i):
+            if pending:
+                chunks.append(_RowChunk(pending))
+                pending = []
+            chunks.append(chunk)
+            i += len(chunk.rows)
+            continue
+        pending.append(rows[i])
+        i += 1
+        if len(pending) == _PARALLEL_CHUNK:
+            chunks.append(_RowChunk(pending))
+            pending = []
+    if pending:
+        chunks.append(_RowChunk(pending))
+    return chunks
+
+class _Export:
+    """One version of a table written to files that pool workers read.
+    
+    Columnar tables write their value arrays and null bitmaps as raw bytes
+    to one file, which workers mmap and query in place with the same code
+    as the parent. Row tables write each chunk to its own file as a JSON
+    array; unchanged chunks are shared with the previous export, and
+    workers parse a chunk once and keep it for as long as it is in use.
+    Only file paths and `layout` travel with each task, never the rows.
+    """
+    def __init__(self, version, rows=None, store=None, previous=None):
+        self.version = version
+        if store is not None:
+            f, self.path = _temp_file(self)
+            with f:
+                self.layout = self._write_columns(f, store)
+            self.chunks = None
+        else:
+            self.path = None
+            self.chunks = _row_chunks(list(rows), previous.chunks if previous and previous.chunks else ())
+            self.layout = {'kind': 'rows', 'rows': sum(len(chunk.rows) for chunk in self.chunks)}
+        self.size = self.layout['rows']
+    
+    def tasks(self):
+        """(path, start, end) of each range of rows a worker scans"""
+        if self.chunks is None:
+            return [(self.path, start, min(start + _PARALLEL_CHUNK, self.size))
+                    for start in range(0, self.size, _PARALLEL_CHUNK)]
+        tasks, start = [], 0
+        for chunk in self.chunks:
+            tasks.append((chunk.path, start, start + len(chunk.rows)))
+            start += len(chunk.rows)
+        return tasks
+    
+    def _write_columns(self, f, store):
+        columns = {}
+        for field, column in store.columns.items():
+            spec = {'type': column.type_name, 'typecode': column.values.typecode}
+            spec['values'] = _write_segment(f, column.values.tobytes())
+            spec['nulls'] = _write_segment(f, bytes(column.nulls))
+            if column.typecode is None:
+                spec['dictionary'] = _write_segment(f, json.dumps(column.dictionary).encode('utf-8'))
+            columns[field] = spec
+        return {'kind': 'columnar', 'rows': len(store), 'columns': columns}
+
+def _write_segment(f, data):
+    start = f.tell()
+    f.write(data)
+    return [start, len(data)]
+
+def _open_export(path, layout):
+    """Pool worker: map a columnar export once, as Columns over the mapping"""
+    cached = _worker_exports.get(path)
+    if cached is not None:
+        return cached
+    if len(_worker_exports) >= 8:
+        del _worker_exports[next(iter(_worker_exports))]
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    segment = lambda spec: view[spec[0]:spec[0] + spec[1]]
+    source = {}
+    for field, spec in layout['columns'].items():
+        column = source[field] = Column(spec['type'])
+        column.values = segment(spec['values']).cast(spec['typecode'])
+        column.nulls = segment(spec['nulls'])
+        if 'dictionary' in spec:
+            column.dictionary = json.loads(bytes(segment(spec['dictionary'])))
+            column.codes = {value: code for code, value in enumerate(column.dictionary)}
+    _worker_exports[path] = source
+    return source
+
+def _chunk_store(columns, start, end):
+    """ColumnStore over rows start..end of mapped columns, without copying them"""
+    store = ColumnStore({})
+    store.columns = {}
+    for field, column in columns.items():
+        chunk = Column(column.type_name)
+        chunk.values = column.values[start:end]
+        chunk.nulls = column.nulls[start >> 3:(end + 7) >> 3]
+        chunk.null_count = bin(int.from_bytes(chunk.nulls, 'little')).count('1')
+        chunk.dictionary, chunk.codes = column.dictionary, column.codes
+        store.columns[field] = chunk
+    return store
+
+def _row_chunk(path):
+    """Pool worker: records of a row chunk file, parsed once"""
+    records = _worker_chunks.get(path)
+    if records is None:
+        if len(_worker_chunks) >= _WORKER_CACHED_CHUNKS:
+            del _worker_chunks[next(iter(_worker_chunks))]
+        with open(path, 'rb') as f:
+            records = _worker_chunks[path] = json.loads(f.read())
+    return records
+
+def _scan_chunk(path, layout, start, end, where, func=None, field=None):
+    """Pool worker: test rows start..end of an export against a where clause.
+    
+    Returns the matching positions, or (count, value) partial results for
+    an aggregate, where value is a sum or an extreme (None if nothing matched).
+    """
+    is_bool = False
+    if layout['kind'] == 'rows':
+        conditions = _normalize_where(where)
+        records = _row_chunk(path)
+        matched = [i for i, record in enumerate(records) if _matches(record, conditions)]
+        if func is None:
+            return [start + i for i in matched]
+        count = len(matched)
+        values = (_value(records[i], field) for i in matched)
+    else:
+        store = _chunk_store(_open_export(path, layout), start, end)
+        mask = store.mask(where)
+        positions = range(end - start) if mask is None else compress(range(end - start), mask)
+        if func is None:
+            return [start + i for i in positions]
+        count = end - start if mask is None else sum(mask)
+        values = store.masked_values(field, mask)
+        is_bool = field in store.columns and store.columns[field].typecode == 'b'
+    if func == 'count' or not count:
+        return count, None
+    if func in ('sum', 'avg'):
+        return count, sum(values)
+    result = (max if func == 'max' else min)(values)
+    return count, bool(result) if is_bool else result
+
+# ============ Cursors ============
+
+class Cursor:
+    """Lazily evaluated query results.
+
+    Rows are matched as they are consumed, so a limit ends the scan early.
+    Iterate it from Python, or use hasNext()/next() from ZenLang loops.
+    token() returns a resume token for the rows after those consumed.
+    """
+    def __init__(self, rows, query=None):
+        self.rows = iter(rows)
+        self.query = query
+        self.position = 0
+        self.pending = _MISSING
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.pending is not _MISSING:
+            row, self.pending = self.pending, _MISSING
+        else:
+            row = next(self.rows)
+        self.position += 1
+        return row
+
+    def hasNext(self):
+        if self.pending is _MISSING:
+            self.pending = next(self.rows, _MISSING)
+        return self.pending is not _MISSING
+
+    def next(self):
+        """Next record, or null once the cursor is exhausted"""
+        return self.__next__() if self.hasNext() else None
+
+    def take(self, n):
+        """Up to n more records as an array"""
+        return list(islice(self, n))
+
+    def toArray(self):
+        return list(self)
+
+    def token(self):
+        """Resume token for the rows after those consumed, or null when none are left.
         
-        self.tables[table_name] = {
-            'schema': schema or {},
-            'data': [],
-            'auto_increment': 1
-        }
+        With a limit, a cursor resumed part way through its page reads the
+        rest of that page; once the page is used up, the token starts the
+        next page of the same size.
+        """
+        if self.query is None:
+            return None
+        limit = self.query.get('limit')
+        if not self.hasNext() and not (limit and self.position >= limit):
+            return None
+        page = self.query.get('page') or limit
+        if limit and self.position < limit:
+            limit -= self.position
+        else:
+            limit = page
+        state = dict(self.query, limit=limit, page=page, offset=(self.query.get('offset') or 0) + self.position)
+        return base64.urlsafe_b64encode(json.dumps(state, default=list).encode()).decode()
+
+    def lines(self):
+        """Remaining records as newline-delimited JSON chunks, for streaming responses"""
+        for row in self:
+            yield json.dumps(row, default=str) + '\n'
+
+    def close(self):
+        self.rows = iter(())
+        self.pending = _MISSING
         return True
+
+
+def _decode_token(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(str(token).encode()))
+    except ValueError:
+        raise ValueError("Invalid resume token")
+
+# ============ Transactions & Connections ============
+
+class Transaction:
+    """Snapshot-isolated unit of work.
+    
+    Reads see the database as of begin() plus this transaction's own
+    writes. Writes are buffered and replayed atomically on commit; the
+    commit fails if another writer changed one of the touched tables
+    first. Columnar tables are read at their latest committed state.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.views = db.snapshot()
+        self.log = []
+        self.workspace = {}
+        self.next_ids = {}
+    
+    def _rows(self, table_name):
+        """Private copy of a table's rows that this transaction writes to"""
+        if table_name not in self.workspace:
+            table = self.db._table(table_name)
+            if table.get('layout') == 'sharded':
+                raise ValueError("Transactions cannot write to sharded tables")
+            view = self.views.setdefault(table_name, self.db.view(table_name))
+            if table.get('layout') == 'columnar':
+                self.workspace[table_name] = self.db.select(table_name)
+            elif table_name in self.db.expiry:
+                self.workspace[table_name] = list(filter(self.db._unexpired(table_name), view.rows()))
+            else:
+                self.workspace[table_name] = list(view.rows())
+            self.next_ids[table_name] = table['auto_increment']
+        return self.workspace[table_name]
+    
+    def _check(self, table_name, records):
+        """Reject writes now that the commit would reject later"""
+        table = self.db._table(table_name)
+        schema = self.db.schemas.get(table_name)
+        for record in records:
+            if schema:
+                schema.check(record)
+            elif table.get('layout') == 'columnar':
+                table['store'].check(record)
     
     def insert(self, table_name, record):
-        """Insert a record into table"""
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
-        
-        table = self.tables[table_name]
-        
-        # Add auto-increment ID if not present
-        if 'id' not in record:
-            record['id'] = table['auto_increment']
-            table['auto_increment'] += 1
-        
-        # Add timestamp
-        record['_created_at'] = time.time()
-        
-        table['data'].append(record)
-        return record['id']
+        self._rows(table_name)
+        self._check(table_name, [record])
+        self.log.append(('insert', table_name, dict(record)))
+        return self._stage(table_name, record)
     
-    def select(self, table_name, where=None, limit=None):
-        """Select records from table"""
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
-        
-        data = self.tables[table_name]['data']
-        
-        # Filter by where clause
-        if where:
-            filtered = []
-            for record in data:
-                match = True
-                for key, value in where.items():
-                    if key not in record or record[key] != value:
-                        match = False
-                        break
-                if match:
-                    filtered.append(record)
-            data = filtered
-        
-        # Apply limit
-        if limit:
-            data = data[:limit]
-        
-        return data
+    def _stage(self, table_name, record):
+        stored = dict(record)
+        if 'id' not in stored:
+            stored['id'] = self.next_ids[table_name]
+            self.next_ids[table_name] += 1
+        stored['_created_at'] = time.time()
+        self.workspace[table_name].append(stored)
+        return stored['id']
+    
+    def insert_many(self, table_name, records):
+        self._rows(table_name)
+        self._check(table_name, records)
+        self.log.append(('insert_many', table_name, [dict(r) for r in records]))
+        return [self._stage(table_name, record) for record in records]
+    
+    def update_many(self, table_name, records, key='id'):
+        rows = self._rows(table_name)
+        self._check(table_name, records)
+        changes = {}
+        for record in records:
+            changes.setdefault(_hash_key(record.get(key)), {}).update(record)
+        now = time.time()
+        count = 0
+        for i, row in enumerate(rows):
+            change = changes.get(_hash_key(row.get(key, _MISSING)))
+            if change is not None:
+                rows[i] = {**row, **change, '_updated_at': now}
+                count += 1
+        self.log.append(('update_many', table_name, [dict(r) for r in records], key))
+        return count
+    
+    def upsert_many(self, table_name, records, key='id'):
+        rows = self._rows(table_name)
+        self._check(table_name, records)
+        existing = {_hash_key(row.get(key, _MISSING)) for row in rows}
+        log_length = len(self.log)
+        updated = self.update_many(table_name, [r for r in records if _hash_key(r.get(key, _MISSING)) in existing], key)
+        inserts = {}
+        for record in records:
+            value = _hash_key(record.get(key, _MISSING))
+            if value is _MISSING:
+                inserts[id(record)] = record
+            elif value not in existing:
+                inserts.setdefault(value, {}).update(record)
+        for record in inserts.values():
+            self._stage(table_name, record)
+        # Replay as a single upsert so the commit sees the same split
+        del self.log[log_length:]
+        self.log.append(('upsert_many', table_name, [dict(r) for r in records], key))
+        return {'inserted': len(inserts), 'updated': updated}
+    
+    def select(self, table_name, where=None, limit=None, order_by=None, order_dir='asc', offset=0, fields=None):
+        return list(self.scan(table_name, where, limit, order_by, order_dir, offset, fields))
+    
+    def scan(self, table_name, where=None, limit=None, order_by=None, order_dir='asc', offset=0, fields=None):
+        if table_name not in self.workspace:
+            return self.db.scan(table_name, where, limit, order_by, order_dir, offset,
+                                view=self.views.get(table_name), fields=fields)
+        conditions = _normalize_where(where)
+        # Iterate a copy so later writes in this transaction don't shift an open scan
+        rows = (r for r in tuple(self.workspace[table_name]) if _matches(r, conditions))
+        return _project(_page(rows, order_by, order_dir, limit, offset), fields)
     
     def update(self, table_name, where, updates):
-        """Update records in table"""
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
-        
-        data = self.tables[table_name]['data']
+        rows = self._rows(table_name)
+        self._check(table_name, [updates])
+        conditions = _normalize_where(where)
+        now = time.time()
         count = 0
-        
-        for record in data:
-            match = True
-            for key, value in where.items():
-                if key not in record or record[key] != value:
-                    match = False
-                    break
-            
-            if match:
-                for key, value in updates.items():
-                    record[key] = value
-                record['_updated_at'] = time.time()
+        for i, record in enumerate(rows):
+            if _matches(record, conditions):
+                updated = dict(record)
+                updated.update(updates)
+                updated['_updated_at'] = now
+                rows[i] = updated
                 count += 1
-        
+        self.log.append(('update', table_name, where, dict(updates)))
         return count
     
     def delete(self, table_name, where):
-        """Delete records from table"""
-        if table_name not in self.tables:
-            raise ValueError(f"Table '{table_name}' does not exist")
-        
-        data = self.tables[table_name]['data']
-        to_delete = []
-        
-        for i, record in enumerate(data):
-            match = True
-            for key, value in where.items():
-                if key not in record or record[key] != value:
-                    match = False
-                    break
-            if match:
-                to_delete.append(i)
-        
-        # Delete in reverse order to maintain indices
-        for i in reversed(to_delete):
-            del data[i]
-        
-        return len(to_delete)
+        rows = self._rows(table_name)
+        conditions = _normalize_where(where)
+        kept = [r for r in rows if not _matches(r, conditions)]
+        removed = len(rows) - len(kept)
+        rows[:] = kept
+        self.log.append(('delete', table_name, where))
+        return removed
+    
+    def search(self, table_name, field, terms, options=None):
+        view = self.views.get(table_name)
+        if table_name not in self.workspace and (view is None or self.db.versions.get(table_name, 0) == view.version):
+            return self.db.search(table_name, field, terms, options)
+        # The index has moved past this transaction's snapshot
+        return _search_rows(self.scan(table_name), field, terms, options or {})
     
     def count(self, table_name, where=None):
-        """Count records in table"""
+        if table_name not in self.workspace:
+            return self.db.count(table_name, where, view=self.views.get(table_name))
         return len(self.select(table_name, where))
     
-    def save(self):
-        """Save database to file"""
-        data = {
-            'name': self.name,
-            'tables': self.tables
-        }
-        with open(self.file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+    def plan(self, table_name, where=None, order_by=None, order_dir='asc', limit=None, offset=0):
+        return self.db.plan(table_name, where, order_by, order_dir, limit, offset,
+                            view=self.views.get(table_name))
+    
+    def commit(self):
+        db = self.db
+        touched = list(self.workspace)
+        with db.lock:
+            for name in touched:
+                if db.versions.get(name, 0) != self.views[name].version:
+                    raise ValueError(f"Transaction conflict: table '{name}' was changed by another writer")
+            with db.writing(*touched):
+                for entry in self.log:
+                    op, table_name, args = entry[0], entry[1], entry[2:]
+                    if op == 'insert':
+                        db._insert(table_name, dict(args[0]))
+                    elif op == 'insert_many':
+                        db._insert_many(table_name, [dict(r) for r in args[0]])
+                    elif op == 'update':
+                        db._update(table_name, *args)
+                    elif op == 'update_many':
+                        db._update_many(table_name, *args)
+                    elif op == 'upsert_many':
+                        db._upsert_many(table_name, *args)
+                    else:
+                        db._delete(table_name, *args)
         return True
+
+
+class Connection:
+    """Handle on a database with its own transaction state"""
+    def __init__(self, db):
+        self.db = db
+        self.transaction = None
     
-    def load(self):
-        """Load database from file"""
-        if os.path.exists(self.file_path):
-            with open(self.file_path, 'r') as f:
-                data = json.load(f)
-                self.tables = data.get('tables', {})
-            return True
-        return False
+    def _target(self):
+        return self.transaction or self.db
+    
+    def begin(self):
+        if self.transaction:
+            raise ValueError("Transaction already in progress")
+        self.transaction = Transaction(self.db)
+        return True
+    
+    def commit(self):
+        if not self.transaction:
+            raise ValueError("No transaction in progress")
+        transaction, self.transaction = self.transaction, None
+        return transaction.commit()
+    
+    def rollback(self):
+        if not self.transaction:
+            raise ValueError("No transaction in progress")
+        self.transaction = None
+        return True
+    
+    def inTransaction(self):
+        return self.transaction is not None
+    
+    def createTable(self, table_name, schema=None, options=None):
+        return self.db.create_table(table_name, schema, options)
+    
+    def createIndex(self, table_name, field, kind='hash'):
+        return self.db.create_index(table_name, field, kind)
+    
+    def dropIndex(self, table_name, field):
+        return self.db.drop_index(table_name, field)
+    
+    def createView(self, name, table_name, group_by, aggregates=None, where=None):
+        return self.db.create_view(name, table_name, group_by, aggregates, where)
+    
+    def dropView(self, name):
+        return self.db.drop_view(name)
+    
+    def insert(self, table_name, record):
+        return self._target().insert(table_name, record)
+    
+    def select(self, table_name, where=None, limit=None, order_by=None, order_dir='asc', offset=0, fields=None):
+        return self._target().select(table_name, where, limit, order_by, order_dir, offset, fields=fields)
+    
+    def cursor(self, table_name, where=None, limit=None, order_by=None, order_dir='asc', offset=0, fields=None):
+        rows = self._target().scan(table_name, where, limit, order_by, order_dir, offset, fields=fields)
+        return Cursor(rows, {
+            'table': table_name, 'where': where, 'limit': limit, 'orderBy': order_by,
+            'orderDir': order_dir, 'offset': offset or 0, 'fields': fields
+        })
+    
+    def resume(self, token):
+        state = _decode_token(token)
+        cursor = self.cursor(state['table'], state.get('where'), state.get('limit'), state.get('orderBy'),
+                             state.get('orderDir', 'asc'), state.get('offset', 0), state.get('fields'))
+        cursor.query['page'] = state.get('page')
+        return cursor
+    
+    def update(self, table_name, where, updates):
+        return self._target().update(table_name, where, updates)
+    
+    def insertMany(self, table_name, records):
+        return self._target().insert_many(table_name, records)
+    
+    def updateMany(self, table_name, records, key='id'):
+        return self._target().update_many(table_name, records, key)
+    
+    def upsertMany(self, table_name, records, key='id'):
+        return self._target().upsert_many(table_name, records, key)
+    
+    def delete(self, table_name, where):
+        return self._target().delete(table_name, where)
+    
+    def search(self, table_name, field, terms, options=None):
+        return self._target().search(table_name, field, terms, options)
+    
+    def count(self, table_name, where=None):
+        return self._target().count(table_name, where)
+    
+    def plan(self, table_name, where=None, order_by=None, order_dir='asc', limit=None, offset=0):
+        return self._target().plan(table_name, where, order_by, order_dir, limit, offset)
+    
+    def query(self, table_name):
+        return Query(table_name, self)
+    
+    def save(self):
+        return self.db.save()
+    
+    def close(self):
+        self.transaction = None
+        return True
+
+def _connection():
+    """The calling thread's connection to the current database"""
+    if not _current_db:
+        raise ValueError("No database connected")
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(_current_db.name)
+    if conn is None or conn.db is not _current_db:
+        conn = connections[_current_db.name] = Connection(_current_db)
+    return conn
+
+def _open(db_name):
+    with _connect_lock:
+        if db_name not in _databases:
+            _databases[db_name] = ZenDB(db_name)
+            _databases[db_name].load()  # Try to load from file
+        return _databases[db_name]
 
 # ============ Public API ============
 
@@ -149,48 +3373,102 @@ def connect(db_name):
     """Connect to or create a database"""
     global _current_db
     
-    if db_name not in _databases:
-        _databases[db_name] = ZenDB(db_name)
-        _databases[db_name].load()  # Try to load from file
-    
-    _current_db = _databases[db_name]
+    _current_db = _open(db_name)
     return _current_db
 
-def createTable(table_name, schema=None):
-    """Create a table in current database"""
-    if not _current_db:
-        raise ValueError("No database connected")
-    return _current_db.create_table(table_name, schema)
+def connection(db_name):
+    """Open an independent connection handle (own transactions, no global state)"""
+    return Connection(_open(db_name))
+
+def createTable(table_name, schema=None, options=None):
+    """Create a table in current database.
+    
+    options: layout ('row' or 'columnar'), shards/shardKey, parallel
+    (scan large tables, or query shards, in a process pool), ttl (seconds
+    a row lives after its last write) and capped (most rows kept; inserts
+    evict the oldest).
+    """
+    return _connection().createTable(table_name, schema, options)
 
 def insert(table_name, record):
     """Insert a record"""
-    if not _current_db:
-        raise ValueError("No database connected")
-    return _current_db.insert(table_name, record)
+    return _connection().insert(table_name, record)
 
-def select(table_name, where=None, limit=None):
-    """Select records"""
-    if not _current_db:
-        raise ValueError("No database connected")
-    return _current_db.select(table_name, where, limit)
+def select(table_name, where=None, limit=None, fields=None):
+    """Select records, optionally only the given fields"""
+    return _connection().select(table_name, where, limit, fields=fields)
+
+def cursor(table_name, where=None, limit=None, order_by=None, order_dir='asc', offset=0, fields=None):
+    """Lazy cursor over matching records (hasNext/next, take, token)"""
+    return _connection().cursor(table_name, where, limit, order_by, order_dir, offset, fields)
+
+def resume(token):
+    """Cursor continuing the query a resume token came from"""
+    return _connection().resume(token)
 
 def update(table_name, where, updates):
     """Update records"""
-    if not _current_db:
-        raise ValueError("No database connected")
-    return _current_db.update(table_name, where, updates)
+    return _connection().update(table_name, where, updates)
+
+def insertMany(table_name, records):
+    """Insert an array of records in one batch; returns their ids"""
+    return _connection().insertMany(table_name, records)
+
+def updateMany(table_name, records, key='id'):
+    """Update records matched by their `key` field in one batch"""
+    return _connection().updateMany(table_name, records, key)
+
+def upsertMany(table_name, records, key='id'):
+    """Update records whose key exists and insert the rest in one batch"""
+    return _connection().upsertMany(table_name, records, key)
 
 def delete(table_name, where):
     """Delete records"""
-    if not _current_db:
-        raise ValueError("No database connected")
-    return _current_db.delete(table_name, where)
+    return _connection().delete(table_name, where)
 
 def count(table_name, where=None):
     """Count records"""
-    if not _current_db:
-        raise ValueError("No database connected")
-    return _current_db.count(table_name, where)
+    return _connection().count(table_name, where)
+
+def search(table_name, field, terms, options=None):
+    """Full-text search of a field, best matches first, e.g.
+    search("logs", "message", "disk full", {prefix=true, all=true, limit=20})
+    """
+    return _connection().search(table_name, field, terms, options)
+
+def createIndex(table_name, field, kind='hash'):
+    """Create an index on a field ('hash', 'ordered' or 'text')"""
+    return _connection().createIndex(table_name, field, kind)
+
+def dropIndex(table_name, field):
+    """Drop the index on a field"""
+    return _connection().dropIndex(table_name, field)
+
+def createView(name, table_name, group_by, aggregates=None, where=None):
+    """Create a materialized group-by view, e.g.
+    createView("sales_by_region", "orders", "region", {orders="count", revenue={sum="total"}})
+    """
+    return _connection().createView(name, table_name, group_by, aggregates, where)
+
+def dropView(name):
+    """Drop a materialized view"""
+    return _connection().dropView(name)
+
+def begin():
+    """Start a transaction on this thread's connection"""
+    return _connection().begin()
+
+def commit():
+    """Commit this thread's transaction"""
+    return _connection().commit()
+
+def rollback():
+    """Discard this thread's transaction"""
+    return _connection().rollback()
+
+def inTransaction():
+    """Check whether this thread has a transaction open"""
+    return _connection().inTransaction()
 
 def save():
     """Save current database to file"""
@@ -208,23 +3486,73 @@ def load():
 
 class Query:
     """Query builder for complex queries"""
-    def __init__(self, table_name):
+    def __init__(self, table_name, conn=None):
         self.table = table_name
+        self.conn = conn
         self.where_clause = {}
         self.limit_value = None
+        self.offset_value = 0
         self.order_field = None
         self.order_dir = 'asc'
+        self.fields = None
+    
+    def select(self, *fields):
+        """Only return these fields: select("name", "age") or select(["name", "age"])"""
+        if len(fields) == 1 and isinstance(fields[0], (list, tuple)):
+            fields = fields[0]
+        self.fields = list(fields)
+        return self
+    
+    def where(self, field, op, value=_MISSING):
+        """Add a condition: where(field, value) or where(field, op, value)"""
+        if value is _MISSING:
+            self.where_clause[field] = op
+            return self
+        
+        op = _operator_name(op)
+        current = self.where_clause.get(field, _MISSING)
+        if current is _MISSING:
+            self.where_clause[field] = {op: value}
+        elif _is_operator_spec(current):
+            current[op] = value
+        else:
+            self.where_clause[field] = {'eq': current, op: value}
+        return self
     
-    def where(self, field, value):
-        self.where_clause[field] = value
+    def whereBetween(self, field, low, high):
+        return self.where(field, 'between', [low, high])
+    
+    def whereIn(self, field, values):
+        return self.where(field, 'in', values)
+    
+    def orderBy(self, field, direction='asc'):
+        self.order_field = field
+        self.order_dir = direction
         return self
     
     def limit(self, n):
         self.limit_value = n
         return self
     
+    def offset(self, n):
+        self.offset_value = n
+        return self
+    
     def get(self):
-        return select(self.table, self.where_clause, self.limit_value)
+        return (self.conn or _connection()).select(self.table, self.where_clause, self.limit_value,
+                                                   self.order_field, self.order_dir, self.offset_value,
+                                                   self.fields)
+    
+    def cursor(self):
+        """Like get(), but returns a lazy Cursor"""
+        return (self.conn or _connection()).cursor(self.table, self.where_clause, self.limit_value,
+                                                   self.order_field, self.order_dir, self.offset_value,
+                                                   self.fields)
+    
+    def explain(self):
+        """Describe how get() would run: strategy, indexes used and row estimates"""
+        return (self.conn or _connection()).plan(self.table, self.where_clause, self.order_field,
+                                                 self.order_dir, self.limit_value, self.offset_value)[0]
     
     def first(self):
         results = self.limit(1).get()
@@ -263,33 +3591,177 @@ def belongsTo(table, foreign_key, foreign_id):
     results = select(table, {'id': foreign_id}, 1)
     return results[0] if results else None
 
+def _join_rows(source):
+    """Records of a table name or an array of records"""
+    return select(source) if isinstance(source, str) else (source or [])
+
+def _join_index(table_name, field):
+    """Hash index of a table on a field and the table version it is valid for.
+    
+    Returns (None, None) when there is no such index, or when the calling
+    connection's transaction should not see it: the transaction wrote to
+    the table, or the index has moved past its snapshot.
+    """
+    if not isinstance(table_name, str) or not _current_db:
+        return None, None
+    conn = _connection()
+    index = conn.db.indexes.get(table_name, {}).get(field)
+    if not isinstance(index, HashIndex):
+        return None, None
+    version = conn.db.versions.get(table_name, 0)
+    transaction = conn.transaction
+    if transaction:
+        if table_name in transaction.workspace:
+            return None, None
+        view = transaction.views.get(table_name)
+        if view is not None and view.version != version:
+            return None, None
+    if not conn.db._stable(version):
+        return None, None
+    return index, version
+
+def _hash_join(left_rows, lookup, left_key):
+    result = []
+    for left_row in left_rows:
+        for right_row in lookup(left_row.get(left_key)):
+            merged = dict(left_row)
+            for key, value in right_row.items():
+                if key not in merged:
+                    merged[key] = value
+            result.append(merged)
+    return result
+
+def join(left, right, left_key, right_key):
+    """Inner join two tables (or arrays of records) with a hash join"""
+    left_rows = list(_join_rows(left))
+    index, version = _join_index(right, right_key)
+    if index is not None:
+        # The right table is already hashed on the join key
+        result = _hash_join(left_rows, index.lookup, left_key)
+        if _current_db.versions.get(right, 0) == version:
+            return result
+    
+    buckets = {}
+    for row in _join_rows(right):
+        buckets.setdefault(_hash_key(row.get(right_key)), []).append(row)
+    return _hash_join(left_rows, lambda value: buckets.get(_hash_key(value), ()), left_key)
+
+def _distinct_keys(records, field):
+    keys = {}
+    for record in records:
+        value = record.get(field)
+        if value is not None:
+            keys.setdefault(_hash_key(value), value)
+    return list(keys.values())
+
+def preloadHasMany(parents, table, foreign_key, name, local_key='id'):
+    """Attach related records to each parent using one query for the whole batch"""
+    ids = _distinct_keys(parents, local_key)
+    groups = {}
+    for row in select(table, {foreign_key: {'in': ids}}) if ids else []:
+        groups.setdefault(_hash_key(row.get(foreign_key)), []).append(row)
+    return [{**parent, name: groups.get(_hash_key(parent.get(local_key)), [])} for parent in parents]
+
+def preloadBelongsTo(children, table, foreign_key, name):
+    """Attach the parent record to each child using one query for the whole batch"""
+    ids = _distinct_keys(children, foreign_key)
+    owners = {}
+    for row in select(table, {'id': {'in': ids}}) if ids else []:
+        owners.setdefault(_hash_key(row.get('id')), row)
+    return [{**child, name: owners.get(_hash_key(child.get(foreign_key)))} for child in children]
+
 # ============ Aggregations ============
 
+def _value(record, field):
+    """Field value for an aggregate; missing and null fields count as 0, as in columnar tables"""
+    value = record.get(field)
+    return 0 if value is None else value
+
+def _columnar(table_name, fn):
+    """Run fn(store) on a columnar table, or return _MISSING for row tables"""
+    conn = _connection()
+    table = conn.db.tables.get(table_name)
+    if not table or table.get('layout') != 'columnar':
+        return _MISSING
+    if conn.transaction and table_name in conn.transaction.workspace:
+        # Uncommitted writes only exist as rows in the transaction
+        return _MISSING
+    return conn.db.read(table_name, lambda: fn(table['store']))
+
+def _parallel(table_name, func, field, where):
+    """Aggregate a large `parallel` table in the process pool, or return _MISSING"""
+    conn = _connection()
+    table = conn.db.tables.get(table_name)
+    if not table or not table.get('parallel') or table.get('layout') == 'sharded':
+        return _MISSING
+    view = None
+    if conn.transaction:
+        if table_name in conn.transaction.workspace:
+            return _MISSING
+        if table.get('layout') != 'columnar':
+            view = conn.transaction.views.get(table_name)
+    if table.get('layout') == 'columnar':
+        size = len(table['store'])
+    else:
+        size = (view or conn.db.view(table_name)).size
+    if not conn.db._parallel_ok(table_name, size):
+        return _MISSING
+    count, value = conn.db._parallel_scan(table_name, where, func, field, view)
+    if func == 'avg':
+        return value / count if count else 0
+    if func == 'sum':
+        return value if count else 0
+    return value
+
 def sum_field(table_name, field, where=None):
     """Sum a field"""
+    result = _parallel(table_name, 'sum', field, where)
+    if result is not _MISSING:
+        return result
+    result = _columnar(table_name, lambda store: store.aggregate(sum, field, where))
+    if result is not _MISSING:
+        return result
     records = select(table_name, where)
-    return sum(r.get(field, 0) for r in records)
+    return sum(_value(r, field) for r in records)
 
 def avg_field(table_name, field, where=None):
     """Average a field"""
+    result = _parallel(table_name, 'avg', field, where)
+    if result is not _MISSING:
+        return result
+    result = _columnar(table_name, lambda store: store.average(field, where))
+    if result is not _MISSING:
+        return result
     records = select(table_name, where)
     if not records:
         return 0
-    return sum(r.get(field, 0) for r in records) / len(records)
+    return sum(_value(r, field) for r in records) / len(records)
 
 def max_field(table_name, field, where=None):
     """Maximum value of a field"""
+    result = _parallel(table_name, 'max', field, where)
+    if result is not _MISSING:
+        return result
+    result = _columnar(table_name, lambda store: store.aggregate(max, field, where) if store.count(where) else None)
+    if result is not _MISSING:
+        return result
     records = select(table_name, where)
     if not records:
         return None
-    return max(r.get(field, 0) for r in records)
+    return max(_value(r, field) for r in records)
 
 def min_field(table_name, field, where=None):
     """Minimum value of a field"""
+    result = _parallel(table_name, 'min', field, where)
+    if result is not _MISSING:
+        return result
+    result = _columnar(table_name, lambda store: store.aggregate(min, field, where) if store.count(where) else None)
+    if result is not _MISSING:
+        return result
     records = select(table_name, where)
     if not records:
         return None
-    return min(r.get(field, 0) for r in records)
+    return min(_value(r, field) for r in records)
 
 # ============ Migrations ============
 
@@ -297,53 +3769,146 @@ def migrate(table_name, add_fields=None, remove_fields=None):
     """Migrate table schema"""
     if not _current_db:
         raise ValueError("No database connected")
+    return _current_db.migrate(table_name, add_fields, remove_fields)
+
+def cacheStats():
+    """Query result cache statistics: hits, misses, hitRate, evictions, invalidations, size, capacity"""
+    if not _current_db:
+        raise ValueError("No database connected")
+    return _current_db.cache.stats()
+
+def setCacheSize(capacity):
+    """Number of select results to cache; 0 turns the cache off"""
+    if not _current_db:
+        raise ValueError("No database connected")
+    _current_db.cache.resize(capacity)
+    return True
+
+def clearCache():
+    """Drop every cached result and reset the statistics"""
+    if not _current_db:
+        raise ValueError("No database connected")
+    _current_db.cache.clear()
+    return True
+
+def expire(table_name=None):
+    """Delete expired rows from TTL tables now; returns how many were removed"""
+    if not _current_db:
+        raise ValueError("No database connected")
+    return _current_db.expire(table_name)
+
+# ============ Backup/Restore ============
+
+class BackupJob:
+    """A backup being written by a background thread"""
+    def __init__(self, filename, write):
+        self.filename = filename
+        self.error = None
+        self.thread = threading.Thread(target=self._run, args=(write,))
+        self.thread.start()
     
-    if table_name not in _current_db.tables:
-        raise ValueError(f"Table '{table_name}' does not exist")
-    
-    table = _current_db.tables[table_name]
+    def _run(self, write):
+        try:
+            write()
+        except Exception as e:
+            self.error = e
     
-    # Add fields
-    if add_fields:
-        for record in table['data']:
-            for field, default in add_fields.items():
-                if field not in record:
-                    record[field] = default
+    def isDone(self):
+        return not self.thread.is_alive()
     
-    # Remove fields
-    if remove_fields:
-        for record in table['data']:
-            for field in remove_fields:
-                if field in record:
-                    del record[field]
+    def wait(self, timeout=None):
+        """Block until the backup is written; raises if it failed"""
+        self.thread.join(timeout)
+        if self.error:
+            raise self.error
+        return self.isDone()
+
+def _write_json(filename, data):
+    # Write beside the target and rename, so a crash never leaves a torn backup
+    temp = f"{filename}.tmp"
+    with open(temp, 'w') as f:
+        json.dump(data, f, separators=(',', ':'), default=str)
+    os.replace(temp, filename)
+
+def _read_json(filename):
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+def _write_full_backup(filename, snapshot):
+    _write_json(filename, {
+        'type': 'full',
+        'name': snapshot['name'],
+        'tables': _serialize_tables(snapshot['tables'], inline=True),
+        'indexes': snapshot['indexes'],
+        'views': snapshot['views'],
+        'lsn': snapshot['lsn'],
+        'backup_time': snapshot['time']
+    })
+
+def _entry_json(entry):
+    lsn, stamp, op, table_name, args = entry
+    if op == 'put':
+        args = ([dict(record) for record in args[0]],)
+    return {'lsn': lsn, 'time': stamp, 'op': op, 'table': table_name, 'args': list(args)}
+
+def _snapshot(incremental):
+    if not _current_db:
+        raise ValueError("No database connected")
+    snapshot = _current_db.capture(bool(incremental))
+    snapshot['time'] = time.time()
+    return snapshot
+
+def backup(filename, incremental=False):
+    """Full backup of the current database; writers are only paused while it is captured.
     
+    Pass incremental=true to start journaling changes for backupIncremental.
+    """
+    _write_full_backup(filename, _snapshot(incremental))
     return True
 
-# ============ Backup/Restore ============
+def backupAsync(filename, incremental=False):
+    """Full backup written in the background; returns a job (isDone, wait)"""
+    snapshot = _snapshot(incremental)
+    return BackupJob(filename, lambda: _write_full_backup(filename, snapshot))
 
-def backup(filename):
-    """Backup current database"""
+def backupIncremental(filename):
+    """Save only the changes made since the previous backup"""
     if not _current_db:
         raise ValueError("No database connected")
-    
-    data = {
+    start, end, entries = _current_db.changes()
+    _write_json(filename, {
+        'type': 'incremental',
         'name': _current_db.name,
-        'tables': _current_db.tables,
-        'backup_time': time.time()
-    }
-    
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=2)
-    
+        'from_lsn': start,
+        'to_lsn': end,
+        'backup_time': time.time(),
+        'entries': [_entry_json(entry) for entry in entries]
+    })
     return True
 
-def restore(filename):
-    """Restore database from backup"""
+def restore(filename, increments=None, until=None):
+    """Restore a full backup, then replay incremental backups (in order) up to `until`"""
     if not _current_db:
         raise ValueError("No database connected")
     
-    with open(filename, 'r') as f:
-        data = json.load(f)
-        _current_db.tables = data.get('tables', {})
+    data = _read_json(filename)
+    if data.get('type') == 'incremental':
+        raise ValueError(f"'{filename}' is an incremental backup; restore its full backup first")
+    if until is not None and until < data.get('backup_time', 0):
+        raise ValueError("Cannot restore to a point before the full backup was taken")
     
-    return True
+    entries = []
+    lsn = data.get('lsn')
+    for path in increments or []:
+        increment = _read_json(path)
+        if increment.get('type') != 'incremental' or lsn is None or increment.get('from_lsn') != lsn:
+            raise ValueError(f"'{path}' does not continue the backup chain")
+        entries.extend(increment['entries'])
+        lsn = increment['to_lsn']
+    
+    _current_db.replace_tables(
+        _deserialize_tables(data.get('tables', {})),
+        data.get('indexes', _current_db.index_definitions()),
+        data.get('views')
+    )
+    return _current_db.replay(entries, until)
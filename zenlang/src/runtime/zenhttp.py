@@ -3,10 +3,11 @@ ZenLang HTTP Server Runtime
 Provides HTTP server functionality for web applications
 """
 
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import gzip
 import json
 import urllib.parse
-from threading import Thread
+from threading import Thread, Lock
 
 class ZenHTTPHandler(BaseHTTPRequestHandler):
     """HTTP request handler for ZenLang web applications"""
@@ -14,9 +15,20 @@ class ZenHTTPHandler(BaseHTTPRequestHandler):
     # Class variable to store the router callback
     router_callback = None
     
+    # HTTP/1.1 keeps client connections open between requests
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; don't let Nagle delay the body
+    disable_nagle_algorithm = True
+    logging = True
+    
+    # Connections are served on their own threads, but ZenLang router
+    # code runs one request at a time
+    router_lock = Lock()
+    
     def log_message(self, format, *args):
         """Override to customize logging"""
-        print(f"[HTTP] {self.address_string()} - {format % args}")
+        if self.logging:
+            print(f"[HTTP] {self.address_string()} - {format % args}")
     
     def do_GET(self):
         """Handle GET requests"""
@@ -45,12 +57,18 @@ class ZenHTTPHandler(BaseHTTPRequestHandler):
         query_params = urllib.parse.parse_qs(query_string)
         query_dict = {k: v[0] if len(v) == 1 else v for k, v in query_params.items()}
         
-        # Read request body for POST/PUT
+        # Read the request body so the connection can carry the next request
         body = None
-        if method in ['POST', 'PUT']:
-            content_length = int(self.headers.get('Content-Length', 0))
-            if content_length > 0:
-                body = self.rfile.read(content_length).decode('utf-8')
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length > 0:
+            body = self.rfile.read(content_length)
+            try:
+                if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+                    body = gzip.decompress(body)
+                body = body.decode('utf-8')
+            except (OSError, EOFError, UnicodeDecodeError) as e:
+                self.send_plain(400, f"Bad Request: {e}".encode('utf-8'))
+                return
         
         # Create request object
         request = {
@@ -64,7 +82,8 @@ class ZenHTTPHandler(BaseHTTPRequestHandler):
         # Call router callback if set
         if self.router_callback:
             try:
-                response = self.router_callback(request)
+                with self.router_lock:
+                    response = self.router_callback(request)
                 
                 # Send response
                 status = response.get('status', 200)
@@ -79,29 +98,67 @@ class ZenHTTPHandler(BaseHTTPRequestHandler):
                 
                 # Default content type if not set
                 if 'Content-Type' not in headers:
-                    self.send_header('Content-Type', 'text/html; charset=utf-8')
-                
-                self.end_headers()
+                    if is_stream(body):
+                        self.send_header('Content-Type', 'application/x-ndjson')
+                    else:
+                        self.send_header('Content-Type', 'text/html; charset=utf-8')
                 
                 # Send body
-                if isinstance(body, str):
-                    self.wfile.write(body.encode('utf-8'))
+                if is_stream(body):
+                    self.send_header('Transfer-Encoding', 'chunked')
+                    self.end_headers()
+                    self.write_stream(body)
                 else:
-                    self.wfile.write(str(body).encode('utf-8'))
+                    if isinstance(body, bytes):
+                        data = body
+                    else:
+                        data = str(body).encode('utf-8')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
                     
             except Exception as e:
                 # Error handling
-                self.send_response(500)
-                self.send_header('Content-Type', 'text/plain')
-                self.end_headers()
                 error_msg = f"Internal Server Error: {str(e)}"
-                self.wfile.write(error_msg.encode('utf-8'))
+                self.send_plain(500, error_msg.encode('utf-8'))
         else:
             # No router set
-            self.send_response(404)
-            self.send_header('Content-Type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'No router configured')
+            self.send_plain(404, b'No router configured')
+
+    def send_plain(self, status, data):
+        """Send a short text/plain response"""
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def write_stream(self, body):
+        """Send an iterable body (e.g. a zendb cursor) as HTTP chunks.
+        
+        The status line is already sent, so an error from the body can't
+        become a 500. The response ends without its final chunk instead,
+        which tells the client the body is incomplete.
+        """
+        try:
+            for chunk in body:
+                if isinstance(chunk, (dict, list)):
+                    chunk = json.dumps(chunk, default=str) + '\n'
+                if not isinstance(chunk, bytes):
+                    chunk = str(chunk).encode('utf-8')
+                if chunk:
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                    self.wfile.flush()
+        except Exception as e:
+            self.log_error("Streamed response failed: %s", e)
+            self.close_connection = True
+            return
+        self.wfile.write(b'0\r\n\r\n')
+
+
+def is_stream(body):
+    """True for iterable bodies such as cursors and generators"""
+    return hasattr(body, '__iter__') and not isinstance(body, (str, bytes, dict, list, tuple))
 
 
 class ZenHTTPServer:
@@ -125,8 +182,7 @@ class ZenHTTPServer:
             return
         
         try:
-            self.server = HTTPServer((self.host, self.port), ZenHTTPHandler)
-            self.running = True
+            self.bind()
             print(f"[HTTP] Server started on http://{self.host}:{self.port}")
             print(f"[HTTP] Press Ctrl+C to stop")
             self.server.serve_forever()
@@ -143,10 +199,18 @@ class ZenHTTPServer:
             print(f"[HTTP] Server already running on http://{self.host}:{self.port}")
             return
         
-        self.thread = Thread(target=self.start, daemon=True)
+        # Bind before returning so clients can connect straight away
+        self.bind()
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
         self.thread.start()
         print(f"[HTTP] Server running in background on http://{self.host}:{self.port}")
     
+    def bind(self):
+        """Create the listening server"""
+        self.server = ThreadingHTTPServer((self.host, self.port), ZenHTTPHandler)
+        self.server.daemon_threads = True
+        self.running = True
+    
     def stop(self):
         """Stop the HTTP server"""
         if self.server:
@@ -190,4 +254,29 @@ def start(host='localhost', port=8080):
     global _server_instance
     if not _server_instance:
         _server_instance = ZenHTTPServer(host, port)
+    elif not _server_instance.running:
+        _server_instance.host = host
+        _server_instance.port = port
     _server_instance.start()
+
+def startBackground(host='localhost', port=8080):
+    """Start HTTP server on a background thread"""
+    global _server_instance
+    if not _server_instance:
+        _server_instance = ZenHTTPServer(host, port)
+    elif not _server_instance.running:
+        _server_instance.host = host
+        _server_instance.port = port
+    _server_instance.start_background()
+    return _server_instance
+
+def stop():
+    """Stop the running HTTP server"""
+    if _server_instance:
+        _server_instance.stop()
+    return True
+
+def setLogging(enabled):
+    """Turn per-request logging on or off"""
+    ZenHTTPHandler.logging = bool(enabled)
+    return True
@@ -0,0 +1,46 @@
+"""Shared fixtures for the runtime tests"""
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+# The runtime is imported as src.runtime, the way the interpreter does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.runtime import net, zendb
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh current zendb database whose files go to a temp directory"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(zendb, '_databases', {})
+    monkeypatch.setattr(zendb, '_current_db', None)
+    return zendb.connect('test')
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """Start local HTTP servers for handler classes; returns each one's base URL.
+    
+    net's cache, resilience settings and metrics are reset for the test.
+    """
+    monkeypatch.setattr(net, '_cache', None)
+    monkeypatch.setattr(net, '_resilience', dict(net._resilience))
+    monkeypatch.setattr(net, '_metrics', dict.fromkeys(net._metrics, 0))
+    servers = []
+    
+    def start(handler):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+    
+    yield start
+    net.closePools()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
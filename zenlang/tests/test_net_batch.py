@@ -0,0 +1,90 @@
+"""Pipelined batches of POSTs with net.postBatch"""
+import gzip
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from src.runtime import net
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Echoes each JSON body back; closes the connection every `close_every` requests"""
+    protocol_version = 'HTTP/1.1'
+    # Send head and body in one segment, or Nagle stalls each unpipelined response
+    wbufsize = -1
+    close_every = 0
+    seen = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        encoding = self.headers.get('Content-Encoding')
+        if encoding == 'gzip':
+            body = gzip.decompress(body)
+        item = json.loads(body)
+        self.seen.append((item['i'], encoding))
+        status = 500 if item.get('fail') else 200
+        out = json.dumps(item).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(out)))
+        if self.close_every and len(self.seen) % self.close_every == 0:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(out)
+
+
+@pytest.fixture
+def server(serve, monkeypatch):
+    """Start an echo server; returns (url, (item index, Content-Encoding) per request)"""
+    monkeypatch.setattr(net, '_hosts', {})
+
+    def start(close_every=0):
+        seen = []
+        handler = type('Handler', (Handler,), {'close_every': close_every, 'seen': seen})
+        return serve(handler) + '/items', seen
+    return start
+
+
+@pytest.mark.parametrize('window', [1, 8, 64])
+def test_results_come_back_in_input_order(server, window):
+    url, seen = server()
+    results = net.postBatch(url, [{'i': i} for i in range(40)], {'window': window, 'json': True})
+    assert [result['body'] for result in results] == [{'i': i} for i in range(40)]
+    assert all(result['ok'] and result['status'] == 200 for result in results)
+    assert [i for i, _ in seen] == list(range(40))
+
+
+def test_unanswered_requests_are_resent_after_the_server_closes(server):
+    url, seen = server(close_every=7)
+    results = net.postBatch(url, [{'i': i} for i in range(30)], {'window': 5, 'json': True})
+    assert [result['body']['i'] for result in results] == list(range(30))
+    # Each request reached the server exactly once
+    assert [i for i, _ in seen] == list(range(30))
+
+
+def test_failed_items_keep_their_place(server):
+    url, _ = server()
+    items = [{'i': 0}, {'i': 1, 'fail': True}, {'i': 2}]
+    results = net.postBatch(url, items, {'json': True})
+    assert [result['ok'] for result in results] == [True, False, True]
+    assert results[1]['status'] == 500 and results[1]['error'].startswith('HTTP Error 500')
+    assert results[2]['body'] == {'i': 2}
+
+
+def test_only_large_bodies_are_compressed(server):
+    url, seen = server()
+    items = [{'i': 0}, {'i': 1, 'pad': 'x' * 500}]
+    results = net.postBatch(url, items, {'compress': True, 'minCompressSize': 100, 'json': True})
+    assert [result['body']['i'] for result in results] == [0, 1]
+    assert seen == [(0, None), (1, 'gzip')]
+
+
+def test_unreachable_server_fails_every_item():
+    results = net.postBatch('http://127.0.0.1:9/items', [{'i': 0}, {'i': 1}], {'timeout': 2})
+    assert [(result['ok'], result['status']) for result in results] == [(False, 0), (False, 0)]
+    assert all(result['error'] for result in results)
@@ -0,0 +1,115 @@
+"""The net response cache: freshness, Vary keys, ETag revalidation and credentials"""
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from src.runtime import net
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers GETs with the Accept-Language and Authorization headers it got"""
+    protocol_version = 'HTTP/1.1'
+    headers_out = {}
+    seen = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.seen.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = f"{self.headers.get('Accept-Language', '-')} {self.headers.get('Authorization', '-')}".encode()
+        self.send_response(200)
+        for name, value in self.headers_out.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(serve):
+    """Start a server whose responses carry the given headers; returns (url, requests seen)"""
+    def start(**headers):
+        seen = []
+        handler = type('Handler', (Handler,), {
+            'headers_out': {name.replace('_', '-'): value for name, value in headers.items()},
+            'seen': seen
+        })
+        net.configureCache()
+        return serve(handler) + '/page', seen
+    return start
+
+
+def get(url, **headers):
+    return net.request('GET', url, None, {name.replace('_', '-'): value for name, value in headers.items()})
+
+
+def test_fresh_responses_are_served_from_the_cache(server):
+    url, seen = server(Cache_Control='max-age=60')
+    assert net.get(url) == '- -'
+    assert net.get(url) == '- -'
+    assert len(seen) == 1
+    assert net.cacheStats()['hits'] == 1
+
+
+def test_vary_keys_entries_on_the_named_request_headers(server):
+    url, seen = server(Cache_Control='max-age=60', Vary='Accept-Language')
+    assert get(url, Accept_Language='en') == 'en -'
+    assert get(url, Accept_Language='fr') == 'fr -'
+    assert get(url, Accept_Language='en') == 'en -'
+    assert get(url, Accept_Language='fr') == 'fr -'
+    assert len(seen) == 2
+    stats = net.cacheStats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 2, 2)
+
+
+def test_vary_star_is_never_stored(server):
+    url, seen = server(Cache_Control='max-age=60', Vary='*')
+    get(url)
+    get(url)
+    assert len(seen) == 2
+
+
+def test_stale_entries_are_revalidated_with_their_etag(server):
+    url, seen = server(Cache_Control='no-cache', ETag='"v1"')
+    assert net.get(url) == '- -'
+    assert net.get(url) == '- -'
+    assert 'If-None-Match' not in seen[0]
+    assert seen[1]['If-None-Match'] == '"v1"'
+    assert net.cacheStats()['revalidated'] == 1
+
+
+def test_changed_resources_replace_the_entry(server):
+    url, seen = server(Cache_Control='no-cache', ETag='"v2"')
+    net.get(url)
+    assert get(url, Accept_Language='de') == 'de -'
+    assert seen[1]['If-None-Match'] == '"v2"'
+    assert net.cacheStats()['misses'] == 2
+
+
+def test_no_store_is_not_cached(server):
+    url, seen = server(Cache_Control='no-store', ETag='"v1"')
+    net.get(url)
+    net.get(url)
+    assert len(seen) == 2 and 'If-None-Match' not in seen[1]
+
+
+def test_credentialed_responses_stay_private(server):
+    url, seen = server(Cache_Control='max-age=60')
+    assert get(url, Authorization='alice') == '- alice'
+    assert get(url, Authorization='bob') == '- bob'
+    assert net.get(url) == '- -'
+    assert len(seen) == 3
+
+
+def test_public_responses_are_shared_with_credentialed_requests(server):
+    url, seen = server(Cache_Control='public, max-age=60')
+    assert get(url, Authorization='alice') == '- alice'
+    assert get(url, Authorization='bob') == '- alice'
+    assert len(seen) == 1
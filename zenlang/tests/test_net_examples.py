@@ -0,0 +1,27 @@
+"""Runs the net benchmark examples end to end with small counts"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_example(name, count, cwd):
+    script = os.path.join(ROOT, 'examples', name)
+    done = subprocess.run([sys.executable, os.path.join(ROOT, 'cli', 'zen.py'), 'run', script, str(count)],
+                          cwd=cwd, capture_output=True, text=True, timeout=120)
+    assert done.returncode == 0, done.stdout + done.stderr
+    return done.stdout
+
+
+def test_net_pool_benchmark(tmp_path):
+    out = run_example('net_pool_benchmark.zen', 20, tmp_path)
+    assert 'Speedup: ' in out
+    # Every pooled request after the first reuses the one connection
+    assert '20 requests, 1 connections opened, 19 reused' in out
+
+
+def test_net_batch_benchmark(tmp_path):
+    out = run_example('net_batch_benchmark.zen', 50, tmp_path)
+    assert 'postBatch window=32 + gzip: ' in out
+    assert 'Failed requests in last batch: 0' in out
@@ -0,0 +1,111 @@
+"""Retries, the per-host retry budget and circuit breakers in net"""
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from src.runtime import net
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers 503 to the first `failures` requests, then 200"""
+    protocol_version = 'HTTP/1.1'
+    failures = 0
+    seen = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self):
+        self.seen.append(self.command)
+        failing = len(self.seen) <= self.failures
+        body = b'down' if failing else b'up'
+        self.send_response(503 if failing else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.respond()
+
+
+@pytest.fixture
+def server(serve, monkeypatch):
+    """Start a server failing its first requests; returns (url, methods seen)"""
+    monkeypatch.setattr(net, '_hosts', {})
+    net.configureResilience({'backoff': 0, 'maxBackoff': 0, 'jitter': False})
+
+    def start(failures=10 ** 6):
+        seen = []
+        handler = type('Handler', (Handler,), {'failures': failures, 'seen': seen})
+        return serve(handler) + '/status', seen
+    return start
+
+
+def test_idempotent_requests_are_retried(server):
+    net.configureResilience({'retries': 3})
+    url, seen = server(failures=2)
+    assert net.get(url) == 'up'
+    assert len(seen) == 3
+    assert net.resilienceStats()['retries'] == 2
+
+
+def test_posts_are_not_retried(server):
+    net.configureResilience({'retries': 3})
+    url, seen = server(failures=1)
+    with pytest.raises(RuntimeError):
+        net.post(url, 'data')
+    assert seen == ['POST']
+
+
+def test_retry_budget_caps_retries_across_requests(server):
+    net.configureResilience({'retries': 5, 'retryBudget': 0, 'retryBurst': 2})
+    url, seen = server()
+    with pytest.raises(RuntimeError, match='503'):
+        net.get(url)
+    # One attempt plus the two retries the burst allows
+    assert len(seen) == 3
+    with pytest.raises(RuntimeError):
+        net.get(url)
+    assert len(seen) == 4
+    stats = net.resilienceStats()
+    assert (stats['retries'], stats['retriesDenied']) == (2, 2)
+    assert stats['hosts'][0]['retryTokens'] == 0
+
+
+def test_requests_earn_retries(server):
+    net.configureResilience({'retries': 5, 'retryBudget': 0.5, 'retryBurst': 1})
+    url, seen = server()
+    attempts = []
+    for _ in range(3):
+        before = len(seen)
+        with pytest.raises(RuntimeError):
+            net.get(url)
+        attempts.append(len(seen) - before)
+    # The burst pays for one retry, then every second request earns one
+    assert attempts == [2, 1, 2]
+
+
+def test_deposits_stop_at_the_burst():
+    net.configureResilience({'retryBudget': 0.4, 'retryBurst': 1})
+    health = net.HostHealth('example.test')
+    assert health.withdraw() and not health.withdraw()
+    for _ in range(5):
+        health.deposit()
+    assert health.stats()['retryTokens'] == 1
+    assert health.withdraw() and not health.withdraw()
+
+
+def test_open_circuit_rejects_requests_without_sending(server):
+    net.configureResilience({'retries': 0, 'failureThreshold': 2, 'resetTimeout': 60})
+    url, seen = server()
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            net.get(url)
+    with pytest.raises(RuntimeError, match='Circuit open'):
+        net.get(url)
+    assert len(seen) == 2
+    assert net.resilienceStats()['openCircuits'] == 1
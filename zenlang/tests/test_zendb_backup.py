@@ -0,0 +1,95 @@
+"""Full, incremental and point-in-time backups in zendb"""
+import time
+
+import pytest
+
+from src.runtime import zendb
+
+
+@pytest.fixture
+def orders(db):
+    db.create_table('orders')
+    db.create_index('orders', 'status')
+    db.insert_many('orders', [{'item': 'pen', 'status': 'new'}, {'item': 'ink', 'status': 'new'}])
+    return db
+
+
+def items(db):
+    return sorted(row['item'] for row in db.select('orders'))
+
+
+def pause():
+    # Journal entries are stamped with time.time(); keep them apart
+    time.sleep(0.02)
+
+
+def test_restore_full_backup(orders):
+    zendb.backup('full.json')
+    orders.insert('orders', {'item': 'pad', 'status': 'new'})
+    orders.delete('orders', {'item': 'pen'})
+
+    zendb.restore('full.json')
+    assert items(orders) == ['ink', 'pen']
+    # Indexes come back with the tables
+    assert [row['item'] for row in orders.select('orders', {'status': 'new'}, order_by='item')] == ['ink', 'pen']
+
+
+def test_async_backup_captures_the_state_when_started(orders):
+    job = zendb.backupAsync('async.json')
+    orders.insert('orders', {'item': 'pad', 'status': 'new'})
+    assert job.wait()
+    zendb.restore('async.json')
+    assert items(orders) == ['ink', 'pen']
+
+
+def test_incremental_chain_replays_every_change(orders):
+    zendb.backup('full.json', True)
+    orders.insert('orders', {'item': 'pad', 'status': 'new'})
+    zendb.backupIncremental('inc1.json')
+    orders.update('orders', {'item': 'ink'}, {'status': 'shipped'})
+    orders.delete('orders', {'item': 'pen'})
+    zendb.backupIncremental('inc2.json')
+
+    zendb.restore('full.json', ['inc1.json', 'inc2.json'])
+    assert items(orders) == ['ink', 'pad']
+    assert orders.select('orders', {'item': 'ink'})[0]['status'] == 'shipped'
+
+
+def test_point_in_time_restore_stops_at_until(orders):
+    zendb.backup('full.json', True)
+    pause()
+    orders.insert('orders', {'item': 'pad', 'status': 'new'})
+    pause()
+    before_delete = time.time()
+    pause()
+    orders.delete('orders', {'item': 'pen'})
+    zendb.backupIncremental('inc.json')
+
+    zendb.restore('full.json', ['inc.json'], before_delete)
+    assert items(orders) == ['ink', 'pad', 'pen']
+
+
+def test_restore_before_the_full_backup_is_rejected(orders):
+    start = time.time()
+    pause()
+    zendb.backup('full.json', True)
+    with pytest.raises(ValueError, match='before the full backup'):
+        zendb.restore('full.json', [], start)
+
+
+def test_incremental_needs_an_incremental_full_backup(orders):
+    zendb.backup('full.json')
+    with pytest.raises(ValueError, match='incremental=true'):
+        zendb.backupIncremental('inc.json')
+
+
+def test_increments_must_continue_the_chain(orders):
+    zendb.backup('full.json', True)
+    orders.insert('orders', {'item': 'pad', 'status': 'new'})
+    zendb.backupIncremental('inc1.json')
+    orders.insert('orders', {'item': 'cap', 'status': 'new'})
+    zendb.backupIncremental('inc2.json')
+    with pytest.raises(ValueError, match='does not continue the backup chain'):
+        zendb.restore('full.json', ['inc2.json'])
+    with pytest.raises(ValueError, match='incremental backup'):
+        zendb.restore('inc1.json')
@@ -0,0 +1,66 @@
+"""Lazy cursors and resume tokens in zendb"""
+import pytest
+
+from src.runtime import zendb
+
+
+@pytest.fixture
+def items(db):
+    db.create_table('items')
+    db.insert_many('items', [{'n': n, 'even': n % 2 == 0} for n in range(10)])
+    return db
+
+
+def numbers(rows):
+    return [row['n'] for row in rows]
+
+
+def test_token_resumes_after_the_rows_consumed(items):
+    cursor = zendb.cursor('items', None, None, 'n')
+    assert numbers(cursor.take(4)) == [0, 1, 2, 3]
+    resumed = zendb.resume(cursor.token())
+    assert numbers(resumed.toArray()) == [4, 5, 6, 7, 8, 9]
+    assert resumed.token() is None
+
+
+def test_token_keeps_where_order_and_fields(items):
+    cursor = zendb.cursor('items', {'even': True}, None, 'n', 'desc', 0, ['n'])
+    assert cursor.take(2) == [{'n': 8}, {'n': 6}]
+    assert zendb.resume(cursor.token()).toArray() == [{'n': 4}, {'n': 2}, {'n': 0}]
+
+
+def test_token_after_a_full_page_starts_the_next_page(items):
+    cursor = zendb.cursor('items', None, 3, 'n')
+    assert numbers(cursor.toArray()) == [0, 1, 2]
+    page = zendb.resume(cursor.token())
+    assert numbers(page.toArray()) == [3, 4, 5]
+    assert numbers(zendb.resume(page.token()).toArray()) == [6, 7, 8]
+
+
+def test_token_part_way_through_a_page_reads_the_rest_of_it(items):
+    cursor = zendb.cursor('items', None, 4, 'n')
+    cursor.take(1)
+    rest = zendb.resume(cursor.token())
+    assert numbers(rest.toArray()) == [1, 2, 3]
+    # Pages keep their original size after a partial one
+    assert numbers(zendb.resume(rest.token()).toArray()) == [4, 5, 6, 7]
+
+
+def test_has_next_does_not_consume_a_row(items):
+    cursor = zendb.cursor('items', {'n': {'lt': 2}}, None, 'n')
+    assert cursor.hasNext() and cursor.hasNext()
+    assert cursor.next()['n'] == 0
+    assert numbers(zendb.resume(cursor.token()).toArray()) == [1]
+    assert cursor.next()['n'] == 1
+    assert cursor.next() is None and cursor.token() is None
+
+
+def test_query_builder_cursor_resumes(items):
+    cursor = zendb.query('items').where('n', '>=', 5).orderBy('n').cursor()
+    cursor.take(2)
+    assert numbers(zendb.resume(cursor.token()).toArray()) == [7, 8, 9]
+
+
+def test_invalid_token_is_rejected(items):
+    with pytest.raises(ValueError, match='Invalid resume token'):
+        zendb.resume('not a token')
@@ -0,0 +1,110 @@
+"""Transactions, conflict detection and snapshot reads in zendb"""
+import pytest
+
+from src.runtime import zendb
+
+
+@pytest.fixture
+def accounts(db):
+    db.create_table('accounts')
+    db.insert_many('accounts', [{'name': 'alice', 'balance': 100}, {'name': 'bob', 'balance': 50}])
+    return db
+
+
+def balances(conn):
+    return {row['name']: row['balance'] for row in conn.select('accounts')}
+
+
+def test_commit_applies_writes_other_connections_could_not_see(accounts):
+    writer, reader = zendb.connection('test'), zendb.connection('test')
+    writer.begin()
+    writer.update('accounts', {'name': 'alice'}, {'balance': 70})
+    writer.insert('accounts', {'name': 'carol', 'balance': 30})
+
+    assert balances(writer) == {'alice': 70, 'bob': 50, 'carol': 30}
+    assert balances(reader) == {'alice': 100, 'bob': 50}
+
+    assert writer.commit()
+    assert balances(reader) == {'alice': 70, 'bob': 50, 'carol': 30}
+    assert not writer.inTransaction()
+
+
+def test_rollback_discards_writes(accounts):
+    conn = zendb.connection('test')
+    conn.begin()
+    conn.delete('accounts', {'name': 'bob'})
+    assert conn.count('accounts') == 1
+    conn.rollback()
+    assert conn.count('accounts') == 2
+
+
+def test_transaction_reads_its_snapshot(accounts):
+    conn, other = zendb.connection('test'), zendb.connection('test')
+    conn.begin()
+    other.update('accounts', {'name': 'bob'}, {'balance': 0})
+    other.insert('accounts', {'name': 'dave', 'balance': 5})
+    assert balances(conn) == {'alice': 100, 'bob': 50}
+    assert conn.count('accounts') == 2
+    conn.rollback()
+    assert balances(conn) == {'alice': 100, 'bob': 0, 'dave': 5}
+
+
+def test_second_writer_to_a_table_conflicts(accounts):
+    first, second = zendb.connection('test'), zendb.connection('test')
+    first.begin()
+    second.begin()
+    first.update('accounts', {'name': 'alice'}, {'balance': 90})
+    second.update('accounts', {'name': 'alice'}, {'balance': 10})
+
+    assert first.commit()
+    with pytest.raises(ValueError, match='Transaction conflict'):
+        second.commit()
+    assert balances(first) == {'alice': 90, 'bob': 50}
+    assert not second.inTransaction()
+
+
+def test_writes_outside_a_transaction_conflict_with_it(accounts):
+    conn = zendb.connection('test')
+    conn.begin()
+    conn.insert('accounts', {'name': 'erin', 'balance': 1})
+    accounts.update('accounts', {'name': 'bob'}, {'balance': 51})
+    with pytest.raises(ValueError, match='Transaction conflict'):
+        conn.commit()
+
+
+def test_read_only_tables_do_not_conflict(accounts):
+    accounts.create_table('log')
+    conn = zendb.connection('test')
+    conn.begin()
+    conn.select('accounts')
+    conn.insert('log', {'event': 'checked'})
+    accounts.update('accounts', {'name': 'bob'}, {'balance': 52})
+    assert conn.commit()
+    assert accounts.count('log') == 1
+
+
+def test_nested_begin_is_rejected(accounts):
+    conn = zendb.connection('test')
+    conn.begin()
+    with pytest.raises(ValueError):
+        conn.begin()
+
+
+def test_open_scan_keeps_the_rows_it_started_with(accounts):
+    rows = accounts.scan('accounts')
+    assert next(rows)['name'] == 'alice'
+    accounts.update('accounts', {'name': 'bob'}, {'balance': 0})
+    assert next(rows)['balance'] == 50
+    assert balances(accounts) == {'alice': 100, 'bob': 0}
+
+
+def test_updates_without_readers_reuse_the_rows_list(accounts):
+    data = accounts.tables['accounts']['data']
+    accounts.update('accounts', {'name': 'bob'}, {'balance': 1})
+    assert accounts.tables['accounts']['data'] is data
+
+    rows = accounts.scan('accounts')
+    next(rows)
+    accounts.update('accounts', {'name': 'bob'}, {'balance': 2})
+    assert accounts.tables['accounts']['data'] is not data
+    assert balances(accounts) == {'alice': 100, 'bob': 2}